@@ -0,0 +1,201 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from polls_and_questions import models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INGESTION_CONFIG = {
+    'ENABLED': False,
+    'MAX_QUEUE_SIZE': 10000,  # answers waiting to be written
+    'BATCH_SIZE': 500,  # answers written per transaction
+    'FLUSH_INTERVAL': 0.5,  # seconds an answer can wait for its batch to fill
+    'PUT_TIMEOUT': 0.05,  # seconds a request waits for room in a full queue
+}
+
+PendingAnswer = namedtuple('PendingAnswer', ('poll_id', 'creator_id', 'choice_ids'))
+
+
+class IngestionBufferFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('too many answers, try again later')
+    default_code = 'ingestion_buffer_full'
+
+
+def write_answers(answers: list) -> list:
+    """
+    Write answers to polls and their selected choices in one transaction.
+
+    Args:
+        answers: list of PendingAnswer.
+
+    Returns: The answers created.
+
+    """
+    panswers = [models.PAnswer(poll_id=answer.poll_id, creator_id=answer.creator_id) for answer in answers]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            models.PAnswer.objects.bulk_create(panswers)
+        else:
+            # primary keys are needed to link the selected choices
+            for panswer in panswers:
+                panswer.save()
+        models.PAnswer.select_choices({panswer.pk: answer.choice_ids for panswer, answer in zip(panswers, answers)})
+    return panswers
+
+
+class AnswerIngestionBuffer:
+    """
+    Write-behind buffer for answers to polls.
+
+    Answers are accepted into a bounded in-process queue and written by a background thread in batches, when
+    `batch_size` answers are waiting or the oldest one waited `flush_interval` seconds. When the queue is full new
+    answers are rejected (IngestionBufferFull) after waiting `put_timeout` seconds. Pending answers are written
+    before the process exits.
+
+    Attributes:
+        accepted (int): Count of answers accepted.
+        rejected (int): Count of answers rejected because the queue was full.
+        written (int): Count of answers written.
+        failed (int): Count of answers lost because they could not be written.
+
+    """
+
+    def __init__(self, config: dict = None):
+        config = {**DEFAULT_INGESTION_CONFIG, **(config or {})}
+        self.enabled = config['ENABLED']
+        self.batch_size = config['BATCH_SIZE']
+        self.flush_interval = config['FLUSH_INTERVAL']
+        self.put_timeout = config['PUT_TIMEOUT']
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=config['MAX_QUEUE_SIZE'])
+        self._stopping = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """ Start the writer thread of current process. """
+        pid = os.getpid()
+        if self._thread is None or self._thread_pid != pid:
+            with self._lock:
+                if self._thread is None or self._thread_pid != pid:
+                    self._stopping.clear()
+                    self._thread = threading.Thread(target=self._run, name='answer-ingestion', daemon=True)
+                    self._thread_pid = pid
+                    self._thread.start()
+
+    def submit(self, poll_id: int, creator_id: int, choice_ids: list):
+        """
+        Accept an answer to be written later.
+
+        Args:
+            poll_id: identifier of the poll answered.
+            creator_id: identifier of the interaction user answering.
+            choice_ids: identifiers of the selected choices, already validated.
+
+        Raises:
+            IngestionBufferFull: When there is no room for the answer.
+
+        """
+        self._ensure_started()
+        try:
+            self._queue.put(PendingAnswer(poll_id, creator_id, choice_ids), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise IngestionBufferFull()
+        with self._lock:
+            self.accepted += 1
+
+    def _next_batch(self) -> list:
+        """ Wait for the next batch of answers. """
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or self._stopping.is_set():
+                timeout = 0
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list):
+        try:
+            try:
+                write_answers(batch)
+                written = len(batch)
+            except Exception:
+                # e.g. the poll of an answer was deleted meanwhile: write the answers one by one, so only the
+                # ones that can not be written are lost
+                logger.warning('batch of %s answers to polls could not be written, writing them one by one',
+                               len(batch), exc_info=True)
+                written = sum(self._write_one(answer) for answer in batch)
+            with self._lock:
+                self.written += written
+                self.failed += len(batch) - written
+        finally:
+            close_old_connections()
+
+    def _write_one(self, answer: PendingAnswer) -> bool:
+        """ Write an answer, returning if it was written. """
+        try:
+            write_answers([answer])
+            return True
+        except Exception:
+            logger.exception('answer to poll %s could not be written', answer.poll_id)
+            return False
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def stop(self, timeout: float = None):
+        """
+        Write the pending answers and stop the writer thread.
+
+        Args:
+            timeout: seconds to wait for pending answers to be written.
+
+        """
+        thread = self._thread
+        if thread is None or self._thread_pid != os.getpid():
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        """ Retrieve buffer counters. """
+        return {
+            'pending': self._queue.qsize(),
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'written': self.written,
+            'failed': self.failed,
+        }
+
+
+answer_buffer = AnswerIngestionBuffer(getattr(settings, 'POLL_ANSWER_INGESTION', None))
+atexit.register(answer_buffer.stop)
@@ -0,0 +1,70 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls.ingestion import AnswerIngestionBuffer
+from polls.serializers import PAnswerCreateSerializer
+from polls_and_questions import models
+from users.services import sync_interaction_user
+
+
+class Command(BaseCommand):
+    """
+    Compare answers per second of the per-request path and the write-behind ingestion buffer.
+
+    Answers are written to a poll created for the benchmark in a random watchit, which is removed at the end.
+    """
+    help = 'Benchmark answers to polls written per second with and without the ingestion buffer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--answers', type=int, default=2000, help='Answers written by each path')
+        parser.add_argument('--choices', type=int, default=4, help='Choices of the poll')
+        parser.add_argument('--batch-size', type=int, default=500, help='Batch size of the ingestion buffer')
+
+    def handle(self, *args, **options):
+        creator = sync_interaction_user(username='benchmark-answer-ingestion',
+                                        email='benchmark@watchity.invalid',
+                                        screen_name='benchmark',
+                                        user_type='SYSTEM',
+                                        )
+        with transaction.atomic():
+            configuration = models.PollConfig.intern(answers_privacy='EVERYONE', multiple_answers=True)
+            poll = models.Poll.objects.create(watchit_uuid=uuid.uuid4(),
+                                              creator=creator,
+                                              question='benchmark',
+                                              streaming=True,
+                                              configuration=configuration,
+                                              )
+            choice_ids = [choice.id for choice in models.Choice.objects.bulk_create(
+                [models.Choice(poll=poll, choice=str(index)) for index in range(options['choices'])])]
+        try:
+            count = options['answers']
+            selections = [choice_ids[:index % len(choice_ids) + 1] for index in range(count)]
+
+            serializer = PAnswerCreateSerializer()
+            started = time.perf_counter()
+            for selected_choice in selections:
+                serializer.create(poll=poll, creator=creator, validated_data={'selected_choice': selected_choice})
+            self.report('per request', count, time.perf_counter() - started)
+
+            buffer = AnswerIngestionBuffer({'ENABLED': True,
+                                            'MAX_QUEUE_SIZE': count,
+                                            'BATCH_SIZE': options['batch_size'],
+                                            })
+            started = time.perf_counter()
+            for selected_choice in selections:
+                buffer.submit(poll_id=poll.id,
+                              creator_id=creator.id,
+                              choice_ids=serializer.validate_choices(poll=poll, choice_ids=selected_choice),
+                              )
+            accepted = time.perf_counter() - started
+            buffer.stop()
+            self.report('ingestion buffer (accepted)', count, accepted)
+            self.report('ingestion buffer (written)', buffer.written, time.perf_counter() - started)
+        finally:
+            poll.delete()
+
+    def report(self, path: str, count: int, seconds: float):
+        self.stdout.write('%-30s %8d answers %8.3f s %10.1f answers/s' % (path, count, seconds, count / seconds))
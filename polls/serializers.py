@@ -1,13 +1,18 @@
+from django.db import transaction
 from rest_framework import serializers
 from django.utils.translation import gettext_lazy as _
 
 from rest_framework.exceptions import ValidationError
 
 from polls_and_questions import models
+from polls_and_questions.cache import event_config_cache
 from polls_and_questions.serializers import PollConfigModelSerializer
 
 from users.serializers import InteractionUserSerializer
 
+# choices a poll can have
+MAX_POLL_CHOICES = 20
+
 class PollDetailModelSerializer(serializers.ModelSerializer):
 
     creator = InteractionUserSerializer()
@@ -48,6 +53,42 @@ class ChoiceModelSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'poll']
 
 
+def check_choices_count(poll, added: int):
+    """
+    Check that a poll does not exceed MAX_POLL_CHOICES with new choices.
+
+    Args:
+        poll: poll of the choices.
+        added: count of choices added.
+
+    Raises:
+        ValidationError: When the poll would have more than MAX_POLL_CHOICES choices.
+
+    """
+    if poll.choices.count() + added > MAX_POLL_CHOICES:
+        raise ValidationError({'choices': _('a poll can not have more than %s choices') % MAX_POLL_CHOICES})
+
+
+def create_choices(poll, choices_data: list) -> list:
+    """
+    Create choices of a poll with one query.
+
+    Bulk inserts do not send signals, so the change of the poll is recorded here.
+
+    Args:
+        poll: poll of the choices.
+        choices_data: list of dicts with the label of each choice.
+
+    Returns: The choices created.
+
+    """
+    choices = models.Choice.objects.bulk_create([models.Choice(poll=poll, choice=choice_data.get('choice'))
+                                                 for choice_data in choices_data])
+    if choices:
+        models.Change.record(poll.watchit_uuid, 'poll', [poll.pk], 'updated')
+    return choices
+
+
 class PollCreateModelSerializer(serializers.ModelSerializer):
     """
     Serializer for create polls
@@ -62,22 +103,26 @@ class PollCreateModelSerializer(serializers.ModelSerializer):
                   'choices',
                   )
 
+    def validate_choices(self, value: list) -> list:
+        if len(value) > MAX_POLL_CHOICES:
+            raise ValidationError(_('a poll can not have more than %s choices') % MAX_POLL_CHOICES)
+        return value
+
+    @transaction.atomic
     def create(self, watchit_uuid, creator, validated_data):
         configuration_data = validated_data.pop('configuration', None)
         configuration = None
         if configuration_data:
-            configuration = self.fields['configuration'].create(validated_data=configuration_data)
+            configuration = models.PollConfig.intern(**configuration_data)
         else:
             try:
-                event_config = models.EventConfig.objects.get(watchit_uuid=watchit_uuid)
+                event_config = event_config_cache.get(watchit_uuid)
+                if event_config is None:
+                    raise models.EventConfig.DoesNotExist()
                 default_poll_configuration = event_config.default_polls_config
                 if default_poll_configuration:
-                    configuration = models.PollConfig.objects.create(
-                        answers_privacy=default_poll_configuration.answers_privacy,
-                        multiple_answers=default_poll_configuration.multiple_answers,
-                        allow_no_limited_answering=default_poll_configuration.allow_no_limited_answering,
-                        answering_time_limit=default_poll_configuration.answering_time_limit,
-                    )
+                    # configurations are immutable, so the default is shared as is
+                    configuration = default_poll_configuration
                 else:
                     raise ValidationError(
                         'define a default poll configuration for this event or a custom poll configuration for '
@@ -93,11 +138,7 @@ class PollCreateModelSerializer(serializers.ModelSerializer):
             published=validated_data.get('published', False),
             configuration=configuration
         )
-        for choice in validated_data.get('choices', None):
-            models.Choice.objects.create(
-                poll=poll,
-                choice=choice.get('choice'),
-            )
+        create_choices(poll=poll, choices_data=validated_data.get('choices', None) or [])
         return poll
 
 
@@ -132,8 +173,8 @@ class PollUpdateModelSerializer(serializers.ModelSerializer):
         # updating configuration
         configuration_data = validated_data.pop('configuration', None)
         if configuration_data:
-            poll_config = instance.configuration
-            self.fields['configuration'].update(instance=poll_config, validated_data=configuration_data)
+            # configurations are shared: the poll is pointed to the configuration with the new content
+            instance.configuration = instance.configuration.fork(**configuration_data)
 
         super().update(instance, validated_data)
 
@@ -157,6 +198,21 @@ class PollUpdateModelSerializer(serializers.ModelSerializer):
 
 
 
+class ChoiceResultSerializer(serializers.Serializer):
+    """Serializer for results of a choice"""
+    id = serializers.IntegerField()
+    choice = serializers.CharField()
+    answers_count = serializers.IntegerField()
+
+
+class PollResultsSerializer(serializers.Serializer):
+    """Serializer for results of a poll"""
+    id = serializers.IntegerField()
+    question = serializers.CharField()
+    selections_count = serializers.IntegerField(help_text='Sum of answers count of all choices')
+    choices = ChoiceResultSerializer(many=True)
+
+
 class PAnswerModelSerializer(serializers.ModelSerializer):
     selected_choice = serializers.StringRelatedField(many=True, read_only=True)
     creator = InteractionUserSerializer(read_only=True)
@@ -173,22 +229,42 @@ class PAnswerModelSerializer(serializers.ModelSerializer):
 
 class PAnswerCreateSerializer(serializers.ModelSerializer):
     """Serializer for create answers to polls"""
+    selected_choice = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
     class Meta:
         model = models.PAnswer
         fields = ('selected_choice',)
 
-    def create(self, poll, creator, validated_data):
-        selected_choice = []
-        for choice_id in validated_data.get('selected_choice'):
-            selected_choice.append(models.Choice.objects.get(id=choice_id))
-        panswer = models.PAnswer.objects.create(
-            poll=poll,
-            creator=creator,
-        )
-
-        return panswer
+    @staticmethod
+    def validate_choices(poll, choice_ids: list) -> list:
+        """
+        Validate the selected choices of an answer to a poll with one query.
 
+        Args:
+            poll: poll answered, with its configuration.
+            choice_ids: identifiers of the selected choices.
 
+        Raises:
+            ValidationError: When choices are not choices of the poll or multiple answers are not allowed.
 
+        Returns: The identifiers of the selected choices without duplicates.
 
+        """
+        choice_ids = list(dict.fromkeys(choice_ids))
+        if len(choice_ids) > 1 and not poll.configuration.multiple_answers:
+            raise ValidationError({'selected_choice': _('multiple answers are not allowed in this poll')})
+        poll_choice_ids = set(models.Choice.objects.filter(poll=poll, id__in=choice_ids).values_list('id', flat=True))
+        wrong_choice_ids = [choice_id for choice_id in choice_ids if choice_id not in poll_choice_ids]
+        if wrong_choice_ids:
+            raise ValidationError({'selected_choice': _('%s are not choices of this poll') % wrong_choice_ids})
+        return choice_ids
 
+    def create(self, poll, creator, validated_data):
+        choice_ids = self.validate_choices(poll=poll, choice_ids=validated_data.get('selected_choice'))
+        with transaction.atomic():
+            panswer = models.PAnswer.objects.create(
+                poll=poll,
+                creator=creator,
+            )
+            models.PAnswer.select_choices({panswer.id: choice_ids})
+        return panswer
@@ -1,3 +1,378 @@
-from django.test import TestCase
+import time
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from polls.ingestion import AnswerIngestionBuffer, PendingAnswer, write_answers
+from polls.serializers import MAX_POLL_CHOICES, PAnswerCreateSerializer
+from polls_and_questions import models
+from polls_and_questions.tests import QueryCountMixin
+from users.services import sync_interaction_user
+
+
+def create_poll(creator, choices: int = 3, watchit_uuid=None) -> models.Poll:
+    poll = models.Poll.objects.create(watchit_uuid=watchit_uuid or uuid.uuid4(),
+                                      creator=creator,
+                                      question='poll',
+                                      published=True,
+                                      streaming=True,
+                                      configuration=models.PollConfig.intern(answers_privacy='EVERYONE'),
+                                      )
+    models.Choice.objects.bulk_create([models.Choice(poll=poll, choice=str(index)) for index in range(choices)])
+    return poll
+
+
+def create_user(name: str = 'participant'):
+    return sync_interaction_user(username=name,
+                                 email='%s@watchity.invalid' % name,
+                                 screen_name=name,
+                                 user_type='PARTICIPANT',
+                                 )
+
+
+class WriteAnswersTests(TestCase):
+
+    def setUp(self):
+        self.creator = create_user()
+        self.poll = create_poll(self.creator)
+        self.choice_ids = list(self.poll.choices.order_by('id').values_list('id', flat=True))
+        self.answers = [PendingAnswer(self.poll.id, self.creator.id, [self.choice_ids[index % 2]])
+                        for index in range(5)]
+
+    def assert_written_once(self):
+        self.assertEqual(models.PAnswer.objects.filter(poll=self.poll).count(), 5)
+        self.assertEqual(models.PAnswer.selected_choice.through.objects.filter(panswer__poll=self.poll).count(), 5)
+        tallies = dict(models.ChoiceTally.objects.filter(choice_id__in=self.choice_ids)
+                       .values_list('choice_id', 'answers_count'))
+        self.assertEqual(tallies.get(self.choice_ids[0]), 3)
+        self.assertEqual(tallies.get(self.choice_ids[1]), 2)
+
+    def test_bulk_insert(self):
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=True):
+            panswers = write_answers(self.answers)
+        self.assertTrue(all(panswer.pk for panswer in panswers))
+        self.assert_written_once()
+
+    def test_insert_one_by_one_without_returned_ids(self):
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False):
+            panswers = write_answers(self.answers)
+        self.assertTrue(all(panswer.pk for panswer in panswers))
+        self.assert_written_once()
+
+
+class AnswerIngestionBufferTests(TransactionTestCase):
+    """ The writer thread uses its own connection, so rows are committed instead of rolled back """
+
+    def setUp(self):
+        self.creator = create_user()
+        self.poll = create_poll(self.creator)
+        self.choice_id = self.poll.choices.values_list('id', flat=True).first()
+
+    def test_batch_is_flushed_when_full(self):
+        buffer = AnswerIngestionBuffer({'ENABLED': True, 'BATCH_SIZE': 3, 'FLUSH_INTERVAL': 5})
+        for _ in range(5):
+            buffer._queue.put(PendingAnswer(self.poll.id, self.creator.id, [self.choice_id]))
+
+        started = time.monotonic()
+        batch = buffer._next_batch()
+        self.assertEqual(len(batch), 3)
+        # a full batch does not wait for the flush interval
+        self.assertLess(time.monotonic() - started, 1)
+
+        buffer._flush(batch)
+        self.assertEqual(buffer.stats()['written'], 3)
+        self.assertEqual(buffer.stats()['pending'], 2)
+        self.assertEqual(models.PAnswer.objects.filter(poll=self.poll).count(), 3)
+
+    def test_batch_is_flushed_after_interval(self):
+        buffer = AnswerIngestionBuffer({'ENABLED': True, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': 0.1})
+        buffer._queue.put(PendingAnswer(self.poll.id, self.creator.id, [self.choice_id]))
+
+        self.assertEqual(len(buffer._next_batch()), 1)
+
+    def test_failed_batch_keeps_valid_answers(self):
+        buffer = AnswerIngestionBuffer({'ENABLED': True})
+        deleted_poll = create_poll(self.creator)
+        deleted_choice_id = deleted_poll.choices.values_list('id', flat=True).first()
+        batch = [PendingAnswer(self.poll.id, self.creator.id, [self.choice_id]) for _ in range(5)]
+        # the poll is deleted after its answer was accepted
+        batch.insert(2, PendingAnswer(deleted_poll.id, self.creator.id, [deleted_choice_id]))
+        deleted_poll.delete()
+
+        with self.assertLogs('polls.ingestion'):
+            buffer._flush(batch)
+
+        self.assertEqual(buffer.stats()['written'], 5)
+        self.assertEqual(buffer.stats()['failed'], 1)
+        self.assertEqual(models.PAnswer.objects.filter(poll=self.poll).count(), 5)
+        self.assertEqual(models.ChoiceTally.objects.get(choice_id=self.choice_id).answers_count, 5)
+
+    def test_stop_drains_pending_answers(self):
+        buffer = AnswerIngestionBuffer({'ENABLED': True, 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': 0.1})
+        for _ in range(5):
+            buffer.submit(poll_id=self.poll.id, creator_id=self.creator.id, choice_ids=[self.choice_id])
+
+        buffer.stop(timeout=10)
+
+        self.assertEqual(buffer.stats(), {'pending': 0, 'accepted': 5, 'rejected': 0, 'written': 5, 'failed': 0})
+        self.assertEqual(models.PAnswer.objects.filter(poll=self.poll).count(), 5)
+        self.assertEqual(models.ChoiceTally.objects.get(choice_id=self.choice_id).answers_count, 5)
+
+
+class PollDefaultConfigurationTests(TestCase):
+
+    def test_poll_shares_default_configuration(self):
+        watchit_uuid = uuid.uuid4()
+        default = models.PollConfig.intern(answers_privacy='EVERYONE', enabled=False, multiple_answers=False)
+        models.EventConfig.objects.create(watchit_uuid=watchit_uuid, default_polls_config=default)
+        client = APIClient()
+        client.force_authenticate(user=create_user('speaker').user)
+
+        response = client.post('/api/watchit/%s/playersettings/%s/poll/' % (watchit_uuid, uuid.uuid4()),
+                               {'question': 'poll',
+                                'configuration': None,
+                                'choices': [{'choice': 'yes'}, {'choice': 'no'}],
+                                },
+                               format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(models.Poll.objects.get(pk=response.data['id']).configuration_id, default.pk)
+
+
+class PollAnswerChoicesValidationTests(TestCase):
+
+    def setUp(self):
+        self.creator = create_user()
+        self.poll = create_poll(self.creator)
+        self.choice_ids = list(self.poll.choices.order_by('id').values_list('id', flat=True))
+        self.other_choice_id = create_poll(self.creator).choices.values_list('id', flat=True).first()
+        self.single_answer_poll = create_poll(self.creator)
+        self.single_answer_poll.configuration = models.PollConfig.intern(answers_privacy='EVERYONE',
+                                                                         multiple_answers=False)
+        self.single_answer_poll.save()
+
+    def test_choices_of_the_poll(self):
+        choice_ids = PAnswerCreateSerializer.validate_choices(self.poll, self.choice_ids[:2] + self.choice_ids[:1])
+
+        self.assertEqual(choice_ids, self.choice_ids[:2])
+        panswer = models.PAnswer.objects.create(poll=self.poll, creator=self.creator)
+        models.PAnswer.select_choices({panswer.pk: choice_ids})
+        self.assertEqual(sorted(panswer.selected_choice.values_list('id', flat=True)), self.choice_ids[:2])
+
+    def test_choices_of_another_poll(self):
+        with self.assertRaises(ValidationError):
+            PAnswerCreateSerializer.validate_choices(self.poll, [self.choice_ids[0], self.other_choice_id])
+        panswer = models.PAnswer.objects.create(poll=self.poll, creator=self.creator)
+        with self.assertRaises(DjangoValidationError):
+            models.PAnswer.select_choices({panswer.pk: [self.choice_ids[0], self.other_choice_id]})
+        self.assertFalse(panswer.selected_choice.exists())
+        self.assertFalse(models.ChoiceTally.objects.exists())
+
+    def test_multiple_choices_not_allowed(self):
+        choice_ids = list(self.single_answer_poll.choices.values_list('id', flat=True)[:2])
+
+        with self.assertRaises(ValidationError):
+            PAnswerCreateSerializer.validate_choices(self.single_answer_poll, choice_ids)
+        panswer = models.PAnswer.objects.create(poll=self.single_answer_poll, creator=self.creator)
+        with self.assertRaises(DjangoValidationError):
+            models.PAnswer.select_choices({panswer.pk: choice_ids})
+        models.PAnswer.select_choices({panswer.pk: choice_ids[:1]})
+        self.assertEqual(list(panswer.selected_choice.values_list('id', flat=True)), choice_ids[:1])
+
+    def test_answer_endpoint_rejects_choices_of_another_poll(self):
+        client = APIClient()
+        client.force_authenticate(user=self.creator.user)
+
+        response = client.post('/api/watchit/%s/playersettings/%s/poll/%s/answer/' % (self.poll.watchit_uuid,
+                                                                                      uuid.uuid4(),
+                                                                                      self.poll.pk,
+                                                                                      ),
+                               {'selected_choice': [self.other_choice_id]},
+                               format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.PAnswer.objects.filter(poll=self.poll).exists())
+
+
+class ChoiceCreationTests(TestCase):
+
+    def setUp(self):
+        self.creator = create_user('speaker')
+        self.poll = create_poll(self.creator, choices=MAX_POLL_CHOICES - 3)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.creator.user)
+        self.url = '/api/watchit/%s/playersettings/%s/poll/%s/choice/' % (self.poll.watchit_uuid,
+                                                                         uuid.uuid4(),
+                                                                         self.poll.pk,
+                                                                         )
+
+    def bulk(self, labels: list):
+        self.last_change_id = models.Change.objects.order_by('id').values_list('id', flat=True).last()
+        return self.client.post(self.url + 'bulk/', [{'choice': label} for label in labels], format='json')
+
+    def test_bulk(self):
+        response = self.bulk(['yes', 'no', 'maybe'])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([choice['choice'] for choice in response.data], ['yes', 'no', 'maybe'])
+        self.assertEqual(list(self.poll.choices.order_by('-id').values_list('choice', flat=True)[:3]),
+                         ['maybe', 'no', 'yes'])
+        self.assertEqual(list(models.Change.objects.filter(id__gt=self.last_change_id)
+                              .values_list('entity', 'object_id', 'action')),
+                         [('poll', self.poll.pk, 'updated')])
+
+    def test_bulk_over_the_choices_limit(self):
+        response = self.bulk(['yes', 'no', 'maybe', 'never'])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.poll.choices.count(), MAX_POLL_CHOICES - 3)
+        self.assertFalse(models.Change.objects.filter(id__gt=self.last_change_id).exists())
+
+    def test_bulk_is_atomic(self):
+        self.client.raise_request_exception = False
+        with mock.patch.object(models.Change, 'record', side_effect=DatabaseError('change log unavailable')):
+            response = self.bulk(['yes', 'no'])
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.poll.choices.count(), MAX_POLL_CHOICES - 3)
+
+    def test_create_over_the_choices_limit(self):
+        self.bulk(['yes', 'no', 'maybe'])
+
+        response = self.client.post(self.url, {'choice': 'never'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.poll.choices.count(), MAX_POLL_CHOICES)
+
+    def test_poll_over_the_choices_limit(self):
+        response = self.client.post('/api/watchit/%s/playersettings/%s/poll/' % (self.poll.watchit_uuid, uuid.uuid4()),
+                                    {'question': 'poll',
+                                     'configuration': {'answers_privacy': 'EVERYONE'},
+                                     'choices': [{'choice': str(index)} for index in range(MAX_POLL_CHOICES + 1)],
+                                     },
+                                    format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('choices', response.data)
+
+
+class PollAnswerDeletionTests(TestCase):
+
+    def setUp(self):
+        self.creator = create_user('speaker')
+        self.poll = create_poll(self.creator)
+        self.choice_ids = list(self.poll.choices.order_by('id').values_list('id', flat=True))
+
+    def answer(self, creator, choice_ids: list) -> models.PAnswer:
+        panswer = models.PAnswer.objects.create(poll=self.poll, creator=creator)
+        models.PAnswer.select_choices({panswer.pk: choice_ids})
+        return panswer
+
+    def tallies(self) -> list:
+        tallies = dict(models.ChoiceTally.objects.values_list('choice_id', 'answers_count'))
+        return [tallies.get(choice_id, 0) for choice_id in self.choice_ids]
+
+    def test_delete_answer_removes_it_from_tallies(self):
+        panswer = self.answer(self.creator, self.choice_ids[:2])
+        self.answer(self.creator, self.choice_ids[:1])
+        client = APIClient()
+        client.force_authenticate(user=self.creator.user)
+
+        response = client.delete('/api/watchit/%s/playersettings/%s/poll/%s/answer/%s/' % (self.poll.watchit_uuid,
+                                                                                            uuid.uuid4(),
+                                                                                            self.poll.pk,
+                                                                                            panswer.pk,
+                                                                                            ))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.tallies(), [1, 0, 0])
+
+    def test_delete_user_removes_answers_from_tallies(self):
+        participant = create_user('participant')
+        self.answer(participant, self.choice_ids[:2])
+        self.answer(self.creator, self.choice_ids[1:])
+
+        participant.delete()
+
+        self.assertEqual(self.tallies(), [0, 1, 1])
+        self.assertEqual(models.PAnswer.objects.filter(poll=self.poll).count(), 1)
+
+    def test_delete_poll_queries_do_not_grow_with_answers(self):
+        counts = []
+        # Django deletes rows in batches of 100
+        for answers in (1, 100):
+            self.poll = create_poll(self.creator)
+            choice_ids = list(self.poll.choices.values_list('id', flat=True))
+            panswers = models.PAnswer.objects.bulk_create([models.PAnswer(poll=self.poll, creator=self.creator)
+                                                           for _ in range(answers)])
+            models.PAnswer.select_choices({panswer.pk: choice_ids[:2] for panswer in panswers})
+            with CaptureQueriesContext(connection) as queries:
+                self.poll.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ChoiceDeletionTests(TestCase):
+
+    def setUp(self):
+        self.creator = create_user('speaker')
+
+    def test_delete_choice_records_poll_updated(self):
+        poll = create_poll(self.creator)
+        choice = poll.choices.first()
+        last_change_id = models.Change.objects.order_by('id').values_list('id', flat=True).last()
+        client = APIClient()
+        client.force_authenticate(user=self.creator.user)
+
+        response = client.delete('/api/watchit/%s/playersettings/%s/poll/%s/choice/%s/' % (poll.watchit_uuid,
+                                                                                            uuid.uuid4(),
+                                                                                            poll.pk,
+                                                                                            choice.pk,
+                                                                                            ))
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(poll.choices.count(), 2)
+        self.assertEqual(list(models.Change.objects.filter(id__gt=last_change_id)
+                              .values_list('watchit_uuid', 'entity', 'object_id', 'action')),
+                         [(poll.watchit_uuid, 'poll', poll.pk, 'updated')])
+
+    def test_delete_poll_queries_do_not_grow_with_choices(self):
+        counts = []
+        for choices in (1, 50):
+            poll = create_poll(self.creator, choices=choices)
+            with CaptureQueriesContext(connection) as queries:
+                poll.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class PollQueryCountTests(QueryCountMixin, TestCase):
+
+    def setUp(self):
+        self.participant = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.participant.user)
+        self.poll = create_poll(self.participant)
+        self.base = '/api/watchit/%s/playersettings/%s/' % (self.poll.watchit_uuid, uuid.uuid4())
+
+    def add_answer(self, poll):
+        panswer = models.PAnswer.objects.create(poll=poll, creator=self.participant)
+        models.PAnswer.select_choices({panswer.pk: [poll.choices.values_list('id', flat=True).first()]})
+
+    def add_poll(self):
+        self.add_answer(create_poll(self.participant, watchit_uuid=self.poll.watchit_uuid))
+
+    def test_polls(self):
+        self.assert_queries_do_not_grow(self.base + 'poll/', self.add_poll)
+
+    def test_poll_answers(self):
+        self.assert_queries_do_not_grow(self.base + 'poll/%s/answer/' % self.poll.pk,
+                                        lambda: self.add_answer(self.poll))
@@ -1,7 +1,11 @@
 from uuid import UUID
 
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils.translation import gettext_lazy as _
 from drf_yasg.utils import swagger_auto_schema
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework import mixins, generics, viewsets, status
 
@@ -9,10 +13,13 @@ from rest_framework import mixins, generics, viewsets, status
 from rest_framework.permissions import IsAuthenticated
 
 from polls import serializers
+from polls.ingestion import answer_buffer
 from polls_and_questions import models
 from polls_and_questions.models import Choice, Poll
+from polls_and_questions.filters import InteractionStateFilter
+from polls_and_questions.pagination import KeysetPagination
 from users.authentication import ExternTokenAuthentication, ExternViewerSessionAuthentication
-from users.models import InteractionUser
+from users.services import get_request_interaction_user
 
 
 class PollViewSet(mixins.ListModelMixin,
@@ -23,13 +30,16 @@ class PollViewSet(mixins.ListModelMixin,
                   viewsets.GenericViewSet):
     """ Manage Polls """
 
-    queryset = models.Poll.objects.all()
+    queryset = models.Poll.objects.select_related('creator__user', 'configuration').prefetch_related('choices')
     serializer_class = serializers.PollDetailModelSerializer
     authentication_classes = (ExternTokenAuthentication,
                               ExternViewerSessionAuthentication,
                               )
 
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ('creation_date', 'id')
+    filter_backends = (InteractionStateFilter,)
 
 
     def get_queryset(self):
@@ -53,7 +63,7 @@ class PollViewSet(mixins.ListModelMixin,
 
         serializer = serializers.PollCreateModelSerializer(data=request.data)
         if serializer.is_valid():
-            creator = InteractionUser.objects.get(user_id=request.user.id)
+            creator = get_request_interaction_user(request)
             poll = serializer.create(watchit_uuid=self.kwargs.get('watchit_uuid'),
                                          creator=creator,
                                          validated_data=request.data,
@@ -76,6 +86,48 @@ class PollViewSet(mixins.ListModelMixin,
             return Response(data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @swagger_auto_schema(responses={200: serializers.PollResultsSerializer})
+    @action(detail=True, methods=['get'])
+    def results(self, request, *args, **kwargs):
+        """ Retrieve the results of a poll """
+        poll = self.get_object()
+        self._check_results_privacy(request, poll)
+        choices = [{'id': choice['id'],
+                    'choice': choice['choice'],
+                    'answers_count': choice['tally__answers_count'] or 0,
+                    }
+                   for choice in models.Choice.objects.filter(poll=poll)
+                                                      .order_by('id')
+                                                      .values('id', 'choice', 'tally__answers_count')
+                   ]
+        data = serializers.PollResultsSerializer({'id': poll.id,
+                                                  'question': poll.question,
+                                                  'selections_count': sum(choice['answers_count'] for choice in choices),
+                                                  'choices': choices,
+                                                  }).data
+        return Response(data, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _check_results_privacy(request, poll):
+        """
+        Check if the current user logged can see the results of a poll.
+
+        Raises:
+            PermissionDenied: When the answers privacy of the poll does not allow it.
+        """
+        answers_privacy = poll.configuration.answers_privacy
+        if answers_privacy == 'EVERYONE':
+            return
+        interaction_user = get_request_interaction_user(request)
+        is_creator = interaction_user is not None and interaction_user.id == poll.creator_id
+        if is_creator:
+            return
+        # speakers are users with accounts in external API (SYSTEM users)
+        if answers_privacy == 'CREATOR_AND_SPEAKERS' and interaction_user is not None \
+                and interaction_user.type == 'SYSTEM':
+            return
+        raise PermissionDenied(_('results of this poll are not available'))
+
 class ChoiceViewSet(mixins.RetrieveModelMixin,
                       # mixins.CreateModelMixin,
                       # mixins.UpdateModelMixin,
@@ -103,14 +155,33 @@ class ChoiceViewSet(mixins.RetrieveModelMixin,
         """ Create a choice of poll """
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            poll = get_object_or_404(Poll, id=self.kwargs.get('poll_id'))
-            choice = Choice.objects.create(poll=poll,
-                                           choice=request.data.get('choice', ''),
-                                           )
+            with transaction.atomic():
+                # the poll row is locked so concurrent requests can not exceed the choices limit together
+                poll = get_object_or_404(Poll.objects.select_for_update(), id=self.kwargs.get('poll_id'))
+                serializers.check_choices_count(poll=poll, added=1)
+                choice = Choice.objects.create(poll=poll,
+                                               choice=request.data.get('choice', ''),
+                                               )
             data = self.serializer_class(choice).data
             return Response(data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @swagger_auto_schema(request_body=serializers.ChoiceModelSerializer(many=True),
+                         responses={201: serializers.ChoiceModelSerializer(many=True)})
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """ Create several choices of poll """
+        serializer = self.serializer_class(data=request.data, many=True)
+        if serializer.is_valid():
+            # the choices and the Change recorded for the poll are committed together
+            with transaction.atomic():
+                poll = get_object_or_404(Poll.objects.select_for_update(), id=self.kwargs.get('poll_id'))
+                serializers.check_choices_count(poll=poll, added=len(serializer.validated_data))
+                choices = serializers.create_choices(poll=poll, choices_data=serializer.validated_data)
+            data = self.serializer_class(choices, many=True).data
+            return Response(data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     @swagger_auto_schema(request_body=serializers.ChoiceModelSerializer)
     def update(self, request, *args, **kwargs):
         """Update a choice of poll   """
@@ -133,14 +204,16 @@ class PAnswerViewSet(mixins.ListModelMixin,
 
     """ Manage Polls Answers """
 
-    queryset = models.PAnswer.objects.all()
+    queryset = models.PAnswer.objects.select_related('creator__user').prefetch_related('selected_choice')
     serializer_class = serializers.PAnswerModelSerializer
     # authentication_classes = (authentication.ExternTokenAuthentication, )
     # permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ('-creation_date', '-id')
 
 
     def get_queryset(self):
-        return super().get_queryset().filter(poll_id=self.kwargs.get('poll_id')).order_by('-creation_date')
+        return super().get_queryset().filter(poll_id=self.kwargs.get('poll_id')).order_by(*self.ordering)
 
     def list(self, request, *args, **kwargs):
         """ Retrieve a list of answers to poll """
@@ -161,11 +234,18 @@ class PAnswerViewSet(mixins.ListModelMixin,
 
         serializer = serializers.PAnswerCreateSerializer(data=request.data)
         if serializer.is_valid():
-            creator = InteractionUser.objects.get(user_id=request.user.id)
-            poll = get_object_or_404(Poll, id=self.kwargs.get('poll_id'))
+            creator = get_request_interaction_user(request)
+            poll = get_object_or_404(Poll.objects.select_related('configuration'), id=self.kwargs.get('poll_id'))
+            if poll.streaming and answer_buffer.enabled:
+                # live polls: the answer is acknowledged now and written later in a batch
+                choice_ids = serializer.validate_choices(poll=poll,
+                                                         choice_ids=serializer.validated_data.get('selected_choice'),
+                                                         )
+                answer_buffer.submit(poll_id=poll.id, creator_id=creator.id, choice_ids=choice_ids)
+                return Response({'selected_choice': choice_ids}, status=status.HTTP_202_ACCEPTED)
             panswer = serializer.create(poll=poll,
                                          creator=creator,
-                                         validated_data=request.data,
+                                         validated_data=serializer.validated_data,
                                          )
             data = self.serializer_class(panswer).data
             return Response(data, status=status.HTTP_201_CREATED)
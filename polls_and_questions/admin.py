@@ -1,10 +1,26 @@
 from django.contrib import admin
 
 from polls_and_questions.models import PollConfig, Choice, Poll, PAnswer, QuestionConfig, \
-    Question, QAnswer, EventConfig, QVote, QAVote
+    Question, QAnswer, EventConfig, QVote, QAVote, ChoiceTally, Change
 
-admin.site.register(PollConfig)
+
+class SharedConfigAdmin(admin.ModelAdmin):
+    """
+    Read-only admin of configurations: a row is shared by every interaction with the same content, so editing it
+    would change all of them. Interactions are pointed to other configurations instead (see SharedConfig.fork).
+    """
+    list_display = ('id', 'content_hash')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(PollConfig, SharedConfigAdmin)
 admin.site.register(Choice)
+admin.site.register(ChoiceTally)
 
 
 @admin.register(Poll)
@@ -22,9 +38,7 @@ class PResponseAdmin(admin.ModelAdmin):
 
 
 # ---------------------------------------
-@admin.register(QuestionConfig)
-class DefaultQuestionConfigAdmin(admin.ModelAdmin):
-    pass
+admin.site.register(QuestionConfig, SharedConfigAdmin)
 
 
 @admin.register(Question)
@@ -48,4 +62,9 @@ class QAdmin(admin.ModelAdmin):
 
 @admin.register(QAVote)
 class QAAdmin(admin.ModelAdmin):
-    pass
\ No newline at end of file
+    pass
+
+@admin.register(Change)
+class ChangeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'watchit_uuid', 'entity', 'object_id', 'action', 'creation_date')
+    list_filter = ('entity', 'action')
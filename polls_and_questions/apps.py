@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PollsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polls_and_questions'
+
+    def ready(self):
+        from polls_and_questions import signals  # noqa: F401
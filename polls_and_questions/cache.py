@@ -0,0 +1,101 @@
+import copy
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from polls_and_questions.models import EventConfig
+from users.cache import TTLCache
+
+DEFAULT_EVENT_CONFIG_CACHE = {
+    'TTL': 60,  # seconds an event config is kept in the process
+    'MAX_SIZE': 1000,  # events kept in the process
+    'SHARED_CACHE': None,  # alias of a Django cache shared by all processes, e.g. 'default'
+    'SHARED_TTL': 300,  # seconds an event config is kept in the shared cache
+}
+
+SHARED_CACHE_KEY = 'polls_and_questions:event_config:%s'
+
+# cached for events without configuration, so they are not read again on every request
+NO_EVENT_CONFIG = False
+
+
+class EventConfigCache:
+    """
+    Cache of event configurations, with their default poll and question configurations, by watchit.
+
+    Entries are kept in the process (bounded, with TTL) and, when `shared_cache` is set, in a Django cache shared by
+    all processes. Entries are invalidated when an event config or one of its default configurations is saved or
+    deleted (see polls_and_questions.signals); the TTL bounds how long other processes can keep a local entry after
+    a change. Callers get copies, so they can change them freely.
+    """
+
+    def __init__(self, config: dict = None):
+        config = {**DEFAULT_EVENT_CONFIG_CACHE, **(config or {})}
+        self.local = TTLCache(ttl=config['TTL'], max_size=config['MAX_SIZE'])
+        self.shared_cache = config['SHARED_CACHE']
+        self.shared_ttl = config['SHARED_TTL']
+
+    @staticmethod
+    def key(watchit_uuid) -> str:
+        return str(watchit_uuid if isinstance(watchit_uuid, UUID) else UUID(str(watchit_uuid)))
+
+    @property
+    def shared(self):
+        return caches[self.shared_cache] if self.shared_cache else None
+
+    def get(self, watchit_uuid):
+        """
+        Retrieve the configuration of an event.
+
+        Args:
+            watchit_uuid: identifier of the event.
+
+        Returns: A copy of the event config, with its default configurations loaded, or None if it does not exist.
+
+        """
+        key = self.key(watchit_uuid)
+        event_config = self.local.get(key)
+        if event_config is None and self.shared is not None:
+            event_config = self.shared.get(SHARED_CACHE_KEY % key)
+            if event_config is not None:
+                self.local.set(key, event_config)
+        if event_config is None:
+            event_config = EventConfig.objects \
+                .select_related('default_polls_config', 'default_questions_config') \
+                .filter(watchit_uuid=key) \
+                .first() or NO_EVENT_CONFIG
+            self.local.set(key, event_config)
+            if self.shared is not None:
+                self.shared.set(SHARED_CACHE_KEY % key, event_config, self.shared_ttl)
+        if event_config is NO_EVENT_CONFIG:
+            return None
+        return copy.deepcopy(event_config)
+
+    def invalidate(self, *watchit_uuids):
+        """
+        Remove events from the cache, now and again when the current transaction commits, so requests running
+        meanwhile can not cache the state before the change.
+        """
+        keys = [self.key(watchit_uuid) for watchit_uuid in watchit_uuids]
+
+        def remove():
+            for key in keys:
+                self.local.invalidate(key)
+            if self.shared is not None and keys:
+                self.shared.delete_many([SHARED_CACHE_KEY % key for key in keys])
+
+        remove()
+        transaction.on_commit(remove)
+
+    def clear(self):
+        """ Remove all events from the cache of the process. """
+        self.local.clear()
+
+    def stats(self) -> dict:
+        """ Retrieve counters of the cache of the process. """
+        return self.local.stats()
+
+
+event_config_cache = EventConfigCache(getattr(settings, 'EVENT_CONFIG_CACHE', None))
@@ -0,0 +1,48 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+BOOLEAN_VALUES = {'1': True, 'true': True, '0': False, 'false': False}
+
+
+class InteractionStateFilter(BaseFilterBackend):
+    """
+    Filter polls and questions by `published` and `streaming` query params, e.g. `?published=true&streaming=true`
+    for the audience of a live event. Backed by the (watchit_uuid, published, streaming, ...) indexes.
+    """
+    fields = ('published', 'streaming')
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = {}
+        for field in self.fields:
+            value = request.query_params.get(field)
+            if value is None:
+                continue
+            if value.lower() not in BOOLEAN_VALUES:
+                raise ValidationError({field: _('must be true or false')})
+            # `field IN (value)` instead of `field = value`: a boolean exact lookup compiles to a bare `field` (or
+            # `NOT field`) condition that SQLite can not use as an equality on the index
+            lookups['%s__in' % field] = [BOOLEAN_VALUES[value.lower()]]
+        return queryset.filter(**lookups) if lookups else queryset
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [coreapi.Field(name=field,
+                              required=False,
+                              location='query',
+                              schema=coreschema.Boolean(title=field.capitalize(),
+                                                        description='Only %s (true) or not %s (false).' % (field,
+                                                                                                           field)),
+                              )
+                for field in self.fields]
+
+    def get_schema_operation_parameters(self, view):
+        return [{'name': field,
+                 'required': False,
+                 'in': 'query',
+                 'description': 'Only %s (true) or not %s (false).' % (field, field),
+                 'schema': {'type': 'boolean'},
+                 }
+                for field in self.fields]
@@ -0,0 +1,449 @@
+import asyncio
+import json
+import logging
+import re
+from datetime import timedelta
+from types import SimpleNamespace
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework import exceptions
+
+from polls_and_questions import models
+from users.authentication import ExternTokenAuthentication, ExternViewerSessionAuthentication
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIVE_EVENTS_CONFIG = {
+    'POLL_INTERVAL': 1,  # seconds between reads of the changes of an event
+    'HEARTBEAT_INTERVAL': 15,  # seconds without messages before a keep-alive comment is sent
+    'SUBSCRIBER_QUEUE_SIZE': 100,  # messages waiting for a subscriber before it is disconnected
+}
+
+# changes of an event read per update, the rest are read on the next updates
+CHANGES_PER_UPDATE = 1000
+
+EVENTS_PATH = re.compile(r'^/api/watchit/(?P<watchit_uuid>[0-9a-fA-F-]{36})/'
+                         r'playersettings/(?P<playersettings_uuid>[0-9a-fA-F-]{36})/events/$')
+
+AUTHENTICATION_CLASSES = (ExternTokenAuthentication,
+                          ExternViewerSessionAuthentication,
+                          )
+
+
+class EventState:
+    """
+    Live state of an event kept by its producer: polls with the tallies of their choices, and questions.
+
+    The state is read once, when the producer starts. Then every tick only reads the tallies again and, through the
+    log of changes (see models.Change), the polls, questions and answers changed after the cursor, so the cost of a
+    tick depends on what changed, not on the size of the event. Answers are not kept: their changes are sent as they
+    are read.
+
+    Attributes:
+        cursor (int): Last change applied; changes up to it are settled (see models.CHANGES_SETTLE_TIME).
+        applied_ids (set): Changes after the cursor already applied, which are read again until settled.
+
+    """
+
+    def __init__(self, watchit_uuid: UUID):
+        self.watchit_uuid = watchit_uuid
+        self.cursor = 0
+        self.applied_ids = set()
+        self.polls = {}
+        self.tallies = {}
+        self.questions = {}
+
+    def load(self):
+        """ Read the full state of the event. """
+        close_old_connections()
+        try:
+            settled_before = timezone.now() - timedelta(seconds=models.CHANGES_SETTLE_TIME)
+            # changes not settled yet are applied again on the first update, they are already in the state read
+            self.cursor = models.Change.objects \
+                .filter(watchit_uuid=self.watchit_uuid, creation_date__lte=settled_before) \
+                .order_by('-id') \
+                .values_list('id', flat=True) \
+                .first() or 0
+            self.polls = {poll['id']: poll for poll in models.Poll.objects
+                          .filter(watchit_uuid=self.watchit_uuid)
+                          .values('id', 'question', 'published')}
+            self.tallies = self.read_tallies()
+            self.questions = {question['id']: question for question in models.Question.objects
+                              .filter(watchit_uuid=self.watchit_uuid)
+                              .values('id', 'question', 'published', 'votes_count')}
+        finally:
+            close_old_connections()
+
+    def read_tallies(self) -> dict:
+        """ Read the answers count of every choice by choice identifier, by poll identifier """
+        tallies = {poll_id: {} for poll_id in self.polls}
+        for poll_id, choice_id, answers_count in models.Choice.objects \
+                .filter(poll__watchit_uuid=self.watchit_uuid) \
+                .values_list('poll_id', 'id', 'tally__answers_count'):
+            tallies.setdefault(poll_id, {})[choice_id] = answers_count or 0
+        return tallies
+
+    def read_changes(self) -> dict:
+        """
+        Read the changes after the cursor not applied yet and move the cursor.
+
+        Returns: The last action of every object changed by object identifier, by entity; an object created and then
+            updated is reported as created.
+
+        """
+        settled_before = timezone.now() - timedelta(seconds=models.CHANGES_SETTLE_TIME)
+        changes = models.Change.objects \
+            .filter(watchit_uuid=self.watchit_uuid, id__gt=self.cursor) \
+            .order_by('id') \
+            .values_list('id', 'entity', 'object_id', 'action', 'creation_date')[:CHANGES_PER_UPDATE]
+        last_actions = {'poll': {}, 'question': {}, 'answer': {}}
+        settled = True
+        for change_id, entity, object_id, action, creation_date in changes:
+            settled = settled and creation_date <= settled_before
+            if settled:
+                self.cursor = change_id
+            if change_id in self.applied_ids:
+                continue
+            self.applied_ids.add(change_id)
+            if not (action == 'updated' and last_actions[entity].get(object_id) == 'created'):
+                last_actions[entity][object_id] = action
+        self.applied_ids = {change_id for change_id in self.applied_ids if change_id > self.cursor}
+        return last_actions
+
+    def update(self) -> list:
+        """
+        Read what changed in the event since the last update and apply it to the state.
+
+        Returns: List of (event name, data) tuples.
+
+        """
+        close_old_connections()
+        try:
+            last_actions = self.read_changes()
+            changed_ids = {entity: [object_id for object_id, action in actions.items() if action != 'deleted']
+                           for entity, actions in last_actions.items()}
+            polls = self.read_rows(models.Poll.objects.filter(watchit_uuid=self.watchit_uuid),
+                                   changed_ids['poll'],
+                                   ('id', 'question', 'published'))
+            questions = self.read_rows(models.Question.objects.filter(watchit_uuid=self.watchit_uuid),
+                                       changed_ids['question'],
+                                       ('id', 'question', 'published', 'votes_count'))
+            answers = self.read_rows(models.QAnswer.objects.filter(question__watchit_uuid=self.watchit_uuid),
+                                     changed_ids['answer'],
+                                     ('id', 'question_id', 'answer', 'votes_count'))
+
+            events = self.apply('poll', self.polls, last_actions['poll'], polls)
+            events += self.apply('question', self.questions, last_actions['question'], questions)
+            for answer_id, data in answers.items():
+                if last_actions['answer'][answer_id] == 'created':
+                    events.append(('answer.created', data))
+                else:
+                    events.append(('answer.votes', {key: data[key] for key in ('id', 'question_id', 'votes_count')}))
+            events += [('answer.deleted', {'id': answer_id}) for answer_id in sorted(set(last_actions['answer'])
+                                                                                      - set(answers))]
+            tallies = self.read_tallies()
+            for poll_id, tally in tallies.items():
+                if tally and tally != self.tallies.get(poll_id):
+                    events.append(('poll.tally', {'id': poll_id,
+                                                  'choices': tally,
+                                                  'selections_count': sum(tally.values()),
+                                                  }))
+            self.tallies = tallies
+            return events
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def read_rows(queryset, object_ids: list, fields: tuple) -> dict:
+        """ Read the fields of the objects of a queryset by object identifier, without a query if there are none """
+        if not object_ids:
+            return {}
+        return {row['id']: row for row in queryset.filter(id__in=object_ids).values(*fields)}
+
+    @staticmethod
+    def apply(name: str, objects: dict, actions: dict, rows: dict) -> list:
+        """
+        Apply the changes of polls or questions to the state.
+
+        Args:
+            name: 'poll' or 'question'.
+            objects: state of the objects by identifier, updated.
+            actions: last action of every object changed by identifier.
+            rows: current data of the objects changed that still exist by identifier.
+
+        Returns: List of (event name, data) tuples.
+
+        """
+        events = []
+        for object_id, data in rows.items():
+            old = objects.get(object_id)
+            objects[object_id] = data
+            if old is None:
+                events.append(('%s.created' % name, data))
+                continue
+            if old['published'] != data['published']:
+                events.append(('%s.published' % name, {'id': object_id, 'published': data['published']}))
+            if 'votes_count' in data and old['votes_count'] != data['votes_count']:
+                events.append(('%s.votes' % name, {'id': object_id, 'votes_count': data['votes_count']}))
+        for object_id in sorted(set(actions) - set(rows)):
+            if objects.pop(object_id, None) is not None:
+                events.append(('%s.deleted' % name, {'id': object_id}))
+        return events
+
+    def snapshot_data(self) -> dict:
+        """ Serialize the state for the first message of a subscriber. """
+        return {
+            'polls': [dict(poll, choices=self.tallies.get(poll_id, {})) for poll_id, poll in self.polls.items()],
+            'questions': list(self.questions.values()),
+        }
+
+
+def format_message(event: str, data, message_id: int = None) -> bytes:
+    """ Encode an event as a Server-Sent Events message. """
+    lines = []
+    if message_id is not None:
+        lines.append('id: %s' % message_id)
+    lines.append('event: %s' % event)
+    lines.append('data: %s' % json.dumps(data, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class Subscriber:
+    """
+    Client connected to the stream of an event.
+
+    Attributes:
+        queue (asyncio.Queue): Messages waiting to be sent; None means the subscriber must be disconnected.
+        needs_snapshot (bool): Indicate if the subscriber still has to receive the full state of the event.
+
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.needs_snapshot = True
+
+    def put(self, message: bytes):
+        """ Queue a message; a subscriber too slow to keep up is disconnected so it can reconnect. """
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self):
+        """ Disconnect the subscriber after the messages already sent, so it can reconnect. """
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventProducer:
+    """
+    Shared producer of live changes of one event.
+
+    While there are subscribers, the changes of the event are read every `poll_interval` seconds (see EventState)
+    and sent to every subscriber, so the database cost does not grow with the audience.
+    """
+
+    def __init__(self, hub, watchit_uuid: UUID):
+        self.hub = hub
+        self.watchit_uuid = watchit_uuid
+        self.subscribers = set()
+        self.state = None
+        self.message_id = 0
+        self._task = None
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.hub.queue_size)
+        self.subscribers.add(subscriber)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, events: list):
+        for event, data in events:
+            self.message_id += 1
+            message = format_message(event, data, self.message_id)
+            for subscriber in self.subscribers:
+                if not subscriber.needs_snapshot:
+                    subscriber.put(message)
+
+    async def _run(self):
+        try:
+            while self.subscribers:
+                # not thread sensitive: reads of every event would run one by one in a single shared thread
+                if self.state is None:
+                    state = EventState(self.watchit_uuid)
+                    await sync_to_async(state.load, thread_sensitive=False)()
+                    self.state = state
+                else:
+                    self.publish(await sync_to_async(self.state.update, thread_sensitive=False)())
+                new_subscribers = [subscriber for subscriber in self.subscribers if subscriber.needs_snapshot]
+                if new_subscribers:
+                    message = format_message('snapshot', self.state.snapshot_data(), self.message_id)
+                    for subscriber in new_subscribers:
+                        subscriber.needs_snapshot = False
+                        subscriber.put(message)
+                await asyncio.sleep(self.hub.poll_interval)
+        except Exception:
+            logger.exception('live changes of event %s could not be read', self.watchit_uuid)
+            # subscribers of a producer that stopped would only get keep-alives
+            for subscriber in self.subscribers:
+                subscriber.close()
+        finally:
+            self.hub.discard(self)
+
+
+class EventHub:
+    """
+    Registry of the event producers of the current process, one per event with subscribers.
+    """
+
+    def __init__(self, config: dict = None):
+        config = {**DEFAULT_LIVE_EVENTS_CONFIG, **(config or {})}
+        self.poll_interval = config['POLL_INTERVAL']
+        self.heartbeat_interval = config['HEARTBEAT_INTERVAL']
+        self.queue_size = config['SUBSCRIBER_QUEUE_SIZE']
+        self.producers = {}
+
+    def subscribe(self, watchit_uuid: UUID) -> tuple:
+        """
+        Subscribe to the live changes of an event.
+
+        Returns: The producer of the event and the subscriber.
+
+        """
+        producer = self.producers.get(watchit_uuid)
+        if producer is None:
+            producer = self.producers[watchit_uuid] = EventProducer(self, watchit_uuid)
+        return producer, producer.subscribe()
+
+    def discard(self, producer: EventProducer):
+        if self.producers.get(producer.watchit_uuid) is producer:
+            del self.producers[producer.watchit_uuid]
+
+
+event_hub = EventHub(getattr(settings, 'LIVE_EVENTS', None))
+
+
+def authenticate(headers: list):
+    """
+    Authenticate a connection with the authentication classes of the API.
+
+    Args:
+        headers: ASGI headers of the connection.
+
+    Returns: The interaction user authenticated or None.
+
+    Raises:
+        AuthenticationFailed: When the credentials are wrong.
+
+    """
+    meta = {'HTTP_%s' % name.decode('latin1').upper().replace('-', '_'): value.decode('latin1')
+            for name, value in headers}
+    request = SimpleNamespace(META=meta)
+    close_old_connections()
+    try:
+        for authentication_class in AUTHENTICATION_CLASSES:
+            if authentication_class().authenticate(request) is not None:
+                return request.interaction_user
+        return None
+    finally:
+        close_old_connections()
+
+
+async def send_json(send, status: int, data: dict):
+    body = json.dumps(data).encode('utf-8')
+    await send({'type': 'http.response.start',
+                'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+                })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stream_events(scope, receive, send, watchit_uuid: UUID, hub: EventHub = None):
+    """
+    ASGI application streaming the live changes of an event as Server-Sent Events.
+
+    The first message is a `snapshot` of the polls and questions of the event (answers of a question are read from
+    its answers endpoint); then `poll.*`, `question.*` and `answer.*` messages are sent as changes are detected. The
+    stream ends when the client disconnects.
+    """
+    hub = hub or event_hub
+    if scope['method'] != 'GET':
+        await send_json(send, 405, {'detail': 'Method "%s" not allowed.' % scope['method']})
+        return
+    try:
+        # not thread sensitive: a slow backend would stall the authentication of every other connection
+        interaction_user = await sync_to_async(authenticate, thread_sensitive=False)(scope['headers'])
+    except exceptions.AuthenticationFailed as error:
+        await send_json(send, 401, {'detail': str(error.detail)})
+        return
+    if interaction_user is None:
+        await send_json(send, 401, {'detail': str(exceptions.NotAuthenticated.default_detail)})
+        return
+
+    await send({'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'),
+                            (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no'),
+                            ],
+                })
+    producer, subscriber = hub.subscribe(watchit_uuid)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        while True:
+            message = asyncio.ensure_future(subscriber.queue.get())
+            done, pending = await asyncio.wait({message, disconnected},
+                                               timeout=hub.heartbeat_interval,
+                                               return_when=asyncio.FIRST_COMPLETED,
+                                               )
+            if disconnected in done:
+                message.cancel()
+                return
+            if message not in done:
+                message.cancel()
+                await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+                continue
+            if message.result() is None:
+                break
+            await send({'type': 'http.response.body', 'body': message.result(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        producer.unsubscribe(subscriber)
+        disconnected.cancel()
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class LiveEventsRouter:
+    """
+    ASGI application serving the live events streams and delegating any other request to Django.
+
+    Streams are served here, outside Django views, so long lived connections do not hold a worker thread.
+    """
+
+    def __init__(self, application, hub: EventHub = None):
+        self.application = application
+        self.hub = hub
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            match = EVENTS_PATH.match(scope['path'])
+            if match is not None:
+                await stream_events(scope, receive, send, UUID(match.group('watchit_uuid')), self.hub)
+                return
+        await self.application(scope, receive, send)
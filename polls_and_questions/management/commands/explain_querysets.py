@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from polls import views as polls_views
+from polls_and_questions.models import Poll, Question
+from polls_and_questions.pagination import KeysetPagination
+from questions import views as questions_views
+
+
+class Command(BaseCommand):
+    """
+    Print the query plans of the list querysets of the interaction viewsets, for the first page and for a deep page
+    after a keyset cursor, so missing indexes are visible.
+    """
+    help = 'Print EXPLAIN of the querysets of the interaction viewsets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watchit', help='Watchit of polls and questions (default: of the latest question)')
+        parser.add_argument('--poll', type=int, help='Poll of the answers (default: latest poll)')
+        parser.add_argument('--question', type=int, help='Question of the answers (default: latest question)')
+        parser.add_argument('--query', action='append', default=[], metavar='PARAM=VALUE',
+                            help='Query param sent to the list views, e.g. published=true')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (PostgreSQL and MySQL)')
+        parser.add_argument('--repeat', type=int, default=0, help='Also time each query the given times')
+
+    def handle(self, *args, **options):
+        latest_question = Question.objects.order_by('-id').values('id', 'watchit_uuid').first()
+        watchit_uuid = options['watchit'] or (latest_question or {}).get('watchit_uuid')
+        poll_id = options['poll'] or Poll.objects.order_by('-id').values_list('id', flat=True).first()
+        question_id = options['question'] or (latest_question or {}).get('id')
+        if watchit_uuid is None:
+            raise CommandError('there are no questions, use --watchit')
+        try:
+            query = dict(param.split('=', 1) for param in options['query'])
+        except ValueError:
+            raise CommandError('--query must be PARAM=VALUE')
+        explain_options = {'analyze': True} if options['analyze'] else {}
+
+        viewsets = (
+            (polls_views.PollViewSet, {'watchit_uuid': watchit_uuid}),
+            (questions_views.QuestionViewSet, {'watchit_uuid': watchit_uuid}),
+            (polls_views.PAnswerViewSet, {'poll_id': poll_id}),
+            (questions_views.QAnswerViewSet, {'question_id': question_id}),
+        )
+        for viewset, kwargs in viewsets:
+            view = viewset(action='list', kwargs=kwargs, format_kwarg=None)
+            view.request = Request(APIRequestFactory().get('/', query))
+            queryset = view.filter_queryset(view.get_queryset())
+            paginator = KeysetPagination()
+            ordering = tuple(getattr(view, 'ordering', None) or paginator.ordering)
+            first_page = queryset.order_by(*ordering)[:paginator.page_size + 1]
+            pages = [('first page', first_page)]
+            middle = queryset.order_by(*ordering).values_list(*[field.lstrip('-') for field in ordering])
+            position = middle[queryset.count() // 2] if middle.exists() else None
+            if position is not None:
+                deep_page = queryset.filter(paginator.after(ordering, list(position))) \
+                    .order_by(*ordering)[:paginator.page_size + 1]
+                pages.append(('deep page', deep_page))
+            for page, page_queryset in pages:
+                self.stdout.write(self.style.MIGRATE_HEADING('%s %s (%s)' % (viewset.__name__, page, kwargs)))
+                self.stdout.write(str(page_queryset.query))
+                self.stdout.write(page_queryset.explain(**explain_options))
+                if options['repeat']:
+                    started = time.perf_counter()
+                    for _ in range(options['repeat']):
+                        list(page_queryset.all())
+                    self.stdout.write('%.3f ms per query' % ((time.perf_counter() - started) * 1000 / options['repeat']))
+                self.stdout.write('')
@@ -0,0 +1,66 @@
+from django.db.models import Exists, OuterRef
+from django.core.management.base import BaseCommand
+
+from polls_and_questions.models import EventConfig, Poll, PollConfig, Question, QuestionConfig
+
+
+class Command(BaseCommand):
+    """
+    Remove poll and question configurations not used by any interaction nor as default of any event.
+
+    Configurations are shared and never changed in place (see SharedConfig), so rows left behind by forks and by
+    replaced defaults are only removed here. References are checked again in the DELETE statement itself, so a row
+    referenced after it was selected is kept instead of breaking the interaction or clearing the event default.
+    """
+    help = 'Remove unreferenced poll and question configurations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows removed per statement')
+        parser.add_argument('--dry-run', action='store_true', help='Report unreferenced rows without removing them')
+
+    def handle(self, *args, **options):
+        for config_model, interaction_model, default_field in ((PollConfig, Poll, 'default_polls_config'),
+                                                               (QuestionConfig, Question, 'default_questions_config'),
+                                                               ):
+            removed = self.collect(config_model,
+                                   interaction_model,
+                                   default_field,
+                                   chunk_size=options['chunk_size'],
+                                   dry_run=options['dry_run'],
+                                   )
+            self.stdout.write('%s: %s unreferenced rows%s' % (config_model._meta.verbose_name,
+                                                               removed,
+                                                               '' if options['dry_run'] else ' removed',
+                                                               ))
+
+    @staticmethod
+    def collect(config_model, interaction_model, default_field: str, chunk_size: int, dry_run: bool = False) -> int:
+        """
+        Remove unreferenced rows of a configuration model.
+
+        Args:
+            config_model: PollConfig or QuestionConfig.
+            interaction_model: model of the interactions using the configurations.
+            default_field: field of EventConfig pointing to default configurations.
+            chunk_size: count of rows removed per statement.
+            dry_run: when True unreferenced rows are only counted.
+
+        Returns: The count of unreferenced rows.
+
+        """
+        unreferenced = config_model.objects \
+            .filter(~Exists(interaction_model.objects.filter(configuration=OuterRef('pk')))) \
+            .filter(~Exists(EventConfig.objects.filter(**{default_field: OuterRef('pk')})))
+        if dry_run:
+            return unreferenced.count()
+        removed_count = 0
+        last_pk = 0
+        while True:
+            pks = list(unreferenced.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return removed_count
+            last_pk = pks[-1]
+            # a raw DELETE keeps the NOT EXISTS conditions in its WHERE clause; QuerySet.delete would delete the
+            # selected rows by primary key, setting to NULL the event defaults referencing them meanwhile. The
+            # delete signals are not needed: they invalidate the cache of events using the configuration
+            removed_count += unreferenced.filter(pk__in=pks)._raw_delete(unreferenced.db)
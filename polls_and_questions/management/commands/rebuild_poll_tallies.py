@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls_and_questions.models import Choice, ChoiceTally
+
+
+class Command(BaseCommand):
+    """
+    Count again the results of poll choices from the answers.
+
+    Choices are processed in chunks of primary keys, each chunk in its own transaction.
+    """
+    help = 'Rebuild choice tallies of polls from their answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=int, action='append', dest='poll_ids', help='Poll identifier (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Choices processed per transaction')
+
+    def handle(self, *args, **options):
+        choices = Choice.objects.order_by('pk')
+        if options['poll_ids']:
+            choices = choices.filter(poll_id__in=options['poll_ids'])
+        rebuilt = 0
+        last_pk = 0
+        while True:
+            choice_ids = list(choices.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['chunk_size']])
+            if not choice_ids:
+                break
+            last_pk = choice_ids[-1]
+            with transaction.atomic():
+                ChoiceTally.rebuild(choice_ids)
+            rebuilt += len(choice_ids)
+        self.stdout.write('%s choice tallies rebuilt' % rebuilt)
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from polls_and_questions.models import QAnswer, Question
+from polls_and_questions.search import search_backend
+
+
+class Command(BaseCommand):
+    """
+    Fill the search index of questions and answers from scratch, e.g. after changing the search backend or to fix
+    an index that missed writes done in bulk.
+    """
+    help = 'Rebuild the search index of questions and answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows indexed per chunk')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search_backend.clear()
+            for entity, queryset in (('question', Question.objects.values_list('id', 'watchit_uuid', 'question')),
+                                     ('answer', QAnswer.objects.values_list('id', 'question__watchit_uuid', 'answer')),
+                                     ):
+                indexed = self.index(entity, queryset, chunk_size=options['chunk_size'])
+                self.stdout.write('%s: %s rows indexed' % (entity, indexed))
+
+    @staticmethod
+    def index(entity: str, queryset, chunk_size: int) -> int:
+        """
+        Index the rows of a queryset in chunks of primary keys.
+
+        Args:
+            entity: 'question' or 'answer'.
+            queryset: values_list queryset of (id, watchit identifier, text) rows.
+            chunk_size: count of rows indexed per chunk.
+
+        Returns: The count of rows indexed.
+
+        """
+        indexed_count = 0
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+            if not rows:
+                return indexed_count
+            last_pk = rows[-1][0]
+            search_backend.index(entity, rows)
+            indexed_count += len(rows)
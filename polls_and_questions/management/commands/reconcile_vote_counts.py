@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from polls_and_questions.models import QAnswer, Question
+
+
+class Command(BaseCommand):
+    """
+    Fix drift of votes_count columns of questions and answers counting the vote tables; the trending scores of the
+    questions fixed are computed again too.
+
+    Rows are processed in chunks of primary keys and only drifted rows are written, so the command can run while
+    the event is live.
+    """
+    help = 'Reconcile votes_count of questions and answers with their votes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows checked per chunk')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        for model in (Question, QAnswer):
+            fixed = self.reconcile(model, chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+            self.stdout.write('%s: %s rows with drift%s' % (model._meta.verbose_name,
+                                                             fixed,
+                                                             '' if options['dry_run'] else ' fixed',
+                                                             ))
+
+    @staticmethod
+    def reconcile(model, chunk_size: int, dry_run: bool = False) -> int:
+        """
+        Reconcile votes_count column of a model.
+
+        Args:
+            model: Question or QAnswer.
+            chunk_size: count of rows checked per chunk.
+            dry_run: when True drift is only counted.
+
+        Returns: The count of rows with drift.
+
+        """
+        drift_count = 0
+        last_pk = 0
+        while True:
+            pks = list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return drift_count
+            last_pk = pks[-1]
+            drifted_pks = list(model.objects
+                               .filter(pk__in=pks)
+                               .annotate(actual_votes_count=Count('votes'))
+                               .filter(~Q(votes_count=F('actual_votes_count')))
+                               .values_list('pk', flat=True))
+            drift_count += len(drifted_pks)
+            if drifted_pks and not dry_run and model is Question:
+                with transaction.atomic():
+                    # take the write locks first, as QVote.toggle does, so votes toggled meanwhile wait and are
+                    # not lost; the trending score was computed from the drifted count too
+                    model.objects.filter(pk__in=drifted_pks).update(votes_count=F('votes_count'))
+                    model.refresh_vote_scores(drifted_pks)
+            elif drifted_pks and not dry_run:
+                # counted again inside the UPDATE so votes arriving meanwhile are not lost
+                vote_model = model.votes.rel.related_model
+                vote_field = model.votes.rel.field.name
+                votes = vote_model.objects.filter(**{vote_field: OuterRef('pk')}) \
+                    .order_by() \
+                    .values(vote_field) \
+                    .annotate(count=Count('pk')) \
+                    .values('count')
+                model.objects.filter(pk__in=drifted_pks).update(votes_count=Coalesce(Subquery(votes), Value(0)))
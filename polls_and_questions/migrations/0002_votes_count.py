@@ -0,0 +1,40 @@
+# Generated by Django 4.0.5 on 2026-10-18 02:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_votes(apps, schema_editor):
+    """ Initialize votes_count columns from the vote tables. """
+    for model_name, vote_model_name, vote_field in (('Question', 'QVote', 'question'),
+                                                    ('QAnswer', 'QAVote', 'answer')):
+        model = apps.get_model('polls_and_questions', model_name)
+        vote_model = apps.get_model('polls_and_questions', vote_model_name)
+        votes = vote_model.objects.filter(**{vote_field: OuterRef('pk')}) \
+            .order_by() \
+            .values(vote_field) \
+            .annotate(count=Count('pk')) \
+            .values('count')
+        model.objects.update(votes_count=Coalesce(Subquery(votes), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qanswer',
+            name='votes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='votes count'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='votes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='votes count'),
+        ),
+        migrations.RunPython(count_votes, migrations.RunPython.noop),
+    ]
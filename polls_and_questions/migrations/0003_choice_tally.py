@@ -0,0 +1,40 @@
+# Generated by Django 4.0.5 on 2026-10-18 02:40
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def count_answers(apps, schema_editor):
+    """ Initialize tallies from the selected choices of answers. """
+    PAnswer = apps.get_model('polls_and_questions', 'PAnswer')
+    ChoiceTally = apps.get_model('polls_and_questions', 'ChoiceTally')
+    counts = PAnswer.selected_choice.through.objects \
+        .order_by() \
+        .values('choice_id') \
+        .annotate(answers_count=Count('pk'))
+    ChoiceTally.objects.bulk_create([ChoiceTally(choice_id=count['choice_id'], answers_count=count['answers_count'])
+                                     for count in counts.iterator()],
+                                    batch_size=1000,
+                                    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0002_votes_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceTally',
+            fields=[
+                ('choice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='tally', serialize=False, to='polls_and_questions.choice')),
+                ('answers_count', models.PositiveIntegerField(default=0, verbose_name='answers count')),
+            ],
+            options={
+                'verbose_name': 'choice tally',
+            },
+        ),
+        migrations.RunPython(count_answers, migrations.RunPython.noop),
+    ]
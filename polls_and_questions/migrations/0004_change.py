@@ -0,0 +1,31 @@
+# Generated by Django 4.0.5 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0003_choice_tally'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watchit_uuid', models.UUIDField(verbose_name='event identifier')),
+                ('entity', models.CharField(choices=[('poll', 'poll'), ('question', 'question'), ('answer', 'question answer')], max_length=10, verbose_name='entity')),
+                ('object_id', models.BigIntegerField(verbose_name='object identifier')),
+                ('action', models.CharField(choices=[('created', 'created'), ('updated', 'updated'), ('deleted', 'deleted')], max_length=10, verbose_name='action')),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'change',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['watchit_uuid', 'id'], name='change_watchit_seq_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.5 on 2026-10-18 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0004_change'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='panswer',
+            index=models.Index(fields=['poll', 'creation_date', 'id'], name='panswer_poll_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['watchit_uuid', 'creation_date', 'id'], name='poll_watchit_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qanswer',
+            index=models.Index(fields=['question', 'creation_date', 'id'], name='qanswer_question_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['watchit_uuid', 'creation_date', 'id'], name='question_watchit_created_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.5 on 2026-10-18 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['watchit_uuid', 'published', 'streaming', 'creation_date', 'id'], name='poll_watchit_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['watchit_uuid', 'published', 'streaming', 'creation_date', 'id'], name='question_watchit_state_idx'),
+        ),
+    ]
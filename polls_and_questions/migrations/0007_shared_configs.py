@@ -0,0 +1,78 @@
+import hashlib
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def content_hash(config) -> str:
+    content = {field.name: getattr(config, field.name)
+               for field in config._meta.concrete_fields
+               if not field.primary_key and field.name != 'content_hash'}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def deduplicate_configs(apps, schema_editor):
+    """ Hash every configuration and point interactions and events to one row per content """
+    EventConfig = apps.get_model('polls_and_questions', 'EventConfig')
+    for config_model_name, interaction_model_name, default_field in (('PollConfig', 'Poll', 'default_polls_config'),
+                                                                     ('QuestionConfig', 'Question',
+                                                                      'default_questions_config'),
+                                                                     ):
+        config_model = apps.get_model('polls_and_questions', config_model_name)
+        interaction_model = apps.get_model('polls_and_questions', interaction_model_name)
+        canonical_ids = {}
+        duplicates = {}
+        for config in config_model.objects.order_by('pk').iterator():
+            config_hash = content_hash(config)
+            if config_hash in canonical_ids:
+                duplicates.setdefault(canonical_ids[config_hash], []).append(config.pk)
+            else:
+                canonical_ids[config_hash] = config.pk
+                config_model.objects.filter(pk=config.pk).update(content_hash=config_hash)
+        for canonical_id, duplicate_ids in duplicates.items():
+            interaction_model.objects.filter(configuration_id__in=duplicate_ids).update(configuration_id=canonical_id)
+            EventConfig.objects.filter(**{'%s_id__in' % default_field: duplicate_ids}) \
+                .update(**{'%s_id' % default_field: canonical_id})
+            config_model.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0006_state_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pollconfig',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, verbose_name='content hash'),
+        ),
+        migrations.AddField(
+            model_name='questionconfig',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, verbose_name='content hash'),
+        ),
+        migrations.RunPython(deduplicate_configs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='pollconfig',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, unique=True, verbose_name='content hash'),
+        ),
+        migrations.AlterField(
+            model_name='questionconfig',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, unique=True, verbose_name='content hash'),
+        ),
+        migrations.AlterField(
+            model_name='poll',
+            name='configuration',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='polls_and_questions.pollconfig'),
+        ),
+        migrations.AlterField(
+            model_name='question',
+            name='configuration',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='polls_and_questions.questionconfig'),
+        ),
+    ]
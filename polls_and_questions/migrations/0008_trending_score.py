@@ -0,0 +1,45 @@
+# Generated by Django 4.0.5 on 2026-10-18 03:00
+
+import math
+from itertools import groupby
+
+from django.db import migrations, models
+
+from polls_and_questions.models import TRENDING_EPOCH, TRENDING_HALF_LIFE
+
+
+def compute_trending_scores(apps, schema_editor):
+    """ Initialize trending_score of questions from their votes """
+    Question = apps.get_model('polls_and_questions', 'Question')
+    QVote = apps.get_model('polls_and_questions', 'QVote')
+    votes = QVote.objects.order_by('question_id').values_list('question_id', 'creation_date').iterator()
+    for question_id, question_votes in groupby(votes, key=lambda vote: vote[0]):
+        weights = [(creation_date - TRENDING_EPOCH).total_seconds() * math.log(2) / TRENDING_HALF_LIFE
+                   for _, creation_date in question_votes]
+        top_weight = max(weights)
+        score = top_weight + math.log(sum(math.exp(weight - top_weight) for weight in weights))
+        Question.objects.filter(pk=question_id).update(trending_score=score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0007_shared_configs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='trending score'),
+        ),
+        migrations.RunPython(compute_trending_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['watchit_uuid', 'votes_count', 'id'], name='question_watchit_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['watchit_uuid', 'trending_score', 'id'], name='question_watchit_trending_idx'),
+        ),
+    ]
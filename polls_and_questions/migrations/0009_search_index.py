@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """ Create the FTS5 table of SQLiteFTS5Backend and index the existing questions and answers """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    # rowid is object id * 2 + 0 for questions and 1 for answers, scope is the entity and the watchit (see
+    # polls_and_questions.search.SQLiteFTS5Backend)
+    schema_editor.execute("CREATE VIRTUAL TABLE polls_and_questions_search USING fts5("
+                          "text, scope, tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    schema_editor.execute("INSERT INTO polls_and_questions_search (rowid, text, scope) "
+                          "SELECT id * 2, question, 'question' || lower(replace(watchit_uuid, '-', '')) "
+                          "FROM polls_and_questions_question")
+    schema_editor.execute("INSERT INTO polls_and_questions_search (rowid, text, scope) "
+                          "SELECT a.id * 2 + 1, a.answer, 'answer' || lower(replace(q.watchit_uuid, '-', '')) "
+                          "FROM polls_and_questions_qanswer a "
+                          "JOIN polls_and_questions_question q ON q.id = a.question_id")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS polls_and_questions_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0008_trending_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.0.5 on 2026-10-18 03:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from polls_and_questions.similarity import band_buckets
+
+
+def bucket_questions(apps, schema_editor):
+    """ Put the existing questions in the buckets of the near-duplicates index """
+    Question = apps.get_model('polls_and_questions', 'Question')
+    QuestionBucket = apps.get_model('polls_and_questions', 'QuestionBucket')
+    buckets = []
+    for question_id, watchit_uuid, text in Question.objects.order_by('pk').values_list('id', 'watchit_uuid', 'question') \
+            .iterator():
+        buckets.extend(QuestionBucket(question_id=question_id, watchit_uuid=watchit_uuid, band=band, bucket=bucket)
+                       for band, bucket in enumerate(band_buckets(text)))
+        if len(buckets) >= 1000:
+            QuestionBucket.objects.bulk_create(buckets)
+            buckets = []
+    QuestionBucket.objects.bulk_create(buckets)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watchit_uuid', models.UUIDField(verbose_name='event identifier')),
+                ('band', models.PositiveSmallIntegerField(verbose_name='band')),
+                ('bucket', models.BigIntegerField(verbose_name='bucket')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='polls_and_questions.question')),
+            ],
+            options={
+                'verbose_name': 'question bucket',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='questionbucket',
+            index=models.Index(fields=['watchit_uuid', 'band', 'bucket'], name='qbucket_lookup_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='questionbucket',
+            unique_together={('question', 'band')},
+        ),
+        migrations.RunPython(bucket_questions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.0.5 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_and_questions', '0010_question_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='rejected',
+            field=models.BooleanField(default=False, verbose_name='is rejected'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('published', False), ('rejected', False)), fields=['watchit_uuid', 'creation_date', 'id'], name='question_moderation_idx'),
+        ),
+    ]
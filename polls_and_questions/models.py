@@ -1,7 +1,18 @@
+import hashlib
+import json
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from uuid import UUID
+
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Case, Count, F, Min, OuterRef, Subquery, Value, When, Window
+from django.db.models.functions import Abs, Coalesce, Exp, Greatest, Ln, RowNumber
 from django.utils.translation import gettext_lazy as _
 
+from polls_and_questions import similarity
 from users.models import InteractionUser
 
 RESULT_PRIVACY_CHOICES = (('EVERYONE', 'Everyone can see the results'),
@@ -9,6 +20,27 @@ RESULT_PRIVACY_CHOICES = (('EVERYONE', 'Everyone can see the results'),
                           ('ONLY_CREATOR', 'Only the creator can see the results'),
                           )
 
+TOGGLE_VOTE_ATTEMPTS = 3
+
+# seconds for the weight of a vote in the trending score of a question to halve
+TRENDING_HALF_LIFE = 15 * 60
+TRENDING_EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+# smallest fraction of the trending score kept when a vote is removed, avoids log(0) with rounding errors
+TRENDING_MIN_FRACTION = 1e-12
+
+# smallest similarity (see polls_and_questions.similarity) of a question to be a likely duplicate of other one
+DUPLICATE_MIN_SIMILARITY = 0.5
+# questions sharing a bucket compared at most, so popular buckets do not make lookups slow
+DUPLICATE_MAX_CANDIDATES = 200
+
+# fields set by each moderation action on the questions
+MODERATION_ACTIONS = {
+    'publish': {'published': True, 'rejected': False},
+    'reject': {'published': False, 'streaming': False, 'rejected': True},
+    'stream': {'streaming': True},
+    'unstream': {'streaming': False},
+}
+
 EXTERNAL_USERS_CHOICES = (
     ('SYSTEM', _('Sistem user')),  # users with accounts in external API
     ('PARTICIPANT', _('Participant user')),  # users logged with email in external API
@@ -36,6 +68,10 @@ class Interaction(models.Model):
 
     class Meta:
         abstract = True
+        indexes = [models.Index(fields=['watchit_uuid', 'creation_date', 'id'], name='%(class)s_watchit_created_idx'),
+                   models.Index(fields=['watchit_uuid', 'published', 'streaming', 'creation_date', 'id'],
+                                name='%(class)s_watchit_state_idx'),
+                   ]
 
 
     def __str__(self):
@@ -61,7 +97,77 @@ ANSWERING_TIME_LIMIT_CHOICES = (
 )
 
 
-class PollConfig(models.Model):
+class SharedConfig(models.Model):
+    """
+    Abstract data model for configurations shared by every interaction with the same content.
+
+    Rows are immutable and deduplicated by the hash of their content: they are obtained with `intern`, and changing
+    the configuration of one interaction means pointing it to the row of the new content (`fork`), so the rest of
+    interactions sharing the old row are not affected. Rows not referenced anymore are removed by the gc_configs
+    command.
+
+    Attributes:
+        content_hash (str): SHA-256 of the content of the configuration.
+
+    """
+    content_hash = models.CharField(_('content hash'), max_length=64, unique=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def content_fields(cls) -> list:
+        """ Retrieve the fields that make the content of the configuration """
+        return [field for field in cls._meta.concrete_fields if not field.primary_key and field.name != 'content_hash']
+
+    @classmethod
+    def hash_content(cls, content: dict) -> str:
+        """
+        Compute the hash of a content.
+
+        Args:
+            content: value of every content field by field name.
+
+        """
+        return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def intern(cls, **values):
+        """
+        Retrieve the configuration with a content, creating it if it does not exist.
+
+        Args:
+            values: values of content fields; missing ones take their defaults.
+
+        Returns: The shared configuration.
+
+        """
+        content = {field.name: field.to_python(values[field.name]) if field.name in values else field.get_default()
+                   for field in cls.content_fields()}
+        # get_or_create retries the read when the row is created concurrently
+        config, created = cls.objects.get_or_create(content_hash=cls.hash_content(content), defaults=content)
+        return config
+
+    def content(self) -> dict:
+        """ Retrieve the value of every content field by field name """
+        return {field.name: getattr(self, field.name) for field in self.content_fields()}
+
+    def fork(self, **changes):
+        """
+        Retrieve the configuration with the content of this one changed; this one is not modified.
+
+        Args:
+            changes: new values of content fields.
+
+        """
+        return type(self).intern(**{**self.content(), **changes})
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.hash_content(self.content())
+        super().save(*args, **kwargs)
+
+
+class PollConfig(SharedConfig):
     """
     Model for Configuration of interation type Poll.
 
@@ -92,9 +198,30 @@ class Poll(Interaction):
         streaming (bool): Indicate if the poll is streaming or not.
 
     """
-    configuration = models.ForeignKey(PollConfig, on_delete=models.CASCADE)
+    configuration = models.ForeignKey(PollConfig, on_delete=models.PROTECT)
+
+
+
 
+class ChoiceQuerySet(models.QuerySet):
 
+    def delete(self):
+        """
+        Delete choices and record their polls as updated, with one insert.
+
+        This is done here instead of in a delete signal receiver, which would stop Django from deleting in bulk the
+        choices of a deleted poll (recorded as deleted itself).
+        """
+        with transaction.atomic():
+            choices = list(self.select_for_update().values_list('pk', 'poll_id', 'poll__watchit_uuid'))
+            deleted = models.QuerySet.delete(self.model._base_manager.filter(pk__in=[choice[0] for choice in choices]))
+            Change.record_by_watchit('poll',
+                                     sorted({(poll_id, watchit_uuid) for choice_id, poll_id, watchit_uuid in choices}),
+                                     'updated')
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
 
 class Choice(models.Model):
@@ -108,9 +235,97 @@ class Choice(models.Model):
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='choices')
     choice = models.CharField(_('choice'), max_length=256)
 
+    objects = ChoiceQuerySet.as_manager()
+
     def __str__(self):
         return self.choice
 
+    def delete(self, using=None, keep_parents=False):
+        return type(self).objects.using(using).filter(pk=self.pk).delete()
+
+
+class ChoiceTally(models.Model):
+    """
+    Model for results of a Choice, maintained when answers are created or deleted.
+
+    choice (Choice): Choice counted.
+    answers_count (int): Count of answers that selected the choice.
+
+    """
+    choice = models.OneToOneField(Choice, on_delete=models.CASCADE, primary_key=True, related_name='tally')
+    answers_count = models.PositiveIntegerField(_('answers count'), default=0)
+
+    class Meta:
+        verbose_name = _('choice tally')
+
+    def __str__(self):
+        return "%s : %s" % (self.choice_id, self.answers_count)
+
+    @classmethod
+    def add(cls, counts: Dict[int, int]):
+        """
+        Add answers to the tallies of choices.
+
+        Args:
+            counts: count of answers to add (or to remove, when negative) by choice identifier.
+
+        """
+        increments = defaultdict(list)
+        for choice_id, count in counts.items():
+            if count:
+                increments[count].append(choice_id)
+        if not increments:
+            return
+        new_choice_ids = [choice_id for count, choice_ids in increments.items() if count > 0 for choice_id in choice_ids]
+        if new_choice_ids:
+            cls.objects.bulk_create([cls(choice_id=choice_id) for choice_id in new_choice_ids], ignore_conflicts=True)
+        for count, choice_ids in increments.items():
+            tallies = cls.objects.filter(choice_id__in=choice_ids)
+            if count < 0:
+                tallies = tallies.filter(answers_count__gte=-count)
+            tallies.update(answers_count=F('answers_count') + count)
+
+    @classmethod
+    def rebuild(cls, choice_ids: List[int]):
+        """
+        Count again the answers of choices from the selected choices of answers.
+
+        Args:
+            choice_ids: identifiers of the choices.
+
+        """
+        cls.objects.bulk_create([cls(choice_id=choice_id) for choice_id in choice_ids], ignore_conflicts=True)
+        counts = PAnswer.selected_choice.through.objects \
+            .filter(choice_id=OuterRef('choice_id')) \
+            .order_by() \
+            .values('choice_id') \
+            .annotate(count=Count('pk')) \
+            .values('count')
+        cls.objects.filter(choice_id__in=choice_ids).update(answers_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class PAnswerQuerySet(models.QuerySet):
+
+    def delete(self):
+        """
+        Delete answers and remove them from the tallies of their choices, with one grouped update.
+
+        Tallies are kept here instead of in a delete signal receiver, which would stop Django from deleting in bulk
+        the answers of a deleted poll (their choices and tallies are deleted with them anyway).
+        """
+        with transaction.atomic():
+            answer_ids = list(self.select_for_update().values_list('pk', flat=True))
+            counts = PAnswer.selected_choice.through.objects \
+                .filter(panswer_id__in=answer_ids) \
+                .order_by() \
+                .values_list('choice_id') \
+                .annotate(count=Count('pk'))
+            ChoiceTally.add({choice_id: -count for choice_id, count in counts})
+            return models.QuerySet.delete(self.model._base_manager.filter(pk__in=answer_ids))
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 class PAnswer(models.Model):
     """
@@ -126,14 +341,55 @@ class PAnswer(models.Model):
     creator = models.ForeignKey(InteractionUser, on_delete=models.CASCADE, )
     creation_date = models.DateTimeField(_('creation_date'), auto_now=True)
 
+    objects = PAnswerQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('poll answer')
+        indexes = [models.Index(fields=['poll', 'creation_date', 'id'], name='panswer_poll_created_idx')]
 
     def __str__(self):
         return "%s : %s" % (self.creator, self.poll)
 
-
-class QuestionConfig(models.Model):
+    def delete(self, using=None, keep_parents=False):
+        return type(self).objects.using(using).filter(pk=self.pk).delete()
+
+    @classmethod
+    def select_choices(cls, selections: Dict[int, List[int]]):
+        """
+        Link answers with their selected choices with one insert and add them to the tallies of the choices.
+
+        The choices are checked against the polls of the answers with two queries for all the answers, so callers
+        validating requests (see polls.serializers.PAnswerCreateSerializer) can not be bypassed by other writers.
+
+        Args:
+            selections: identifiers of the selected choices by answer identifier.
+
+        Raises:
+            ValidationError: When choices are not choices of the poll of their answer, or an answer selects
+                multiple choices of a poll not allowing multiple answers.
+
+        """
+        answers = {panswer_id: (poll_id, multiple_answers)
+                   for panswer_id, poll_id, multiple_answers in cls.objects
+                   .filter(pk__in=selections)
+                   .values_list('pk', 'poll_id', 'poll__configuration__multiple_answers')}
+        selected_ids = {choice_id for choice_ids in selections.values() for choice_id in choice_ids}
+        choice_polls = dict(Choice.objects.filter(pk__in=selected_ids).values_list('pk', 'poll_id'))
+        for panswer_id, choice_ids in selections.items():
+            poll_id, multiple_answers = answers.get(panswer_id, (None, False))
+            if len(set(choice_ids)) > 1 and not multiple_answers:
+                raise ValidationError(_('multiple answers are not allowed in this poll'))
+            wrong_choice_ids = [choice_id for choice_id in choice_ids if choice_polls.get(choice_id) != poll_id]
+            if poll_id is None or wrong_choice_ids:
+                raise ValidationError(_('%s are not choices of this poll') % wrong_choice_ids)
+        through = cls.selected_choice.through
+        through.objects.bulk_create([through(panswer_id=panswer_id, choice_id=choice_id)
+                                     for panswer_id, choice_ids in selections.items()
+                                     for choice_id in choice_ids])
+        ChoiceTally.add(Counter(choice_id for choice_ids in selections.values() for choice_id in choice_ids))
+
+
+class QuestionConfig(SharedConfig):
     """
     Model for configuration of interation type Question.
 
@@ -160,54 +416,449 @@ class QuestionConfig(models.Model):
 class Question(Interaction):
     """
     Model for Interaction type Question.
+
+    votes_count (int): Count of votes for the question, maintained when votes are created or deleted.
+    trending_score (float): Log of the sum of the weights of the votes, where a vote weights
+        2 ** ((vote date - TRENDING_EPOCH) / TRENDING_HALF_LIFE); maintained when votes are created or deleted.
+        Every weight decays at the same rate, so the ranking by this score is the ranking by votes with time decay
+        at any time and the score does not need to be recomputed as time passes. 0 when there are no votes.
+    rejected (bool): Indicate if a moderator rejected the question. Questions neither published nor rejected are
+        pending in the moderation queue.
+    """
+    configuration = models.ForeignKey(QuestionConfig, on_delete=models.PROTECT)
+    votes_count = models.PositiveIntegerField(_('votes count'), default=0, editable=False)
+    trending_score = models.FloatField(_('trending score'), default=0, editable=False)
+    rejected = models.BooleanField(_('is rejected'), default=False)
+
+    class Meta(Interaction.Meta):
+        indexes = Interaction.Meta.indexes + [
+            models.Index(fields=['watchit_uuid', 'votes_count', 'id'], name='question_watchit_top_idx'),
+            models.Index(fields=['watchit_uuid', 'trending_score', 'id'], name='question_watchit_trending_idx'),
+            # partial: only holds the questions pending moderation, a small part of the questions of an event
+            models.Index(fields=['watchit_uuid', 'creation_date', 'id'],
+                         condition=models.Q(published=False, rejected=False),
+                         name='question_moderation_idx'),
+        ]
+
+    @classmethod
+    def moderate(cls, watchit_uuid, question_ids: List[int], action: str) -> Tuple[List[int], List[int]]:
+        """
+        Apply a moderation action to questions of an event with one update.
+
+        Args:
+            watchit_uuid: identifier of the event.
+            question_ids: identifiers of the questions.
+            action: name of MODERATION_ACTIONS.
+
+        Returns: Identifiers of the questions updated, and identifiers not found in the event; questions already in
+            the state of the action are neither updated nor returned.
+
+        """
+        fields = MODERATION_ACTIONS[action]
+        with transaction.atomic():
+            states = cls.objects.select_for_update() \
+                .filter(watchit_uuid=watchit_uuid, pk__in=question_ids) \
+                .values_list('pk', *fields)
+            found_ids = set()
+            updated_ids = []
+            for question_id, *values in states:
+                found_ids.add(question_id)
+                if tuple(values) != tuple(fields.values()):
+                    updated_ids.append(question_id)
+            if updated_ids:
+                cls.objects.filter(pk__in=updated_ids).update(**fields)
+                # bulk updates do not send signals
+                Change.record(watchit_uuid, 'question', updated_ids, 'updated')
+        return sorted(updated_ids), sorted(set(question_ids) - found_ids)
+
+    @staticmethod
+    def trending_weight(date: datetime) -> float:
+        """ Retrieve the log of the weight of a vote made at a date in the trending score """
+        return (date - TRENDING_EPOCH).total_seconds() * math.log(2) / TRENDING_HALF_LIFE
+
+    @classmethod
+    def trending_score_with_vote(cls, date: datetime):
+        """
+        Build the expression of the trending score after adding a vote, log(exp(score) + exp(weight)) computed
+        without overflow.
+
+        Args:
+            date: creation date of the vote.
+
+        """
+        weight = Value(cls.trending_weight(date), output_field=models.FloatField())
+        score = F('trending_score')
+        return Case(When(votes_count=0, then=weight),
+                    default=Greatest(score, weight) + Ln(Value(1.0) + Exp(-Abs(score - weight))),
+                    output_field=models.FloatField(),
+                    )
+
+    @classmethod
+    def trending_score_without_votes(cls, weight: float, count: int):
+        """
+        Build the expression of the trending score after removing votes, log(exp(score) - exp(weight)).
+
+        Args:
+            weight: log of the sum of the weights of the votes removed.
+            count: count of votes removed.
+
+        """
+        weight = Value(weight, output_field=models.FloatField())
+        score = F('trending_score')
+        return Case(When(votes_count__lte=count, then=Value(0.0)),
+                    default=score + Ln(Greatest(Value(1.0) - Exp(weight - score), Value(TRENDING_MIN_FRACTION))),
+                    output_field=models.FloatField(),
+                    )
+
+    @classmethod
+    def refresh_vote_scores(cls, question_ids: List[int]):
+        """ Compute votes count and trending score of questions from their votes """
+        weights = defaultdict(list)
+        for question_id, creation_date in QVote.objects.filter(question_id__in=question_ids) \
+                .values_list('question_id', 'creation_date'):
+            weights[question_id].append(cls.trending_weight(creation_date))
+        for question_id in question_ids:
+            question_weights = weights.get(question_id, [])
+            trending_score = 0.0
+            if question_weights:
+                top_weight = max(question_weights)
+                trending_score = top_weight + math.log(sum(math.exp(weight - top_weight)
+                                                           for weight in question_weights))
+            cls.objects.filter(pk=question_id).update(votes_count=len(question_weights), trending_score=trending_score)
+
+    @classmethod
+    def merge(cls, question, duplicate_ids: List[int]) -> int:
+        """
+        Merge duplicates into a question.
+
+        Votes and answers of the duplicates are moved to the question with bulk updates (a user keeps one vote: votes
+        of users that already voted the question are dropped, and so are all but the first vote of users that voted
+        several duplicates), its scores are computed again and the duplicates are deleted.
+
+        Args:
+            question: question kept.
+            duplicate_ids: identifiers of the questions merged into it, of the same event.
+
+        Returns: The count of votes moved.
+
+        """
+        with transaction.atomic():
+            # take the write locks of the questions first, as QVote.toggle does, so votes toggled meanwhile wait
+            cls.objects.filter(pk__in=[question.pk, *duplicate_ids]).update(votes_count=F('votes_count'))
+            duplicate_votes = QVote.objects.filter(question_id__in=duplicate_ids)
+            first_vote_ids = duplicate_votes.order_by() \
+                .values('user_id') \
+                .annotate(first_id=Min('pk')) \
+                .values('first_id')
+            duplicate_votes.filter(models.Q(user_id__in=QVote.objects.filter(question=question).values('user_id'))
+                                   | ~models.Q(pk__in=first_vote_ids)).delete()
+            moved_votes = duplicate_votes.update(question=question)
+            answer_ids = list(QAnswer.objects.filter(question_id__in=duplicate_ids).values_list('id', flat=True))
+            QAnswer.objects.filter(id__in=answer_ids).update(question=question)
+            cls.refresh_vote_scores([question.pk])
+            # bulk updates do not send signals
+            Change.record(question.watchit_uuid, 'question', [question.pk], 'updated')
+            Change.record(question.watchit_uuid, 'answer', answer_ids, 'updated')
+            cls.objects.filter(pk__in=duplicate_ids).delete()
+        question.refresh_from_db(fields=['votes_count', 'trending_score'])
+        return moved_votes
+
+
+class QuestionBucket(models.Model):
     """
-    configuration = models.ForeignKey(QuestionConfig, on_delete=models.CASCADE)
+    Model for LSH buckets of questions, the index of near-duplicate questions of an event.
+
+    Every question has a bucket per band (see polls_and_questions.similarity), so likely duplicates of a text are
+    found with one index lookup per band instead of comparing with every question of the event.
+
+    question (Question): Question in the bucket.
+    watchit_uuid (UUID): The watchit identifier of the question.
+    band (int): Band of the MinHash signature.
+    bucket (int): Hash of the values of the band.
+
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='buckets')
+    watchit_uuid = models.UUIDField('event identifier')
+    band = models.PositiveSmallIntegerField(_('band'))
+    bucket = models.BigIntegerField(_('bucket'))
+
+    class Meta:
+        verbose_name = _('question bucket')
+        unique_together = ('question', 'band')
+        indexes = [models.Index(fields=['watchit_uuid', 'band', 'bucket'], name='qbucket_lookup_idx')]
+
+    @classmethod
+    def index(cls, questions: list):
+        """
+        Put questions in the buckets of their texts; questions already in them are not written.
+
+        Args:
+            questions: questions created or updated.
+
+        """
+        buckets = {question.pk: similarity.band_buckets(question.question) for question in questions}
+        current = defaultdict(list)
+        for question_id, band, bucket in cls.objects.filter(question_id__in=list(buckets)) \
+                .order_by('band').values_list('question_id', 'band', 'bucket'):
+            current[question_id].append(bucket)
+        changed = [question for question in questions if current.get(question.pk, []) != buckets[question.pk]]
+        if not changed:
+            return
+        cls.objects.filter(question_id__in=[question.pk for question in changed]).delete()
+        cls.objects.bulk_create([cls(question_id=question.pk,
+                                     watchit_uuid=question.watchit_uuid,
+                                     band=band,
+                                     bucket=bucket,
+                                     )
+                                 for question in changed
+                                 for band, bucket in enumerate(buckets[question.pk])])
+
+    @classmethod
+    def likely_duplicates(cls, watchit_uuid, text: str, exclude_id: int = None, published_only: bool = False,
+                          limit: int = 5) -> List[Tuple[Question, float]]:
+        """
+        Retrieve the questions of an event likely to be duplicates of a text.
+
+        Args:
+            watchit_uuid: identifier of the event.
+            text: text of the question.
+            exclude_id: identifier of a question not returned, e.g. the question of the text.
+            published_only: when True only published questions are returned.
+            limit: maximum count of questions returned.
+
+        Returns: List of (question, similarity) tuples, most similar first.
+
+        """
+        buckets = similarity.band_buckets(text)
+        if not buckets:
+            return []
+        in_buckets = models.Q()
+        for band, bucket in enumerate(buckets):
+            in_buckets |= models.Q(band=band, bucket=bucket)
+        candidate_ids = cls.objects \
+            .filter(in_buckets, watchit_uuid=watchit_uuid) \
+            .exclude(question_id=exclude_id) \
+            .values_list('question_id', flat=True) \
+            .distinct()[:DUPLICATE_MAX_CANDIDATES]
+        candidates = Question.objects.filter(pk__in=list(candidate_ids))
+        if published_only:
+            candidates = candidates.filter(published=True)
+        duplicates = [(candidate, similarity.similarity(text, candidate.question)) for candidate in candidates]
+        duplicates = [(candidate, score) for candidate, score in duplicates if score >= DUPLICATE_MIN_SIMILARITY]
+        return sorted(duplicates, key=lambda duplicate: (-duplicate[1], duplicate[0].pk))[:limit]
+
+
+class QAnswerQuerySet(models.QuerySet):
+
+    def delete(self):
+        """
+        Delete answers, record them as deleted with one insert and remove them from the search index in one batch.
+
+        This is done here instead of in delete signal receivers, which would stop Django from deleting in bulk the
+        answers of a deleted question; questions and users delete their answers through this queryset before being
+        deleted (see polls_and_questions.signals).
+        """
+        # the search module imports the models
+        from polls_and_questions.search import search_backend
+
+        with transaction.atomic():
+            answers = list(self.select_for_update().values_list('pk', 'question__watchit_uuid'))
+            answer_ids = [answer_id for answer_id, watchit_uuid in answers]
+            deleted = models.QuerySet.delete(self.model._base_manager.filter(pk__in=answer_ids))
+            Change.record_by_watchit('answer', answers, 'deleted')
+            search_backend.remove('answer', answer_ids)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
-    @property
-    def votes_count(self):
-        """ Retrieve count of votes for the question  """
-        return self.votes.count()
 
 class QAnswer(models.Model):
     """
     Model for Answer of Question.
 
-    
+    votes_count (int): Count of votes for the answer, maintained when votes are created or deleted.
     """
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='answers')
     creator = models.ForeignKey(InteractionUser, on_delete=models.CASCADE, )
     answer = models.CharField(_('answer'), max_length=256)
     creation_date = models.DateTimeField(_('creation_date'), auto_now=True)
+    votes_count = models.PositiveIntegerField(_('votes count'), default=0, editable=False)
+
+    objects = QAnswerQuerySet.as_manager()
 
     class Meta:
         verbose_name = _('question answer')
+        indexes = [models.Index(fields=['question', 'creation_date', 'id'], name='qanswer_question_created_idx')]
 
     def __str__(self):
         """ Unicode representation of Response to Question """
         return self.answer
 
-    @property
-    def votes_count(self):
-        """ Retrieve count of votes for the question  """
-        return self.votes.count()
+    def delete(self, using=None, keep_parents=False):
+        return type(self).objects.using(using).filter(pk=self.pk).delete()
+
+    @classmethod
+    def top_by_question(cls, question_ids: List[int], limit: int, ordering: tuple) -> Dict[int, Tuple[list, int]]:
+        """
+        Retrieve the first answers of each question of a list, and the count of answers of each question.
+
+        The answers are ranked with one windowed query for all the questions, and the ones selected are read with
+        their creators in a second query.
+
+        Args:
+            question_ids: identifiers of the questions.
+            limit: count of answers retrieved per question.
+            ordering: fields the answers are ranked by, e.g. ('-votes_count', '-id'); the last one must be unique.
+
+        Returns: The answers in order and the count of answers by question identifier; questions without answers
+            are not included.
+
+        """
+        if not question_ids:
+            return {}
+        order_by = [F(field[1:]).desc() if field.startswith('-') else F(field).asc() for field in ordering]
+        ranked = cls.objects \
+            .filter(question_id__in=question_ids) \
+            .annotate(answer_rank=Window(RowNumber(), partition_by=[F('question_id')], order_by=order_by),
+                      answers_total=Window(Count('id'), partition_by=[F('question_id')]),
+                      ) \
+            .order_by() \
+            .values('id', 'question_id', 'answer_rank', 'answers_total')
+        sql, params = ranked.query.sql_with_params()
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            # filtering on a window function needs an outer query; a limit of 0 still reads the first answer of
+            # every question to get its count
+            cursor.execute('SELECT %s, %s, %s, %s FROM (%s) ranked WHERE %s <= %%s' % (quote('id'),
+                                                                                    quote('question_id'),
+                                                                                    quote('answer_rank'),
+                                                                                    quote('answers_total'),
+                                                                                    sql,
+                                                                                    quote('answer_rank'),
+                                                                                    ),
+                           params + (max(limit, 1),))
+            rows = cursor.fetchall()
+        answers = cls.objects.select_related('creator__user').in_bulk(
+            [answer_id for answer_id, question_id, answer_rank, answers_total in rows if answer_rank <= limit])
+        top_answers = {}
+        for answer_id, question_id, answer_rank, answers_total in sorted(rows, key=lambda row: (row[1], row[2])):
+            question_answers, answers_count = top_answers.setdefault(question_id, ([], answers_total))
+            if answer_id in answers:
+                question_answers.append(answers[answer_id])
+        return top_answers
+
+
+class VoteQuerySet(models.QuerySet):
+
+    def delete(self):
+        """
+        Delete votes, update the votes counts of the voted objects and record them as updated (see
+        AbstractVote.votes_deleted).
+
+        This is done here instead of in delete signal receivers, which would stop Django from deleting in bulk the
+        votes of a deleted question or answer (whose counts are deleted with it anyway).
+        """
+        with transaction.atomic():
+            votes = list(self.select_for_update().values_list('pk', '%s_id' % self.model.voted_field, 'creation_date'))
+            deleted = models.QuerySet.delete(self.model._base_manager.filter(pk__in=[vote[0] for vote in votes]))
+            self.model.votes_deleted([vote[1:] for vote in votes])
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
 
 class AbstractVote(models.Model):
-    """ Abstract model for votes"""
+    """ Abstract model for votes
+
+    voted_field (str): Name of the field pointing to the voted object.
+    """
     user = models.ForeignKey(InteractionUser, on_delete=models.CASCADE)
     creation_date = models.DateTimeField(_('creation_date'), auto_now=True)
 
+    voted_field = None
+
     class Meta:
         abstract = True
 
+    objects = VoteQuerySet.as_manager()
+
+    def delete(self, using=None, keep_parents=False):
+        return type(self).objects.using(using).filter(pk=self.pk).delete()
+
+    @classmethod
+    def votes_deleted(cls, votes: List[Tuple[int, datetime]]):
+        """
+        Update the voted objects of deleted votes.
+
+        Args:
+            votes: list of (voted object identifier, vote creation date) tuples.
+
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def toggle(cls, voted, user: InteractionUser) -> Tuple[bool, int]:
+        """
+        Vote / remove vote of an user for an object.
+
+        In one transaction the vote is deleted and, only if nothing was deleted, it is created. If the same vote is
+        created concurrently by other way meanwhile, the transaction is retried and the vote is removed.
+
+        Args:
+            voted: the voted object.
+            user: the user voting.
+
+        Returns: The new voted state and the votes count of the voted object.
+
+        """
+        lookup = {cls.voted_field: voted, 'user': user}
+        voted_rows = type(voted).objects.filter(pk=voted.pk)
+        for attempt in range(TOGGLE_VOTE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    # take the write lock of the voted row first (its votes count is updated by this transaction
+                    # anyway): concurrent toggles are serialized and SQLite never has to upgrade a read lock.
+                    voted_rows.update(votes_count=F('votes_count'))
+                    deleted, _ = cls.objects.filter(**lookup).delete()
+                    is_voted = not deleted
+                    if is_voted:
+                        cls.objects.create(**lookup)
+                    votes_count = voted_rows.values_list('votes_count', flat=True).get()
+                voted.votes_count = votes_count
+                return is_voted, votes_count
+            except IntegrityError:
+                if attempt == TOGGLE_VOTE_ATTEMPTS - 1:
+                    raise
+
 
 class QVote(AbstractVote):
     """ Model for question vote """
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='votes')
 
+    voted_field = 'question'
+
     def __str__(self):
         return self.question.__str__()
 
+    @classmethod
+    def votes_deleted(cls, votes: List[Tuple[int, datetime]]):
+        weights = defaultdict(list)
+        for question_id, creation_date in votes:
+            weights[question_id].append(Question.trending_weight(creation_date))
+        # one update per question: the trending score removed depends on the dates of its votes
+        for question_id, question_weights in weights.items():
+            top_weight = max(question_weights)
+            weight = top_weight + math.log(sum(math.exp(value - top_weight) for value in question_weights))
+            Question.objects.filter(pk=question_id, votes_count__gte=len(question_weights)) \
+                .update(trending_score=Question.trending_score_without_votes(weight, len(question_weights)),
+                        votes_count=F('votes_count') - len(question_weights),
+                        )
+        Change.record_by_watchit('question',
+                                 Question.objects.filter(pk__in=list(weights)).values_list('pk', 'watchit_uuid'),
+                                 'updated')
+
     class Meta:
         verbose_name = _('question vote')
         unique_together = ('question', 'user')
@@ -217,6 +868,22 @@ class QAVote(AbstractVote):
     """ Model for question answer vote """
     answer = models.ForeignKey(QAnswer, on_delete=models.CASCADE, related_name='votes')
 
+    voted_field = 'answer'
+
+    @classmethod
+    def votes_deleted(cls, votes: List[Tuple[int, datetime]]):
+        counts = Counter(answer_id for answer_id, creation_date in votes)
+        answer_ids_by_count = defaultdict(list)
+        for answer_id, count in counts.items():
+            answer_ids_by_count[count].append(answer_id)
+        for count, answer_ids in answer_ids_by_count.items():
+            QAnswer.objects.filter(pk__in=answer_ids, votes_count__gte=count) \
+                .update(votes_count=F('votes_count') - count)
+        Change.record_by_watchit('answer',
+                                 QAnswer.objects.filter(pk__in=list(counts)).values_list('pk',
+                                                                                          'question__watchit_uuid'),
+                                 'updated')
+
     class Meta:
         verbose_name = _('answer vote')
         unique_together = ('answer', 'user')
@@ -249,3 +916,75 @@ class EventConfig(models.Model):
     def __str__(self):
         """ Unicode representation of EventConfig """
         return "%s" % self.watchit_uuid
+
+
+CHANGE_ENTITY_CHOICES = (('poll', _('poll')),
+                         ('question', _('question')),
+                         ('answer', _('question answer')),
+                         )
+
+CHANGE_ACTION_CHOICES = (('created', _('created')),
+                         ('updated', _('updated')),
+                         ('deleted', _('deleted')),
+                         )
+
+# seconds a change can take to be visible: transactions commit out of sequence order, so readers of the log do not
+# move their cursor past recent changes and read them again later
+CHANGES_SETTLE_TIME = 2
+
+
+class Change(models.Model):
+    """
+    Model for the log of changes of polls, questions and answers of events.
+
+    The identifier is the sequence of the change: it grows monotonically, so the changes of an event after a given
+    one are read with a range scan of (watchit_uuid, id).
+
+    watchit_uuid (UUID): The watchit identifier.
+    entity (str): Kind of the changed object.
+    object_id (int): Identifier of the changed object.
+    action (str): What happened to the object.
+    creation_date (DateTime): Date of the change.
+
+    """
+    watchit_uuid = models.UUIDField('event identifier')
+    entity = models.CharField(_('entity'), max_length=10, choices=CHANGE_ENTITY_CHOICES)
+    object_id = models.BigIntegerField(_('object identifier'))
+    action = models.CharField(_('action'), max_length=10, choices=CHANGE_ACTION_CHOICES)
+    creation_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('change')
+        indexes = [models.Index(fields=['watchit_uuid', 'id'], name='change_watchit_seq_idx')]
+
+    def __str__(self):
+        return "%s %s %s" % (self.entity, self.object_id, self.action)
+
+    @classmethod
+    def record(cls, watchit_uuid, entity: str, object_ids: List[int], action: str):
+        """
+        Record changes of objects of an event with one insert.
+
+        Args:
+            watchit_uuid: identifier of the event.
+            entity: kind of the changed objects (poll, question or answer).
+            object_ids: identifiers of the changed objects.
+            action: what happened to the objects (created, updated or deleted).
+
+        """
+        cls.objects.bulk_create([cls(watchit_uuid=watchit_uuid, entity=entity, object_id=object_id, action=action)
+                                 for object_id in object_ids])
+
+    @classmethod
+    def record_by_watchit(cls, entity: str, objects: List[Tuple[int, UUID]], action: str):
+        """
+        Record changes of objects of several events with one insert.
+
+        Args:
+            entity: kind of the changed objects (poll, question or answer).
+            objects: list of (object identifier, watchit identifier) tuples.
+            action: what happened to the objects (created, updated or deleted).
+
+        """
+        cls.objects.bulk_create([cls(watchit_uuid=watchit_uuid, entity=entity, object_id=object_id, action=action)
+                                 for object_id, watchit_uuid in objects])
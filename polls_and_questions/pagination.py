@@ -0,0 +1,190 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework import pagination
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Keyset (cursor) pagination.
+
+    Pages are read with a condition on the position of the last row of the previous page instead of an OFFSET, so
+    deep pages cost the same as the first one when an index matches the ordering. The ordering is taken from the
+    `ordering` attribute of the view (('-creation_date', '-id') by default) and its last field must be unique.
+    The total count is only computed when requested with `?count=true`.
+    """
+    page_size = api_settings.PAGE_SIZE or 10
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-creation_date', '-id')
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(getattr(view, 'ordering', None) or self.ordering)
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if self.count_requested(request) else None
+        position, self.reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.first, self.last = (rows[0], rows[-1]) if rows else (None, None)
+        return rows
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def count_requested(self, request) -> bool:
+        return request.query_params.get(self.count_query_param, '').lower() in TRUE_VALUES
+
+    @staticmethod
+    def after(ordering: tuple, position: list) -> Q:
+        """
+        Build the condition of the rows after a position in an ordering.
+
+        For ('-creation_date', '-id') and position (d, i) it is
+        `creation_date <= d AND (creation_date < d OR (creation_date = d AND id < i))`; the first term is redundant
+        but lets the database seek the index to the position instead of filtering from the start.
+        """
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = '%s__%s' % (name, 'lt' if field.startswith('-') else 'gt')
+            equal = {ordered.lstrip('-'): value for ordered, value in zip(ordering[:index], position)}
+            condition |= Q(**equal, **{lookup: position[index]})
+        first = ordering[0]
+        return Q(**{'%s__%s' % (first.lstrip('-'), 'lte' if first.startswith('-') else 'gte'): position[0]}) & condition
+
+    def decode_cursor(self, request, model) -> tuple:
+        """
+        Decode the cursor of a request.
+
+        Returns: The position (values of the ordering fields) or None, and if the page is before the position.
+
+        Raises:
+            NotFound: When the cursor is wrong.
+
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values, reverse = data['p'], bool(data.get('r'))
+            if len(values) != len(self.ordering):
+                raise ValueError()
+            position = [model._meta.get_field(field.lstrip('-')).to_python(value)
+                        for field, value in zip(self.ordering, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, obj, reverse: bool) -> str:
+        values = [obj._meta.get_field(field.lstrip('-')).value_to_string(obj) for field in self.ordering]
+        data = {'p': values, 'r': 1} if reverse else {'p': values}
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
+
+    def get_paginated_response(self, data):
+        content = [('next', self.get_next_link()),
+                   ('previous', self.get_previous_link()),
+                   ('results', data),
+                   ]
+        if self.count is not None:
+            content.insert(0, ('count', self.count))
+        return Response(OrderedDict(content))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [
+            coreapi.Field(name=self.cursor_query_param,
+                          required=False,
+                          location='query',
+                          schema=coreschema.String(title='Cursor',
+                                                   description='The pagination cursor value.'),
+                          ),
+            coreapi.Field(name=self.page_size_query_param,
+                          required=False,
+                          location='query',
+                          schema=coreschema.Integer(title='Limit',
+                                                    description='Number of results to return per page.'),
+                          ),
+            coreapi.Field(name=self.count_query_param,
+                          required=False,
+                          location='query',
+                          schema=coreschema.Boolean(title='Count',
+                                                    description='Include the total count of results.'),
+                          ),
+        ]
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param,
+             'required': False,
+             'in': 'query',
+             'description': 'The pagination cursor value.',
+             'schema': {'type': 'string'},
+             },
+            {'name': self.page_size_query_param,
+             'required': False,
+             'in': 'query',
+             'description': 'Number of results to return per page.',
+             'schema': {'type': 'integer'},
+             },
+            {'name': self.count_query_param,
+             'required': False,
+             'in': 'query',
+             'description': 'Include the total count of results.',
+             'schema': {'type': 'boolean'},
+             },
+        ]
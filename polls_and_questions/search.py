@@ -0,0 +1,162 @@
+import re
+from uuid import UUID
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from polls_and_questions.models import QAnswer, Question
+
+DEFAULT_SEARCH_CONFIG = {
+    'BACKEND': None,  # dotted path of a SearchBackend; by default SQLiteFTS5Backend on SQLite, LikeSearchBackend else
+}
+
+# entities indexed, with the model and the field with their text
+ENTITIES = {
+    'question': (Question, 'question'),
+    'answer': (QAnswer, 'answer'),
+}
+
+# words of a query; a word followed by `*` matches the words starting with it
+QUERY_TERM = re.compile(r'(\w+)(\*?)')
+
+# objects removed from an index per statement, below the limit of query parameters of SQLite
+REMOVE_CHUNK_SIZE = 500
+
+
+def parse_query(query: str) -> list:
+    """
+    Split a search query in terms.
+
+    Args:
+        query: text searched, e.g. `pric* plans`.
+
+    Returns: List of (word, is prefix) tuples; every term must match.
+
+    """
+    return [(word.lower(), bool(star)) for word, star in QUERY_TERM.findall(query)]
+
+
+class SearchBackend:
+    """
+    Base class of the full-text indexes of questions and answers.
+
+    Indexes are maintained incrementally when questions and answers are saved or deleted (see
+    polls_and_questions.signals, and QAnswerQuerySet.delete for answers); paths writing in bulk must call `index` and
+    `remove` themselves. The rebuild_search_index command fills an index from scratch.
+    """
+
+    def index(self, entity: str, rows: list):
+        """
+        Add or replace objects in the index.
+
+        Args:
+            entity: 'question' or 'answer'.
+            rows: list of (object identifier, watchit identifier, text) tuples.
+
+        """
+
+    def remove(self, entity: str, object_ids: list):
+        """ Remove objects from the index """
+
+    def clear(self):
+        """ Remove every object from the index """
+
+    def search(self, watchit_uuid: UUID, terms: list, entity: str, limit: int) -> list:
+        """
+        Search objects of an event.
+
+        Args:
+            watchit_uuid: identifier of the event.
+            terms: terms returned by parse_query.
+            entity: 'question' or 'answer'.
+            limit: maximum count of objects returned.
+
+        Returns: List of (object identifier, rank) tuples, best ranked first.
+
+        """
+        raise NotImplementedError()
+
+
+class LikeSearchBackend(SearchBackend):
+    """
+    Search backend without index: every term is looked up with a case insensitive LIKE on the rows of the event,
+    and results are ranked by votes. Meant for databases without a full-text backend and for small events.
+    """
+
+    def search(self, watchit_uuid: UUID, terms: list, entity: str, limit: int) -> list:
+        model, field = ENTITIES[entity]
+        queryset = model.objects.filter(**{'watchit_uuid' if model is Question else 'question__watchit_uuid':
+                                           watchit_uuid})
+        for word, prefix in terms:
+            queryset = queryset.filter(**{'%s__icontains' % field: word})
+        return [(object_id, float(votes_count))
+                for object_id, votes_count in queryset.order_by('-votes_count', '-id')
+                .values_list('id', 'votes_count')[:limit]]
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    Search backend on a SQLite FTS5 table, created by migration 0009_search_index.
+
+    Each row has the text of a question or answer and a `scope` token made of the entity and the watchit, so a
+    search only reads the posting lists of its event. The rowid is derived from the entity and the identifier of
+    the object (see `rowid`), so rows are replaced and removed without scanning the table. Results are ranked with
+    BM25 on the text.
+    """
+    table = 'polls_and_questions_search'
+
+    @staticmethod
+    def rowid(entity: str, object_id: int) -> int:
+        return object_id * len(ENTITIES) + list(ENTITIES).index(entity)
+
+    @staticmethod
+    def scope(entity: str, watchit_uuid) -> str:
+        return '%s%s' % (entity, UUID(str(watchit_uuid)).hex)
+
+    def index(self, entity: str, rows: list):
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % self.table,
+                               [(self.rowid(entity, object_id),) for object_id, watchit_uuid, text in rows])
+            cursor.executemany('INSERT INTO %s (rowid, text, scope) VALUES (%%s, %%s, %%s)' % self.table,
+                               [(self.rowid(entity, object_id), text, self.scope(entity, watchit_uuid))
+                                for object_id, watchit_uuid, text in rows])
+
+    def remove(self, entity: str, object_ids: list):
+        rowids = [self.rowid(entity, object_id) for object_id in object_ids]
+        with connection.cursor() as cursor:
+            for start in range(0, len(rowids), REMOVE_CHUNK_SIZE):
+                chunk = rowids[start:start + REMOVE_CHUNK_SIZE]
+                cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (self.table, ', '.join(['%s'] * len(chunk))),
+                               chunk)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % self.table)
+
+    def search(self, watchit_uuid: UUID, terms: list, entity: str, limit: int) -> list:
+        if not terms:
+            return []
+        # terms are made of word characters only, so they can be quoted as FTS5 strings
+        match = 'scope : "%s" AND text : (%s)' % (self.scope(entity, watchit_uuid),
+                                                  ' '.join('"%s"%s' % (word, '*' if prefix else '')
+                                                           for word, prefix in terms))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rowid, bm25(%s, 1.0, 0.0) AS score FROM %s WHERE %s MATCH %%s '
+                           'ORDER BY score LIMIT %%s' % (self.table, self.table, self.table),
+                           (match, limit))
+            # bm25 is lower for better matches
+            return [(rowid // len(ENTITIES), -score) for rowid, score in cursor.fetchall()]
+
+
+def get_search_backend(config: dict = None) -> SearchBackend:
+    """ Build the search backend configured in the SEARCH setting """
+    config = {**DEFAULT_SEARCH_CONFIG, **(config or {})}
+    if config['BACKEND']:
+        return import_string(config['BACKEND'])()
+    return SQLiteFTS5Backend() if connection.vendor == 'sqlite' else LikeSearchBackend()
+
+
+search_backend = get_search_backend(getattr(settings, 'SEARCH', None))
@@ -1,9 +1,22 @@
+from django.db.models import Manager
+from django.utils.translation import gettext_lazy as _
+from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from polls_and_questions import models
+from polls_and_questions.cache import event_config_cache
 from users.models import InteractionUser
 from users.serializers import InteractionUserSerializer
+from users.services import get_request_interaction_user
+
+# answers nested in each question, the rest are read from the answers endpoint
+TOP_ANSWERS_LIMIT = 3
+TOP_ANSWERS_MAX_LIMIT = 20
+TOP_ANSWERS_ORDERINGS = {
+    'top': ('-votes_count', '-id'),
+    'recent': ('-creation_date', '-id'),
+}
 
 
 class PollConfigModelSerializer(serializers.ModelSerializer):
@@ -11,7 +24,7 @@ class PollConfigModelSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.PollConfig
-        fields = '__all__'
+        exclude = ('content_hash',)
         read_only_flields = ('id',)
 
 
@@ -20,10 +33,50 @@ class QuestionConfigModelSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.QuestionConfig
-        fields = '__all__'
+        exclude = ('content_hash',)
         read_only_flields = ('id',)
 
 
+class DeletedChangesSerializer(serializers.Serializer):
+    polls = serializers.ListField(child=serializers.IntegerField())
+    questions = serializers.ListField(child=serializers.IntegerField())
+    answers = serializers.ListField(child=serializers.IntegerField())
+
+
+class ChangesSerializer(serializers.Serializer):
+    """ Serializer for changes of an event since a sequence """
+    cursor = serializers.IntegerField()
+    has_more = serializers.BooleanField()
+    retry_after = serializers.FloatField(help_text='Seconds until the changes not returned yet settle; 0 when all '
+                                                   'the changes read were returned')
+    polls = serializers.ListField(child=serializers.DictField())
+    questions = serializers.ListField(child=serializers.DictField())
+    answers = serializers.ListField(child=serializers.DictField())
+    deleted = DeletedChangesSerializer()
+
+
+class SearchResultsSerializer(serializers.Serializer):
+    """ Serializer for results of a search, best ranked first """
+    questions = serializers.ListField(child=serializers.DictField())
+    answers = serializers.ListField(child=serializers.DictField())
+
+
+class BootstrapVotesSerializer(serializers.Serializer):
+    answers = serializers.ListField(child=serializers.IntegerField(), help_text='Answers voted by the user')
+    polls = serializers.DictField(child=serializers.ListField(child=serializers.IntegerField()),
+                                  help_text='Choices selected by the user by poll')
+
+
+class BootstrapSerializer(serializers.Serializer):
+    """ Serializer for the initial state of an event """
+    cursor = serializers.IntegerField(help_text='`since` of the first request to the changes endpoint')
+    poll_configuration = PollConfigModelSerializer(allow_null=True)
+    question_configuration = QuestionConfigModelSerializer(allow_null=True)
+    polls = serializers.ListField(child=serializers.DictField())
+    questions = serializers.ListField(child=serializers.DictField())
+    votes = BootstrapVotesSerializer()
+
+
 # class PollModelSerializer(serializers.ModelSerializer):
 #     """
 #     Model serializer for Polls
@@ -84,7 +137,7 @@ class QAnswerDetailModelSerializer(serializers.ModelSerializer):
             request = self.context.get('request', None)
             if request.user:
                 try:
-                    interaction_user = InteractionUser.objects.get(user_id=request.user.id)
+                    interaction_user = get_request_interaction_user(request)
                     try:
                         models.QAVote.objects.get(user=interaction_user)
                         return True
@@ -102,32 +155,101 @@ class QAVoteModelSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+def get_top_answers(request, question_ids: list) -> dict:
+    """
+    Retrieve the top answers and the count of answers of questions, as selected by the `answers_limit` and
+    `answers_ordering` query params.
+
+    Returns: See QAnswer.top_by_question.
+
+    Raises:
+        ValidationError: When `answers_limit` or `answers_ordering` query params are wrong.
+
+    """
+    query_params = getattr(request, 'query_params', {})
+    try:
+        limit = int(query_params.get('answers_limit', TOP_ANSWERS_LIMIT))
+    except (TypeError, ValueError):
+        raise ValidationError({'answers_limit': _('a not negative integer is required')})
+    if limit < 0:
+        raise ValidationError({'answers_limit': _('a not negative integer is required')})
+    ordering = query_params.get('answers_ordering', 'top')
+    if ordering not in TOP_ANSWERS_ORDERINGS:
+        raise ValidationError({'answers_ordering': _('must be one of: %s') % ', '.join(TOP_ANSWERS_ORDERINGS)})
+    return models.QAnswer.top_by_question(question_ids,
+                                          limit=min(limit, TOP_ANSWERS_MAX_LIMIT),
+                                          ordering=TOP_ANSWERS_ORDERINGS[ordering],
+                                          )
+
+
+class TopAnswersListSerializer(serializers.ListSerializer):
+    """
+    List serializer that resolves the top answers of the questions of the whole list with one windowed query.
+    """
+
+    def to_representation(self, data):
+        objs = list(data.all() if isinstance(data, Manager) else data)
+        self.child.top_answers = self.child.get_top_answers(objs)
+        return super().to_representation(objs)
+
+
 class QuestionDetailModelSerializer(serializers.ModelSerializer):
+    """
+    Serializer for details of questions with their top answers.
+
+    Only the first answers of each question are nested, ranked by votes (`?answers_ordering=top`, default) or
+    newest first (`?answers_ordering=recent`), `?answers_limit=` of them (TOP_ANSWERS_LIMIT by default); the full
+    list of answers is read from the paginated answers endpoint.
+
+    Attributes:
+        top_answers (dict): Top answers and count of answers by question, resolved by TopAnswersListSerializer.
+
+    """
     voted = serializers.SerializerMethodField()
 
     configuration = QuestionConfigModelSerializer()
     creator = InteractionUserSerializer()
-    answers = QAnswerDetailModelSerializer(many=True)
+    answers = serializers.SerializerMethodField()
+    answers_count = serializers.SerializerMethodField()
+
+    top_answers = None
+
+    def get_top_answers(self, objs) -> dict:
+        """ Retrieve the top answers and the count of answers of questions, see get_top_answers """
+        return get_top_answers(self.context.get('request', None), [obj.pk for obj in objs])
+
+    def _get_question_answers(self, obj) -> tuple:
+        if self.top_answers is None:
+            self.top_answers = self.get_top_answers([obj])
+        return self.top_answers.get(obj.pk, ([], 0))
+
+    @swagger_serializer_method(serializer_or_field=QAnswerDetailModelSerializer(many=True))
+    def get_answers(self, obj) -> list:
+        """ Retrieve the top answers of the question """
+        answers, answers_count = self._get_question_answers(obj)
+        return QAnswerDetailModelSerializer(answers, many=True, context=self.context).data
+
+    @swagger_serializer_method(serializer_or_field=serializers.IntegerField())
+    def get_answers_count(self, obj) -> int:
+        """ Retrieve the count of answers of the question """
+        answers, answers_count = self._get_question_answers(obj)
+        return answers_count
 
     def get_voted(self, obj) -> bool:
         """"
         Check if the current user logged voted the question or not
         """
-        request = self.context.get('request', None)
-        if request.user:
-            try:
-                interaction_user = InteractionUser.objects.get(user_id=request.user.id)
-                try:
-                    models.QVote.objects.get(user=interaction_user)
-                    return True
-                except models.QVote.DoesNotExist:
-                    return False
-            except InteractionUser.DoesNotExist:
-                return False
-        return False
+        if hasattr(obj, 'voted'):
+            # annotated by the queryset of the view
+            return obj.voted
+        interaction_user = get_request_interaction_user(self.context.get('request', None))
+        if interaction_user is None:
+            return False
+        return models.QVote.objects.filter(question=obj, user=interaction_user).exists()
 
     class Meta:
         model = models.Question
+        list_serializer_class = TopAnswersListSerializer
         # fields = '__all__'
         fields = ('id',
                   'creator',
@@ -136,6 +258,7 @@ class QuestionDetailModelSerializer(serializers.ModelSerializer):
                   'question',
                   'voted',
                   'answers',
+                  'answers_count',
                   'votes_count',
                   'published',
                   'streaming',
@@ -174,8 +297,8 @@ class QuestionModelSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         configuration_data = validated_data.pop('configuration', None)
         if configuration_data:
-            question_config = instance.configuration
-            self.fields['configuration'].update(instance=question_config, validated_data=validated_data)
+            # configurations are shared: the question is pointed to the configuration with the new content
+            instance.configuration = instance.configuration.fork(**configuration_data)
         super().update(instance, validated_data)
         return instance
 
@@ -197,18 +320,16 @@ class QuestionCreateModelSerializer(serializers.ModelSerializer):
         configuration_data = validated_data.pop('configuration', None)
         configuration = None
         if configuration_data:
-            configuration = self.fields['configuration'].create(validated_data=configuration_data)
+            configuration = models.QuestionConfig.intern(**configuration_data)
         else:
             try:
-                event_config = models.EventConfig.objects.get(watchit_uuid=watchit_uuid)
+                event_config = event_config_cache.get(watchit_uuid)
+                if event_config is None:
+                    raise models.EventConfig.DoesNotExist()
                 default_question_configuration = event_config.default_questions_config
                 if default_question_configuration:
-                    configuration = models.QuestionConfig.objects.create(
-                        allow_audience_create_questions=default_question_configuration.allow_audience_create_questions,
-                        allow_audience_vote_questions=default_question_configuration.allow_audience_vote_questions,
-                        allow_audience_vote_answers=default_question_configuration.allow_audience_vote_answers,
-                        answers_privacy=default_question_configuration.answers_privacy,
-                    )
+                    # configurations are immutable, so the default is shared as is
+                    configuration = default_question_configuration
                 else:
                     raise ValidationError(
                         'define a default question configuration for this event or a custom question configuration for '
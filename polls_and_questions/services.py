@@ -1,8 +1,8 @@
 
-import requests
-
 from uuid import UUID
 
+from users.client import client
+
 # endpoint to get the users type SYSTEM from extern api
 SYSTEM_USER_DATA_ENDPOINT = "https://dev-wbe.watchity.net/rest-auth/user/"
 
@@ -15,7 +15,7 @@ def get_user_data(auth_token: str) -> dict:
         auth_token: authentication token for SYSTEM_USER_DATA_ENDPOINT
 
     Raises:
-        ConnectionError: when is not possible connect with DATA_ENDPOINTS
+        requests.exceptions.ConnectionError: when is not possible connect with DATA_ENDPOINTS
 
     Returns: A dict in json format with user data.
 
@@ -24,11 +24,7 @@ def get_user_data(auth_token: str) -> dict:
         'Authorization': auth_token,
         'Accept': 'application/json',
     }
-    try:
-        response = requests.get(SYSTEM_USER_DATA_ENDPOINT, headers=headers)
-        return response
-    except ConnectionError:
-        raise
+    return client.get(SYSTEM_USER_DATA_ENDPOINT, headers=headers)
 
 def check_watchit_uuid(watchit_uuid: UUID, auth_token: str = "Token 4407ea32f23737083ae3fffa702c18f5fd1a08ec",) -> bool:
     """
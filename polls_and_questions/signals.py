@@ -0,0 +1,192 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from polls_and_questions.cache import event_config_cache
+from polls_and_questions.search import search_backend
+from polls_and_questions.models import Change, Choice, ChoiceTally, EventConfig, PAnswer, Poll, PollConfig, QAnswer, \
+    QAVote, Question, QuestionBucket, QuestionConfig, QVote
+from users.models import InteractionUser
+
+
+@receiver(post_save, sender=QVote)
+def increment_question_votes_count(sender, instance, created, **kwargs):
+    """ Increment votes count and trending score of the question when a vote is created """
+    if created:
+        # trending_score goes first: its expression must read the votes count before the update on every backend
+        Question.objects.filter(pk=instance.question_id) \
+            .update(trending_score=Question.trending_score_with_vote(instance.creation_date),
+                    votes_count=F('votes_count') + 1,
+                    )
+
+
+@receiver(post_save, sender=QAVote)
+def increment_answer_votes_count(sender, instance, created, **kwargs):
+    """ Increment votes count of the answer when a vote is created """
+    if created:
+        QAnswer.objects.filter(pk=instance.answer_id).update(votes_count=F('votes_count') + 1)
+
+
+@receiver(m2m_changed, sender=PAnswer.selected_choice.through)
+def update_choice_tallies(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Update tallies of choices when selected choices of answers change """
+    if action == 'pre_clear':
+        if reverse:
+            ChoiceTally.objects.filter(choice_id=instance.pk).update(answers_count=0)
+        else:
+            ChoiceTally.add({choice_id: -1 for choice_id in instance.selected_choice.values_list('id', flat=True)})
+    elif action in ('post_add', 'post_remove') and pk_set:
+        sign = 1 if action == 'post_add' else -1
+        if reverse:
+            ChoiceTally.add({instance.pk: sign * len(pk_set)})
+        else:
+            ChoiceTally.add({choice_id: sign for choice_id in pk_set})
+
+
+@receiver(pre_delete, sender=InteractionUser)
+def remove_user_answers_and_votes(sender, instance, **kwargs):
+    """
+    Delete the answers and votes of users deleted in bulk, updating the tallies of their choices and the votes
+    counts of the voted objects, and recording the answers to questions as deleted
+    """
+    PAnswer.objects.filter(creator=instance).delete()
+    QVote.objects.filter(user=instance).delete()
+    QAVote.objects.filter(user=instance).delete()
+    QAnswer.objects.filter(creator=instance).delete()
+
+
+@receiver(pre_delete, sender=Question)
+def remove_question_answers(sender, instance, **kwargs):
+    """ Delete the answers of questions deleted in bulk, recording them as deleted """
+    QAnswer.objects.filter(question=instance).delete()
+
+
+def related_watchit_uuid(instance, field: str, lookup: str):
+    """
+    Retrieve the watchit of an object through one of its foreign keys, without a query when the related object is
+    already loaded.
+
+    Args:
+        instance: object with the foreign key.
+        field: name of the foreign key.
+        lookup: path from the related object to its watchit_uuid.
+
+    Returns: The watchit identifier or None if the related object does not exist.
+
+    """
+    if instance._meta.get_field(field).is_cached(instance) and '__' not in lookup:
+        return getattr(instance, field).watchit_uuid
+    related_model = instance._meta.get_field(field).related_model
+    return related_model.objects.filter(pk=getattr(instance, '%s_id' % field)).values_list(lookup, flat=True).first()
+
+
+@receiver(post_save, sender=Poll)
+@receiver(post_save, sender=Question)
+def record_interaction_saved(sender, instance, created, **kwargs):
+    """ Record polls and questions created or updated """
+    Change.record(instance.watchit_uuid,
+                  'poll' if sender is Poll else 'question',
+                  [instance.pk],
+                  'created' if created else 'updated',
+                  )
+
+
+@receiver(post_delete, sender=Poll)
+@receiver(post_delete, sender=Question)
+def record_interaction_deleted(sender, instance, **kwargs):
+    """ Record polls and questions deleted """
+    Change.record(instance.watchit_uuid, 'poll' if sender is Poll else 'question', [instance.pk], 'deleted')
+
+
+@receiver(post_save, sender=Choice)
+def record_choice_saved(sender, instance, **kwargs):
+    """ Record the poll of a choice created or updated as updated; deleted choices are recorded by their queryset """
+    watchit_uuid = related_watchit_uuid(instance, 'poll', 'watchit_uuid')
+    if watchit_uuid is not None:
+        Change.record(watchit_uuid, 'poll', [instance.poll_id], 'updated')
+
+
+@receiver(post_save, sender=QAnswer)
+def record_answer_saved(sender, instance, created, **kwargs):
+    """ Record answers to questions created or updated """
+    watchit_uuid = related_watchit_uuid(instance, 'question', 'watchit_uuid')
+    if watchit_uuid is not None:
+        Change.record(watchit_uuid, 'answer', [instance.pk], 'created' if created else 'updated')
+
+
+@receiver(post_save, sender=QVote)
+def record_question_vote_created(sender, instance, **kwargs):
+    """ Record the question of a vote created as updated; deleted votes are recorded by QVote.votes_deleted """
+    watchit_uuid = related_watchit_uuid(instance, 'question', 'watchit_uuid')
+    if watchit_uuid is not None:
+        Change.record(watchit_uuid, 'question', [instance.question_id], 'updated')
+
+
+@receiver(post_save, sender=QAVote)
+def record_answer_vote_created(sender, instance, **kwargs):
+    """ Record the answer of a vote created as updated; deleted votes are recorded by QAVote.votes_deleted """
+    watchit_uuid = related_watchit_uuid(instance, 'answer', 'question__watchit_uuid')
+    if watchit_uuid is not None:
+        Change.record(watchit_uuid, 'answer', [instance.answer_id], 'updated')
+
+
+@receiver(post_save, sender=Question)
+def index_question(sender, instance, **kwargs):
+    """ Add questions created or updated to the search index """
+    search_backend.index('question', [(instance.pk, instance.watchit_uuid, instance.question)])
+
+
+@receiver(post_save, sender=Question)
+def bucket_question(sender, instance, **kwargs):
+    """ Put questions created or updated in the buckets of the near-duplicates index """
+    QuestionBucket.index([instance])
+
+
+@receiver(post_delete, sender=Question)
+def unindex_question(sender, instance, **kwargs):
+    """ Remove questions deleted from the search index """
+    search_backend.remove('question', [instance.pk])
+
+
+@receiver(post_save, sender=QAnswer)
+def index_answer(sender, instance, **kwargs):
+    """ Add answers created or updated to the search index """
+    watchit_uuid = related_watchit_uuid(instance, 'question', 'watchit_uuid')
+    if watchit_uuid is not None:
+        search_backend.index('answer', [(instance.pk, watchit_uuid, instance.answer)])
+
+
+@receiver(post_save, sender=EventConfig)
+@receiver(post_delete, sender=EventConfig)
+def invalidate_event_config(sender, instance, **kwargs):
+    """ Remove event configs saved or deleted from the cache """
+    event_config_cache.invalidate(instance.watchit_uuid)
+
+
+def events_with_default_config(config) -> list:
+    """ Retrieve the watchits that use a poll or question configuration as default """
+    field = 'default_polls_config' if isinstance(config, PollConfig) else 'default_questions_config'
+    return list(EventConfig.objects.filter(**{field: config.pk}).values_list('watchit_uuid', flat=True))
+
+
+@receiver(post_save, sender=PollConfig)
+@receiver(post_save, sender=QuestionConfig)
+def invalidate_events_of_default_config_saved(sender, instance, created, **kwargs):
+    """ Remove from the cache the events that use a configuration saved as default """
+    if not created:
+        # a new configuration can not be the default of any event yet
+        event_config_cache.invalidate(*events_with_default_config(instance))
+
+
+@receiver(pre_delete, sender=PollConfig)
+@receiver(pre_delete, sender=QuestionConfig)
+def collect_events_of_default_config_deleted(sender, instance, **kwargs):
+    """ Keep the events that use a configuration as default before the references are set to null """
+    instance.default_of_events = events_with_default_config(instance)
+
+
+@receiver(post_delete, sender=PollConfig)
+@receiver(post_delete, sender=QuestionConfig)
+def invalidate_events_of_default_config_deleted(sender, instance, **kwargs):
+    """ Remove from the cache the events that used a configuration deleted as default """
+    event_config_cache.invalidate(*getattr(instance, 'default_of_events', []))
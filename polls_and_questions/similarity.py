@@ -0,0 +1,70 @@
+import hashlib
+import random
+import re
+
+# characters of the shingles of a normalized text
+SHINGLE_SIZE = 4
+# MinHash values of a text, split in LSH bands of BAND_SIZE values; two texts share the bucket of a band with
+# probability similarity ** BAND_SIZE, so they are candidates (share any bucket) from a Jaccard similarity of about
+# (1 / BANDS) ** (1 / BAND_SIZE) = 0.59
+BANDS = 8
+BAND_SIZE = 4
+MERSENNE_PRIME = (1 << 61) - 1
+
+WORD = re.compile(r'\w+')
+
+
+def build_permutations(count: int, seed: int) -> list:
+    """ Build the (a, b) coefficients of the hash functions a * x + b mod MERSENNE_PRIME of a MinHash """
+    generator = random.Random(seed)
+    return [(generator.randrange(1, MERSENNE_PRIME), generator.randrange(0, MERSENNE_PRIME)) for _ in range(count)]
+
+
+# fixed seed: buckets are stored, so every process must compute the same ones
+PERMUTATIONS = build_permutations(BANDS * BAND_SIZE, seed=5197)
+
+
+def shingles(text: str) -> set:
+    """ Retrieve the shingles of a text, ignoring case, punctuation and spacing """
+    normalized = ' '.join(WORD.findall(text.lower()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[index:index + SHINGLE_SIZE] for index in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def stable_hash(value: bytes) -> int:
+    """ 64 bits hash of a value, the same in every process """
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+
+def minhash(text_shingles: set) -> list:
+    """ Compute the MinHash signature of a set of shingles """
+    hashes = [stable_hash(shingle.encode('utf-8')) for shingle in text_shingles]
+    return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in PERMUTATIONS]
+
+
+def band_buckets(text: str) -> list:
+    """
+    Compute the LSH buckets of a text.
+
+    Returns: The bucket of each band, as signed 64 bits integers; empty when the text has no words.
+
+    """
+    text_shingles = shingles(text)
+    if not text_shingles:
+        return []
+    signature = minhash(text_shingles)
+    buckets = []
+    for band in range(BANDS):
+        values = signature[band * BAND_SIZE:(band + 1) * BAND_SIZE]
+        bucket = stable_hash(b''.join(value.to_bytes(8, 'big') for value in values))
+        buckets.append(bucket - (1 << 64) if bucket >= 1 << 63 else bucket)
+    return buckets
+
+
+def similarity(text: str, other_text: str) -> float:
+    """ Compute the Jaccard similarity of the shingles of two texts """
+    text_shingles, other_shingles = shingles(text), shingles(other_text)
+    if not text_shingles or not other_shingles:
+        return 0.0
+    return len(text_shingles & other_shingles) / len(text_shingles | other_shingles)
@@ -1,3 +1,675 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from polls_and_questions import models, search
+from polls_and_questions.cache import SHARED_CACHE_KEY, event_config_cache
+from polls_and_questions.live import EventHub, EventState
+from users.services import sync_interaction_user
+
+
+class QueryCountMixin:
+    """
+    Mixin for tests checking that an endpoint runs the same count of queries for a page with one row and for a full
+    page of `rows` rows.
+    """
+    rows = 10
+
+    def assert_queries_do_not_grow(self, url: str, add_row, params: dict = None):
+        """
+        Args:
+            url: url of the endpoint, requested with `self.client`.
+            add_row: callable adding a row to the page.
+            params: other query params of the requests.
+        """
+        params = {'limit': self.rows, **(params or {})}
+        # a first request fills the per process caches, e.g. of the event configuration
+        self.client.get(url)
+        add_row()
+        with CaptureQueriesContext(connection) as one_row_queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        for _ in range(self.rows - 1):
+            add_row()
+        with self.assertNumQueries(len(one_row_queries)):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+
+class SharedConfigAdminTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@watchity.invalid', 'admin'))
+
+    def test_configurations_are_read_only(self):
+        config = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+        url = '/admin/polls_and_questions/questionconfig/%s/change/' % config.pk
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.post(url, {'answers_privacy': 'ONLY_CREATOR', 'enabled': 'on'}).status_code, 403)
+        self.assertEqual(self.client.get('/admin/polls_and_questions/questionconfig/add/').status_code, 403)
+
+        config.refresh_from_db()
+        self.assertEqual(config.answers_privacy, 'EVERYONE')
+
+
+class SharedConfigTests(TestCase):
+
+    def test_intern_shares_rows_by_content(self):
+        config = models.PollConfig.intern(answers_privacy='EVERYONE')
+
+        self.assertEqual(models.PollConfig.intern(answers_privacy='EVERYONE', enabled=True).pk, config.pk)
+        self.assertNotEqual(models.PollConfig.intern(answers_privacy='EVERYONE', enabled=False).pk, config.pk)
+        self.assertEqual(models.PollConfig.objects.count(), 2)
+
+    def test_fork_copies_on_write(self):
+        config = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+
+        fork = config.fork(enabled=False)
+
+        config.refresh_from_db()
+        self.assertNotEqual(fork.pk, config.pk)
+        self.assertEqual(fork.content(), {**config.content(), 'enabled': False})
+        self.assertTrue(config.enabled)
+        self.assertEqual(fork.fork(enabled=True).pk, config.pk)
+
+
+class GCConfigsTests(TestCase):
+
+    def setUp(self):
+        self.creator = sync_interaction_user(username='speaker',
+                                             email='speaker@watchity.invalid',
+                                             screen_name='speaker',
+                                             user_type='SYSTEM',
+                                             )
+        self.poll_config = models.PollConfig.intern(answers_privacy='EVERYONE')
+        self.default_config = self.poll_config.fork(enabled=False)
+        self.question_config = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+        self.unreferenced = [self.poll_config.fork(multiple_answers=False),
+                             self.question_config.fork(enabled=False),
+                             ]
+        models.Poll.objects.create(watchit_uuid=uuid.uuid4(),
+                                   creator=self.creator,
+                                   question='poll',
+                                   configuration=self.poll_config,
+                                   )
+        models.Question.objects.create(watchit_uuid=uuid.uuid4(),
+                                       creator=self.creator,
+                                       question='question',
+                                       configuration=self.question_config,
+                                       )
+        models.EventConfig.objects.create(watchit_uuid=uuid.uuid4(), default_polls_config=self.default_config)
+
+    def gc(self, *args) -> str:
+        stdout = StringIO()
+        call_command('gc_configs', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_unreferenced_configurations_are_removed(self):
+        output = self.gc('--chunk-size', '1')
+
+        self.assertIn('poll config: 1 unreferenced rows removed', output)
+        self.assertIn('question config: 1 unreferenced rows removed', output)
+        self.assertEqual(set(models.PollConfig.objects.values_list('pk', flat=True)),
+                         {self.poll_config.pk, self.default_config.pk})
+        self.assertEqual(list(models.QuestionConfig.objects.values_list('pk', flat=True)), [self.question_config.pk])
+
+    def test_dry_run(self):
+        output = self.gc('--dry-run')
+
+        self.assertIn('poll config: 1 unreferenced rows\n', output)
+        self.assertEqual(models.PollConfig.objects.count(), 3)
+
+    def test_configuration_referenced_after_select_is_kept(self):
+        config = self.unreferenced[0]
+        event_uuid = uuid.uuid4()
+        referenced = []
+
+        def reference_before_delete(execute, sql, params, many, context):
+            if sql.startswith('DELETE') and models.PollConfig._meta.db_table in sql and not referenced:
+                referenced.append(config.pk)
+                # an event takes the configuration as default after it was selected
+                models.EventConfig.objects.create(watchit_uuid=event_uuid, default_polls_config=config)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(reference_before_delete):
+            self.gc()
+
+        self.assertTrue(models.PollConfig.objects.filter(pk=config.pk).exists())
+        self.assertEqual(models.EventConfig.objects.get(watchit_uuid=event_uuid).default_polls_config_id, config.pk)
+        self.assertFalse(models.QuestionConfig.objects.filter(pk=self.unreferenced[1].pk).exists())
+
+
+class EventConfigCacheTests(TestCase):
+
+    def setUp(self):
+        event_config_cache.clear()
+        self.addCleanup(event_config_cache.clear)
+        self.poll_config = models.PollConfig.intern(answers_privacy='EVERYONE')
+        self.question_config = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+        self.event_config = models.EventConfig.objects.create(watchit_uuid=uuid.uuid4(),
+                                                              default_polls_config=self.poll_config,
+                                                              default_questions_config=self.question_config,
+                                                              )
+
+    def cached(self):
+        """ Fill the cache with the event config and retrieve it """
+        event_config_cache.get(self.event_config.watchit_uuid)
+        with self.assertNumQueries(0):
+            return event_config_cache.get(self.event_config.watchit_uuid)
+
+    def test_event_config_saved(self):
+        self.cached()
+
+        self.event_config.default_polls_config = None
+        self.event_config.save()
+
+        self.assertIsNone(self.cached().default_polls_config)
+
+    def test_event_config_deleted(self):
+        self.cached()
+        watchit_uuid = self.event_config.watchit_uuid
+
+        self.event_config.delete()
+
+        self.assertIsNone(event_config_cache.get(watchit_uuid))
+
+    def test_default_configuration_saved(self):
+        self.assertTrue(self.cached().default_polls_config.multiple_answers)
+
+        self.poll_config.multiple_answers = False
+        self.poll_config.save()
+
+        self.assertFalse(self.cached().default_polls_config.multiple_answers)
+
+    def test_default_configuration_deleted(self):
+        self.cached()
+
+        self.question_config.delete()
+
+        event_config = self.cached()
+        self.assertIsNone(event_config.default_questions_config)
+        self.assertEqual(event_config.default_polls_config, self.poll_config)
+
+    def test_invalidated_again_on_commit(self):
+        key = event_config_cache.key(self.event_config.watchit_uuid)
+        with mock.patch.object(event_config_cache, 'shared_cache', 'default'):
+            self.cached()
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.event_config.default_polls_config = None
+                self.event_config.save()
+                # a request running before the commit caches the state before the change
+                stale = models.EventConfig.objects.get(pk=self.event_config.pk)
+                stale.default_polls_config = self.poll_config
+                event_config_cache.local.set(key, stale)
+                event_config_cache.shared.set(SHARED_CACHE_KEY % key, stale)
+
+            self.assertEqual(len(callbacks), 1)
+            self.assertIsNone(event_config_cache.shared.get(SHARED_CACHE_KEY % key))
+            self.assertIsNone(self.cached().default_polls_config)
+
+
+class ChangeListTests(TestCase):
+
+    def setUp(self):
+        participant = sync_interaction_user(username='participant',
+                                            email='participant@watchity.invalid',
+                                            screen_name='participant',
+                                            user_type='PARTICIPANT',
+                                            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=participant.user)
+        self.watchit_uuid = uuid.uuid4()
+        self.url = '/api/watchit/%s/playersettings/%s/changes/' % (self.watchit_uuid, uuid.uuid4())
+        # changes of deleted questions, enough for the test
+        models.Change.record(self.watchit_uuid, 'question', [1, 2, 3], 'deleted')
+        self.change_ids = list(models.Change.objects.order_by('id').values_list('id', flat=True))
+
+    def settle(self, change_ids: list):
+        models.Change.objects.filter(id__in=change_ids) \
+            .update(creation_date=timezone.now() - timedelta(seconds=models.CHANGES_SETTLE_TIME + 1))
+
+    def get(self, since: int, limit: int) -> dict:
+        response = self.client.get(self.url, {'since': since, 'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_settled_pages(self):
+        self.settle(self.change_ids)
+
+        page = self.get(0, 2)
+        self.assertEqual((page['cursor'], page['has_more'], page['retry_after']), (self.change_ids[1], True, 0))
+        self.assertEqual(page['deleted']['questions'], [1, 2])
+        page = self.get(page['cursor'], 2)
+        self.assertEqual((page['cursor'], page['has_more'], page['retry_after']), (self.change_ids[2], False, 0))
+
+    def test_unsettled_change_stops_the_page(self):
+        self.settle(self.change_ids[:1])
+
+        page = self.get(0, 2)
+
+        self.assertEqual(page['cursor'], self.change_ids[0])
+        # the next page can not move until the second change settles, so clients wait instead of polling again
+        self.assertFalse(page['has_more'])
+        self.assertGreater(page['retry_after'], 0)
+        self.assertLessEqual(page['retry_after'], models.CHANGES_SETTLE_TIME)
+
+    def test_unsettled_first_change(self):
+        page = self.get(0, 2)
+
+        self.assertEqual((page['cursor'], page['has_more']), (0, False))
+        self.assertGreater(page['retry_after'], 0)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        speaker = sync_interaction_user(username='speaker',
+                                        email='speaker@watchity.invalid',
+                                        screen_name='speaker',
+                                        user_type='SYSTEM',
+                                        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=speaker.user)
+        watchit_uuid = uuid.uuid4()
+        self.url = '/api/watchit/%s/playersettings/%s/question/' % (watchit_uuid, uuid.uuid4())
+        configuration = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+        self.questions = [models.Question.objects.create(watchit_uuid=watchit_uuid,
+                                                         creator=speaker,
+                                                         question=str(index),
+                                                         configuration=configuration,
+                                                         )
+                          for index in range(5)]
+        # ties on the first ordering field cross the page boundaries
+        for question, votes_count in zip(self.questions, (1, 2, 1, 1, 0)):
+            models.Question.objects.filter(pk=question.pk).update(votes_count=votes_count)
+        models.Question.objects.update(creation_date=self.questions[0].creation_date)
+
+    def get(self, url: str, params: dict = None, status_code: int = 200):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status_code)
+        return response.data
+
+    def walk(self, params: dict) -> list:
+        """ Retrieve the ids of each page following the next links """
+        pages = []
+        page = self.get(self.url, {'limit': 2, **params})
+        self.assertIsNone(page['previous'])
+        while True:
+            pages.append([question['id'] for question in page['results']])
+            if page['next'] is None:
+                return pages
+            page = self.get(page['next'])
+
+    def test_pages_follow_the_ordering(self):
+        ids = [question.pk for question in self.questions]
+
+        self.assertEqual(self.walk({}), [ids[0:2], ids[2:4], ids[4:]])
+        self.assertEqual(self.walk({'ordering': 'top'}), [[ids[1], ids[3]], [ids[2], ids[0]], [ids[4]]])
+
+    def test_previous_page(self):
+        first = self.get(self.url, {'limit': 2, 'ordering': 'top'})
+        second = self.get(first['next'])
+        third = self.get(second['next'])
+
+        previous = self.get(third['previous'])
+        self.assertEqual(previous['results'], second['results'])
+        self.assertEqual(self.get(previous['next'])['results'], third['results'])
+        first_again = self.get(previous['previous'])
+        self.assertEqual(first_again['results'], first['results'])
+        self.assertIsNone(first_again['previous'])
+
+    def test_count_is_opt_in(self):
+        self.assertNotIn('count', self.get(self.url, {'limit': 2}))
+        self.assertEqual(self.get(self.url, {'limit': 2, 'count': 'true'})['count'], 5)
+
+    def test_wrong_cursors(self):
+        def encode(data) -> str:
+            return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+        for cursor in ('not a cursor', encode({'p': [1]}), encode({'p': ['many', 'votes']}), encode([1, 2])):
+            with self.subTest(cursor=cursor):
+                self.get(self.url, {'ordering': 'top', 'cursor': cursor}, status_code=404)
+
+    def test_unknown_ordering(self):
+        self.get(self.url, {'ordering': 'question'}, status_code=400)
+
+
+class ReconcileVoteCountsTests(TestCase):
+
+    def setUp(self):
+        speaker = sync_interaction_user(username='speaker',
+                                        email='speaker@watchity.invalid',
+                                        screen_name='speaker',
+                                        user_type='SYSTEM',
+                                        )
+        self.question = models.Question.objects.create(watchit_uuid=uuid.uuid4(),
+                                                       creator=speaker,
+                                                       question='question',
+                                                       configuration=models.QuestionConfig.intern(
+                                                           answers_privacy='EVERYONE'),
+                                                       )
+        self.answer = models.QAnswer.objects.create(question=self.question, creator=speaker, answer='answer')
+        models.QVote.toggle(self.question, speaker)
+        models.QAVote.toggle(self.answer, speaker)
+        self.question.refresh_from_db()
+        self.trending_score = self.question.trending_score
+        # drift, e.g. by a bulk write that skipped the signals
+        models.Question.objects.update(votes_count=5, trending_score=100)
+        models.QAnswer.objects.update(votes_count=3)
+
+    def reconcile(self, *args) -> str:
+        stdout = StringIO()
+        call_command('reconcile_vote_counts', *args, stdout=stdout)
+        self.question.refresh_from_db()
+        self.answer.refresh_from_db()
+        return stdout.getvalue()
+
+    def test_drift_is_fixed(self):
+        output = self.reconcile()
+
+        self.assertIn('question: 1 rows with drift fixed', output)
+        self.assertEqual(self.question.votes_count, 1)
+        self.assertAlmostEqual(self.question.trending_score, self.trending_score)
+        self.assertEqual(self.answer.votes_count, 1)
+
+    def test_dry_run(self):
+        output = self.reconcile('--dry-run')
+
+        self.assertIn('question answer: 1 rows with drift\n', output)
+        self.assertEqual((self.question.votes_count, self.question.trending_score), (5, 100))
+        self.assertEqual(self.answer.votes_count, 3)
+
+
+class ParseQueryTests(SimpleTestCase):
+
+    def test_terms(self):
+        self.assertEqual(search.parse_query('Pric* plans, 2023?'), [('pric', True), ('plans', False), ('2023', False)])
+
+    def test_query_without_words(self):
+        self.assertEqual(search.parse_query(' *?! '), [])
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.creator = sync_interaction_user(username='speaker',
+                                             email='speaker@watchity.invalid',
+                                             screen_name='speaker',
+                                             user_type='SYSTEM',
+                                             )
+        self.watchit_uuid = uuid.uuid4()
+        self.question = self.create_question('What are the pricing plans?')
+        self.answer = models.QAnswer.objects.create(question=self.question,
+                                                    creator=self.creator,
+                                                    answer='Prices start at ten euros',
+                                                    )
+
+    def create_question(self, text: str, watchit_uuid=None) -> models.Question:
+        return models.Question.objects.create(watchit_uuid=watchit_uuid or self.watchit_uuid,
+                                              creator=self.creator,
+                                              question=text,
+                                              published=True,
+                                              configuration=models.QuestionConfig.intern(answers_privacy='EVERYONE'),
+                                              )
+
+    def search(self, query: str, entity: str, watchit_uuid=None) -> list:
+        results = search.search_backend.search(watchit_uuid or self.watchit_uuid, search.parse_query(query), entity, 10)
+        return [object_id for object_id, rank in results]
+
+    def test_created_objects_are_indexed(self):
+        self.assertEqual(self.search('pricing', 'question'), [self.question.pk])
+        self.assertEqual(self.search('pric*', 'answer'), [self.answer.pk])
+        self.assertEqual(self.search('pric* free', 'question'), [])
+
+    def test_objects_of_other_events_are_not_found(self):
+        self.create_question('Pricing of the other event', watchit_uuid=uuid.uuid4())
+
+        self.assertEqual(self.search('pricing', 'question'), [self.question.pk])
+        self.assertEqual(self.search('pricing', 'question', watchit_uuid=uuid.uuid4()), [])
+
+    def test_updated_objects_are_indexed_again(self):
+        self.question.question = 'Is there a free trial?'
+        self.question.save()
+
+        self.assertEqual(self.search('pricing', 'question'), [])
+        self.assertEqual(self.search('trial', 'question'), [self.question.pk])
+
+    def test_deleted_objects_are_removed(self):
+        other_answer = models.QAnswer.objects.create(question=self.question, creator=self.creator, answer='Prices vary')
+        other_answer.delete()
+        self.assertEqual(self.search('prices', 'answer'), [self.answer.pk])
+
+        self.question.delete()
+
+        self.assertEqual(self.search('pric*', 'question'), [])
+        self.assertEqual(self.search('pric*', 'answer'), [])
+
+    def test_remove_in_chunks(self):
+        backend = search.SQLiteFTS5Backend()
+        answers = [models.QAnswer.objects.create(question=self.question, creator=self.creator, answer='Prices vary')
+                   for _ in range(4)]
+
+        with mock.patch('polls_and_questions.search.REMOVE_CHUNK_SIZE', 3):
+            backend.remove('answer', [answer.pk for answer in answers])
+
+        self.assertEqual(self.search('prices', 'answer'), [self.answer.pk])
+        # rowids of questions and answers do not collide
+        self.assertEqual(self.search('pricing', 'question'), [self.question.pk])
+
+    def test_rebuild_search_index(self):
+        search.search_backend.clear()
+        self.assertEqual(self.search('pric*', 'question'), [])
+
+        stdout = StringIO()
+        call_command('rebuild_search_index', chunk_size=1, stdout=stdout)
+
+        self.assertIn('question: 1 rows indexed', stdout.getvalue())
+        self.assertEqual(self.search('pric*', 'question'), [self.question.pk])
+        self.assertEqual(self.search('pric*', 'answer'), [self.answer.pk])
+
+    def test_search_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(user=self.creator.user)
+        url = '/api/watchit/%s/playersettings/%s/search/' % (self.watchit_uuid, uuid.uuid4())
+
+        response = client.get(url, {'q': 'pric*'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['id'] for result in response.data['questions']], [self.question.pk])
+        self.assertEqual([result['id'] for result in response.data['answers']], [self.answer.pk])
+        self.assertIn('rank', response.data['questions'][0])
+
+        response = client.get(url, {'q': 'pric*', 'type': 'answer'})
+        self.assertEqual((response.data['questions'], len(response.data['answers'])), ([], 1))
+
+        self.assertEqual(client.get(url, {'q': '*'}).status_code, 400)
+        self.assertEqual(client.get(url, {'q': 'pric*', 'type': 'poll'}).status_code, 400)
+
+
+class LiveEventMixin:
+
+    def create_event(self):
+        self.speaker = sync_interaction_user(username='speaker',
+                                             email='speaker@watchity.invalid',
+                                             screen_name='speaker',
+                                             user_type='SYSTEM',
+                                             )
+        self.watchit_uuid = uuid.uuid4()
+        self.poll = models.Poll.objects.create(watchit_uuid=self.watchit_uuid,
+                                               creator=self.speaker,
+                                               question='poll',
+                                               configuration=models.PollConfig.intern(answers_privacy='EVERYONE'),
+                                               )
+        self.choice = models.Choice.objects.create(poll=self.poll, choice='yes')
+        self.question = self.create_question()
+
+    def create_question(self) -> models.Question:
+        return models.Question.objects.create(watchit_uuid=self.watchit_uuid,
+                                              creator=self.speaker,
+                                              question='question',
+                                              published=True,
+                                              configuration=models.QuestionConfig.intern(answers_privacy='EVERYONE'),
+                                              )
+
+
+class EventStateTests(LiveEventMixin, TestCase):
+
+    def setUp(self):
+        # closing connections would break the transaction of the test
+        patcher = mock.patch('polls_and_questions.live.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.create_event()
+        self.state = EventState(self.watchit_uuid)
+        self.state.load()
+
+    def test_snapshot(self):
+        models.QAnswer.objects.create(question=self.question, creator=self.speaker, answer='answer')
+
+        self.assertEqual(self.state.snapshot_data(), {
+            'polls': [{'id': self.poll.pk, 'question': 'poll', 'published': False, 'choices': {self.choice.pk: 0}}],
+            'questions': [{'id': self.question.pk, 'question': 'question', 'published': True, 'votes_count': 0}],
+        })
+
+    def test_changes_are_sent_once(self):
+        self.poll.published = True
+        self.poll.save()
+        panswer = models.PAnswer.objects.create(poll=self.poll, creator=self.speaker)
+        models.PAnswer.select_choices({panswer.pk: [self.choice.pk]})
+        question = self.create_question()
+        models.QVote.toggle(self.question, self.speaker)
+        answer = models.QAnswer.objects.create(question=self.question, creator=self.speaker, answer='answer')
+        models.QAVote.toggle(answer, self.speaker)
+        deleted_answer = models.QAnswer.objects.create(question=self.question, creator=self.speaker, answer='answer')
+        deleted_answer.delete()
+
+        events = self.state.update()
+
+        self.assertEqual(events, [
+            ('poll.published', {'id': self.poll.pk, 'published': True}),
+            ('question.votes', {'id': self.question.pk, 'votes_count': 1}),
+            ('question.created', {'id': question.pk, 'question': 'question', 'published': True, 'votes_count': 0}),
+            ('answer.created', {'id': answer.pk, 'question_id': self.question.pk, 'answer': 'answer',
+                                'votes_count': 1}),
+            ('answer.deleted', {'id': deleted_answer.pk}),
+            ('poll.tally', {'id': self.poll.pk, 'choices': {self.choice.pk: 1}, 'selections_count': 1}),
+        ])
+        # changes not settled yet are read again, but not sent again
+        self.assertEqual(self.state.update(), [])
+
+        question_id = question.pk
+        question.delete()
+        self.assertEqual(self.state.update(), [('question.deleted', {'id': question_id})])
+        self.assertNotIn(question_id, self.state.questions)
+
+    def test_update_queries_do_not_grow_with_event(self):
+        for _ in range(10):
+            question = self.create_question()
+            models.QAnswer.objects.create(question=question, creator=self.speaker, answer='answer')
+        self.state.update()
+
+        # only the changes and the tallies are read
+        with self.assertNumQueries(2):
+            self.assertEqual(self.state.update(), [])
+
+
+class EventProducerTests(LiveEventMixin, TransactionTestCase):
+    """ The producer reads the event from other threads, each one with its own connection """
+
+    def test_changes_are_sent_to_every_subscriber(self):
+        self.create_event()
+
+        async def receive(subscriber) -> tuple:
+            message = (await asyncio.wait_for(subscriber.queue.get(), timeout=5)).decode()
+            fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+            return fields['event'], json.loads(fields['data'])
+
+        async def subscribe_and_vote():
+            hub = EventHub({'POLL_INTERVAL': 0.01})
+            subscribers = [hub.subscribe(self.watchit_uuid)[1] for _ in range(2)]
+            snapshots = [await receive(subscriber) for subscriber in subscribers]
+            await sync_to_async(models.QVote.toggle, thread_sensitive=False)(self.question, self.speaker)
+            messages = [await receive(subscriber) for subscriber in subscribers]
+            for subscriber in subscribers:
+                hub.producers[self.watchit_uuid].unsubscribe(subscriber)
+            return snapshots, messages
+
+        snapshots, messages = asyncio.run(subscribe_and_vote())
+
+        for event, data in snapshots:
+            self.assertEqual(event, 'snapshot')
+            self.assertEqual([question['id'] for question in data['questions']], [self.question.pk])
+        self.assertEqual(messages, [('question.votes', {'id': self.question.pk, 'votes_count': 1})] * 2)
+
+    def test_failed_snapshot_disconnects_subscribers(self):
+        async def subscribe_while_snapshots_fail():
+            hub = EventHub({'POLL_INTERVAL': 0.01})
+            with mock.patch('polls_and_questions.live.EventState.load', side_effect=RuntimeError('database is down')):
+                producer, subscriber = hub.subscribe(uuid.uuid4())
+                message = await asyncio.wait_for(subscriber.queue.get(), timeout=5)
+            return hub, message
+
+        with self.assertLogs('polls_and_questions.live', 'ERROR'):
+            hub, message = asyncio.run(subscribe_while_snapshots_fail())
+
+        # None disconnects the client, so it reconnects to a new producer
+        self.assertIsNone(message)
+        self.assertEqual(hub.producers, {})
+
+
+class EventQueryCountTests(QueryCountMixin, TestCase):
+
+    def setUp(self):
+        self.participant = sync_interaction_user(username='participant',
+                                                 email='participant@watchity.invalid',
+                                                 screen_name='participant',
+                                                 user_type='PARTICIPANT',
+                                                 )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.participant.user)
+        self.watchit_uuid = uuid.uuid4()
+        self.base = '/api/watchit/%s/playersettings/%s/' % (self.watchit_uuid, uuid.uuid4())
+        self.poll_config = models.PollConfig.intern(answers_privacy='EVERYONE')
+        self.question_config = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+
+    def add_poll_and_question(self):
+        """ Add a published poll answered by the participant and a published question voted and answered """
+        poll = models.Poll.objects.create(watchit_uuid=self.watchit_uuid,
+                                          creator=self.participant,
+                                          question='poll',
+                                          published=True,
+                                          configuration=self.poll_config,
+                                          )
+        choices = models.Choice.objects.bulk_create([models.Choice(poll=poll, choice=str(index))
+                                                     for index in range(3)])
+        panswer = models.PAnswer.objects.create(poll=poll, creator=self.participant)
+        models.PAnswer.select_choices({panswer.pk: [choices[0].pk]})
+        question = models.Question.objects.create(watchit_uuid=self.watchit_uuid,
+                                                  creator=self.participant,
+                                                  question='question',
+                                                  published=True,
+                                                  configuration=self.question_config,
+                                                  )
+        models.QVote.objects.create(question=question, user=self.participant)
+        answer = models.QAnswer.objects.create(question=question, creator=self.participant, answer='answer')
+        models.QAVote.objects.create(answer=answer, user=self.participant)
+
+    def test_changes(self):
+        self.assert_queries_do_not_grow(self.base + 'changes/', self.add_poll_and_question)
+
+    def test_bootstrap(self):
+        self.assert_queries_do_not_grow(self.base + 'bootstrap/', self.add_poll_and_question)
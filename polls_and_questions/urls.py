@@ -9,5 +9,8 @@ urlpatterns = [
 
     path('watchit/<uuid:watchit_uuid>/playersettings/<uuid:playersettings_uuid>/poll/configuration/', views.DefaultConfigPollManagerApiView.as_view()),
     path('watchit/<uuid:watchit_uuid>/playersettings/<uuid:playersettings_uuid>/qa/configuration/', views.DefaultConfigQuestionManagerApiView.as_view()),
+    path('watchit/<uuid:watchit_uuid>/playersettings/<uuid:playersettings_uuid>/changes/', views.ChangeListApiView.as_view()),
+    path('watchit/<uuid:watchit_uuid>/playersettings/<uuid:playersettings_uuid>/bootstrap/', views.BootstrapApiView.as_view()),
+    path('watchit/<uuid:watchit_uuid>/playersettings/<uuid:playersettings_uuid>/search/', views.SearchApiView.as_view()),
 
 ]
\ No newline at end of file
@@ -1,7 +1,12 @@
+from datetime import timedelta
 from uuid import UUID
 
 import requests
 from django.db import IntegrityError
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status, viewsets, generics
 from rest_framework.exceptions import ValidationError, NotFound, NotAuthenticated
@@ -10,12 +15,43 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from polls_and_questions import serializers, services
-from polls_and_questions.models import EventConfig, Poll, Question, QAnswer, QAVote
+from polls_and_questions.cache import event_config_cache
+from polls_and_questions.search import ENTITIES, parse_query, search_backend
+from polls_and_questions.models import CHANGES_SETTLE_TIME, Change, EventConfig, PAnswer, Poll, PollConfig, Question, \
+    QuestionConfig, QAnswer, QAVote, QVote
 
 from django.utils.translation import gettext_lazy as _
 
+from polls import serializers as polls_serializers
 from polls_and_questions.services import get_user_data
+from questions import serializers as questions_serializers
 from users import authentication
+from users.services import get_request_interaction_user
+
+# changes returned per request
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 1000
+
+# results returned per search and kind of object
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+
+def get_int_param(request, name: str, default: int) -> int:
+    """
+    Retrieve a not negative integer from query params.
+
+    Raises:
+        ValidationError: When the param is not a not negative integer.
+    """
+    value = request.query_params.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError({name: _('a not negative integer is required')})
+    if value < 0:
+        raise ValidationError({name: _('a not negative integer is required')})
+    return value
 
 
 class ConfigManager(APIView):
@@ -53,10 +89,10 @@ class ConfigManager(APIView):
         Raises:
             NotFound: When event config is not found.
         """
-        try:
-            return EventConfig.objects.get(watchit_uuid=watchit_uuid)
-        except EventConfig.DoesNotExist:
+        event_config = event_config_cache.get(watchit_uuid)
+        if event_config is None:
             raise NotFound({'watchit_uuid': _('event config not found')})
+        return event_config
 
     def _get_token(self, request) -> str:
         """
@@ -97,11 +133,8 @@ class DefaultConfigPollManagerApiView(ConfigManager):
 
         if serializer.is_valid():
             event, create = EventConfig.objects.get_or_create(watchit_uuid=watchit_uuid)
-            default_poll_config = event.default_polls_config
-            if default_poll_config:
-                # if event is not created and have a default_poll_config; old default_poll_config is deleted.
-                default_poll_config.delete()
-            default_poll_config = serializer.save()
+            # configurations are shared, the old default is left to gc_configs command
+            default_poll_config = PollConfig.intern(**serializer.validated_data)
             event.default_polls_config = default_poll_config
             event.save()
             data = self.serializer_class(default_poll_config).data
@@ -120,7 +153,7 @@ class DefaultConfigPollManagerApiView(ConfigManager):
             event = self._get_event_config(watchit_uuid=watchit_uuid)
             default_poll_config = event.default_polls_config
             if default_poll_config:
-                default_poll_config = serializer.update(instance=default_poll_config, validated_data=request.data)
+                default_poll_config = default_poll_config.fork(**serializer.validated_data)
                 event.default_polls_config = default_poll_config
                 event.save()
                 data = self.serializer_class(default_poll_config).data
@@ -159,7 +192,7 @@ class DefaultConfigQuestionManagerApiView(ConfigManager):
             default_question_config = event.default_questions_config
             if default_question_config:
                 raise ValidationError(_('this event have default question config'))
-            default_question_config = serializer.save()
+            default_question_config = QuestionConfig.intern(**serializer.validated_data)
             event.default_questions_config = default_question_config
             event.save()
             data = self.serializer_class(default_question_config).data
@@ -178,7 +211,7 @@ class DefaultConfigQuestionManagerApiView(ConfigManager):
             event = self._get_event_config(watchit_uuid=watchit_uuid)
             default_question_config = event.default_questions_config
             if default_question_config:
-                default_question_config = serializer.update(instance=default_question_config, validated_data=request.data)
+                default_question_config = default_question_config.fork(**serializer.validated_data)
                 event.default_questions_config = default_question_config
                 event.save()
                 data = self.serializer_class(default_question_config).data
@@ -476,23 +509,268 @@ class QAnswerCreatorManager(ConfigManager):
 
 class QuestionList(generics.ListAPIView):
     serializer_class = serializers.QuestionDetailModelSerializer
-    queryset = Question.objects.all()
+    # answers are not prefetched: only the top answers of each question are serialized, see
+    # serializers.TopAnswersListSerializer
+    queryset = Question.objects.select_related('creator__user', 'configuration')
 
 
 
     def get_queryset(self):
-        return super().get_queryset().filter(watchit_uuid=self.kwargs.get('watchit_uuid'))
+        queryset = super().get_queryset().filter(watchit_uuid=self.kwargs.get('watchit_uuid'))
+        interaction_user = get_request_interaction_user(self.request)
+        if interaction_user is not None:
+            queryset = queryset.annotate(voted=Exists(QVote.objects.filter(question=OuterRef('pk'),
+                                                                            user=interaction_user)))
+        return queryset
 
 
+class ChangeListApiView(APIView):
+    """ Retrieve the polls, questions and answers of an event changed since a sequence """
 
+    authentication_classes = (authentication.ExternTokenAuthentication,
+                              authentication.ExternViewerSessionAuthentication,
+                              )
+    permission_classes = (IsAuthenticated,)
 
+    @swagger_auto_schema(manual_parameters=[openapi.Parameter('since',
+                                                              openapi.IN_QUERY,
+                                                              description='cursor returned by the previous request',
+                                                              type=openapi.TYPE_INTEGER,
+                                                              ),
+                                            openapi.Parameter('limit',
+                                                              openapi.IN_QUERY,
+                                                              description='maximum count of changes read',
+                                                              type=openapi.TYPE_INTEGER,
+                                                              ),
+                                            ],
+                         responses={200: serializers.ChangesSerializer})
+    def get(self, request, watchit_uuid: UUID, *args, **kwargs):
+        """
+        Retrieve the polls, questions and answers created, updated or deleted after the `since` cursor.
 
+        Only the current state of the changed objects is returned, once per object. Clients keep the `cursor`
+        returned and send it as `since` in the next request; while `has_more` is true there are more changes.
 
+        The cursor only moves past changes older than CHANGES_SETTLE_TIME, since changes committed out of order
+        can still appear before newer ones. When a change of the page is not settled yet, `has_more` is false and
+        `retry_after` tells the seconds until it settles, so clients do not request the same page meanwhile.
+        """
+        since = get_int_param(request, 'since', 0)
+        limit = min(get_int_param(request, 'limit', CHANGES_PAGE_SIZE), CHANGES_MAX_PAGE_SIZE) or 1
+        changes = list(Change.objects
+                       .filter(watchit_uuid=watchit_uuid, id__gt=since)
+                       .order_by('id')
+                       .values_list('id', 'entity', 'object_id', 'action', 'creation_date')[:limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        cursor = since
+        first_unsettled_date = None
+        settled_before = timezone.now() - timedelta(seconds=CHANGES_SETTLE_TIME)
+        last_actions = {'poll': {}, 'question': {}, 'answer': {}}
+        for change_id, entity, object_id, action, creation_date in changes:
+            last_actions[entity][object_id] = action
+            if first_unsettled_date is None and creation_date > settled_before:
+                first_unsettled_date = creation_date
+            if first_unsettled_date is None:
+                cursor = change_id
+        retry_after = 0
+        if first_unsettled_date is not None:
+            retry_after = round((first_unsettled_date - settled_before).total_seconds(), 3)
+        changed_ids = {entity: [object_id for object_id, action in actions.items() if action != 'deleted']
+                       for entity, actions in last_actions.items()}
+
+        context = {'request': request}
+        polls = Poll.objects \
+            .filter(watchit_uuid=watchit_uuid, id__in=changed_ids['poll']) \
+            .select_related('creator__user', 'configuration') \
+            .prefetch_related('choices')
+        questions = Question.objects \
+            .filter(watchit_uuid=watchit_uuid, id__in=changed_ids['question']) \
+            .select_related('creator__user', 'configuration')
+        answers = QAnswer.objects \
+            .filter(question__watchit_uuid=watchit_uuid, id__in=changed_ids['answer']) \
+            .select_related('creator__user')
+        data = {
+            'cursor': cursor,
+            'has_more': has_more and first_unsettled_date is None,
+            'retry_after': retry_after,
+            'polls': polls_serializers.PollDetailModelSerializer(polls, many=True, context=context).data,
+            'questions': questions_serializers.QuestionDetailModelSerializer(questions,
+                                                                             many=True,
+                                                                             context=context,
+                                                                             ).data,
+            'answers': questions_serializers.QAnswerChangeModelSerializer(answers, many=True, context=context).data,
+        }
+        found_ids = {
+            'poll': {poll['id'] for poll in data['polls']},
+            'question': {question['id'] for question in data['questions']},
+            'answer': {answer['id'] for answer in data['answers']},
+        }
+        # objects changed and then deleted are reported as deleted
+        data['deleted'] = {'%ss' % entity: sorted(set(actions) - found_ids[entity])
+                           for entity, actions in last_actions.items()}
+        return Response(data, status=status.HTTP_200_OK)
 
 
+class BootstrapApiView(APIView):
+    """ Retrieve the initial state of an event for a player in one request """
 
+    authentication_classes = (authentication.ExternTokenAuthentication,
+                              authentication.ExternViewerSessionAuthentication,
+                              )
+    permission_classes = (IsAuthenticated,)
 
+    @staticmethod
+    def _get_cursor(watchit_uuid: UUID) -> tuple:
+        """
+        Retrieve the last change of an event and the cursor to read the changes made after the state returned.
+
+        Returns: Identifier of the last change (0 if there are not changes) and the cursor; the cursor is not moved
+            past changes made in the last CHANGES_SETTLE_TIME seconds, as in ChangeListApiView.
 
+        """
+        changes = Change.objects.filter(watchit_uuid=watchit_uuid).order_by('-id')
+        last_change = changes.values_list('id', 'creation_date').first()
+        if last_change is None:
+            return 0, 0
+        settled_before = timezone.now() - timedelta(seconds=CHANGES_SETTLE_TIME)
+        if last_change[1] <= settled_before:
+            return last_change[0], last_change[0]
+        cursor = changes.filter(creation_date__lte=settled_before).values_list('id', flat=True).first()
+        return last_change[0], cursor or 0
 
+    @staticmethod
+    def _get_version(last_change_id: int, event_config, interaction_user, last_panswer_id: int) -> str:
+        """
+        Build the version of the state of an event seen by a user.
 
+        The version changes when a poll, question or answer of the event changes (including votes, see
+        polls_and_questions.signals), when a default configuration of the event is replaced (configurations are
+        immutable, see SharedConfig) and when the user answers a poll.
+        """
+        return '%s-%s-%s-%s-%s' % (last_change_id,
+                                   event_config.default_polls_config_id if event_config else 0,
+                                   event_config.default_questions_config_id if event_config else 0,
+                                   interaction_user.pk if interaction_user else 0,
+                                   last_panswer_id or 0,
+                                   )
+
+    @swagger_auto_schema(responses={200: serializers.BootstrapSerializer, 304: 'Not Modified'})
+    def get(self, request, watchit_uuid: UUID, *args, **kwargs):
+        """
+        Retrieve the default configurations, the published polls and questions of an event and the votes of the
+        current user in them.
 
+        The response carries an `ETag`; when it is sent back in `If-None-Match` and nothing changed, 304 Not
+        Modified is returned without reading the state. Changes after the state returned are read from the
+        changes endpoint with `since=<cursor>`.
+        """
+        interaction_user = get_request_interaction_user(request)
+        event_config = event_config_cache.get(watchit_uuid)
+        last_change_id, cursor = self._get_cursor(watchit_uuid)
+        panswers = PAnswer.objects.filter(creator=interaction_user, poll__watchit_uuid=watchit_uuid)
+        last_panswer_id = panswers.order_by('-id').values_list('id', flat=True).first()
+        etag = quote_etag(self._get_version(last_change_id, event_config, interaction_user, last_panswer_id))
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        context = {'request': request}
+        # `published IN (true)`, see InteractionStateFilter
+        polls = Poll.objects \
+            .filter(watchit_uuid=watchit_uuid, published__in=[True]) \
+            .select_related('creator__user', 'configuration') \
+            .prefetch_related('choices') \
+            .order_by('creation_date', 'id')
+        questions = Question.objects \
+            .filter(watchit_uuid=watchit_uuid, published__in=[True]) \
+            .select_related('creator__user', 'configuration') \
+            .order_by('creation_date', 'id')
+        voted_answer_ids = QAVote.objects \
+            .filter(user=interaction_user, answer__question__watchit_uuid=watchit_uuid) \
+            .values_list('answer_id', flat=True)
+        poll_answers = {}
+        for poll_id, choice_id in panswers.values_list('poll_id', 'selected_choice').order_by('poll_id', 'id'):
+            choice_ids = poll_answers.setdefault(str(poll_id), [])
+            if choice_id is not None and choice_id not in choice_ids:
+                choice_ids.append(choice_id)
+        data = {
+            'cursor': cursor,
+            'poll_configuration': serializers.PollConfigModelSerializer(event_config.default_polls_config).data
+            if event_config and event_config.default_polls_config else None,
+            'question_configuration': serializers.QuestionConfigModelSerializer(
+                event_config.default_questions_config).data
+            if event_config and event_config.default_questions_config else None,
+            'polls': polls_serializers.PollDetailModelSerializer(polls, many=True, context=context).data,
+            'questions': questions_serializers.QuestionDetailModelSerializer(questions,
+                                                                             many=True,
+                                                                             context=context,
+                                                                             ).data,
+            'votes': {
+                'answers': sorted(voted_answer_ids),
+                'polls': poll_answers,
+            },
+        }
+        return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+
+class SearchApiView(APIView):
+    """ Search questions and answers of an event """
+
+    authentication_classes = (authentication.ExternTokenAuthentication, )
+    permission_classes = (IsAuthenticated,)
+
+    @swagger_auto_schema(manual_parameters=[openapi.Parameter('q',
+                                                              openapi.IN_QUERY,
+                                                              description='words searched, all of them must match; '
+                                                                          'a word ending with * matches the words '
+                                                                          'starting with it, e.g. pric*',
+                                                              type=openapi.TYPE_STRING,
+                                                              required=True,
+                                                              ),
+                                            openapi.Parameter('type',
+                                                              openapi.IN_QUERY,
+                                                              description='only questions or only answers',
+                                                              type=openapi.TYPE_STRING,
+                                                              enum=list(ENTITIES),
+                                                              ),
+                                            openapi.Parameter('limit',
+                                                              openapi.IN_QUERY,
+                                                              description='maximum count of results of each type',
+                                                              type=openapi.TYPE_INTEGER,
+                                                              ),
+                                            ],
+                         responses={200: serializers.SearchResultsSerializer})
+    def get(self, request, watchit_uuid: UUID, *args, **kwargs):
+        """
+        Retrieve the questions and answers of an event matching a query, best ranked first, with their `rank`.
+        """
+        terms = parse_query(request.query_params.get('q', ''))
+        if not terms:
+            raise ValidationError({'q': _('a word at least is required')})
+        entity = request.query_params.get('type')
+        if entity is not None and entity not in ENTITIES:
+            raise ValidationError({'type': _('must be one of: %s') % ', '.join(ENTITIES)})
+        limit = min(get_int_param(request, 'limit', SEARCH_PAGE_SIZE), SEARCH_MAX_PAGE_SIZE) or 1
+
+        ranks = {name: dict(search_backend.search(watchit_uuid, terms, name, limit)) if entity in (None, name) else {}
+                 for name in ENTITIES}
+        context = {'request': request}
+        questions = Question.objects \
+            .filter(watchit_uuid=watchit_uuid, id__in=ranks['question']) \
+            .select_related('creator__user', 'configuration')
+        answers = QAnswer.objects \
+            .filter(question__watchit_uuid=watchit_uuid, id__in=ranks['answer']) \
+            .select_related('creator__user')
+        data = {
+            'questions': questions_serializers.QuestionDetailModelSerializer(questions,
+                                                                             many=True,
+                                                                             context=context,
+                                                                             ).data,
+            'answers': questions_serializers.QAnswerChangeModelSerializer(answers, many=True, context=context).data,
+        }
+        for key, name in (('questions', 'question'), ('answers', 'answer')):
+            for result in data[key]:
+                result['rank'] = ranks[name][result['id']]
+            data[key] = sorted(data[key], key=lambda result: -result['rank'])
+        return Response(data, status=status.HTTP_200_OK)
@@ -1,18 +1,81 @@
+from django.db.models import Manager
+from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 from polls_and_questions import models
-from polls_and_questions.serializers import QuestionConfigModelSerializer
-from users.models import InteractionUser
+from polls_and_questions.cache import event_config_cache
+from polls_and_questions.serializers import QuestionConfigModelSerializer, get_top_answers
 from users.serializers import InteractionUserSerializer
+from users.services import get_request_interaction_user
 
-class QAnswerDetailModelSerializer(serializers.ModelSerializer):
+# questions changed at most by one moderation request
+MODERATION_MAX_QUESTIONS = 500
+
+class VotedListSerializer(serializers.ListSerializer):
+    """
+    List serializer that resolves if the current user logged voted the objects of the whole list with one query.
+    """
+
+    def to_representation(self, data):
+        objs = list(data.all() if isinstance(data, Manager) else data)
+        self.child.voted_ids = self.child.get_voted_ids(objs)
+        return super().to_representation(objs)
+
+
+class VotedSerializerMixin:
+    """
+    Mixin for serializers with `voted` field.
+
+    Attributes:
+        vote_model (Model): Model of the votes.
+        vote_field (str): Name of the field of vote_model pointing to the voted object.
+        voted_ids (set): Identifiers of the objects voted by the current user, resolved by VotedListSerializer.
+
+    """
+    vote_model = None
+    vote_field = None
+    voted_ids = None
+
+    def _votes(self):
+        interaction_user = get_request_interaction_user(self.context.get('request', None))
+        if interaction_user is None:
+            return None
+        return self.vote_model.objects.filter(user=interaction_user)
+
+    def get_voted_ids(self, objs) -> set:
+        """"
+        Retrieve the identifiers of objs voted by the current user logged
+        """
+        votes = self._votes()
+        if votes is None or not objs:
+            return set()
+        return set(votes.filter(**{'%s_id__in' % self.vote_field: [obj.pk for obj in objs]})
+                   .values_list('%s_id' % self.vote_field, flat=True))
+
+    def get_voted(self, obj) -> bool:
+        """"
+        Check if the current user logged voted the object or not
+        """
+        if self.voted_ids is not None:
+            return obj.pk in self.voted_ids
+        votes = self._votes()
+        if votes is None:
+            return False
+        return votes.filter(**{self.vote_field: obj}).exists()
+
+
+class QAnswerDetailModelSerializer(VotedSerializerMixin, serializers.ModelSerializer):
     voted = serializers.SerializerMethodField()
 
     creator = InteractionUserSerializer()
 
+    vote_model = models.QAVote
+    vote_field = 'answer'
+
     class Meta:
         model = models.QAnswer
+        list_serializer_class = VotedListSerializer
         fields = ('id',
                   'creator',
                   'answer',
@@ -22,49 +85,27 @@ class QAnswerDetailModelSerializer(serializers.ModelSerializer):
                   )
         # exclude = ('question', )
 
-    def get_voted(self, obj) -> bool:
-            """"
-            Check if the current user logged voted the question answer or not
-            """
-            request = self.context.get('request', None)
-            if request.user:
-                try:
-                    interaction_user = InteractionUser.objects.get(user_id=request.user.id)
-                    try:
-                        models.QAVote.objects.get(user=interaction_user, answer=obj)
-                        return True
-                    except models.QAVote.DoesNotExist:
-                        return False
-                except InteractionUser.DoesNotExist:
-                    return False
-            return False
 
-class QuestionDetailModelSerializer(serializers.ModelSerializer):
+class QAnswerChangeModelSerializer(QAnswerDetailModelSerializer):
+    """" Serializer for answers changed, with the question they belong to """
+
+    class Meta(QAnswerDetailModelSerializer.Meta):
+        fields = QAnswerDetailModelSerializer.Meta.fields + ('question', )
+
+
+class QuestionDetailModelSerializer(VotedSerializerMixin, serializers.ModelSerializer):
     """" Serializer for details of Questions"""
     voted = serializers.SerializerMethodField()
 
     configuration = QuestionConfigModelSerializer()
     creator = InteractionUserSerializer()
 
-    def get_voted(self, obj) -> bool:
-        """"
-        Check if the current user logged voted the question or not
-        """
-        request = self.context.get('request', None)
-        if request.user:
-            try:
-                interaction_user = InteractionUser.objects.get(user_id=request.user.id)
-                try:
-                    models.QVote.objects.get(user=interaction_user, question=obj)
-                    return True
-                except models.QVote.DoesNotExist:
-                    return False
-            except InteractionUser.DoesNotExist:
-                return False
-        return False
+    vote_model = models.QVote
+    vote_field = 'question'
 
     class Meta:
         model = models.Question
+        list_serializer_class = VotedListSerializer
         # fields = '__all__'
         fields = ('id',
                   'creator',
@@ -78,6 +119,73 @@ class QuestionDetailModelSerializer(serializers.ModelSerializer):
                   )
         # exclude = ('watchit_uuid', )
 
+
+class QuestionTopAnswersListSerializer(VotedListSerializer):
+    """
+    List serializer that also resolves the top answers of the questions of the whole list, see
+    QuestionTopAnswersSerializer.
+    """
+
+    def to_representation(self, data):
+        objs = list(data.all() if isinstance(data, Manager) else data)
+        self.child.resolve_top_answers(objs)
+        return super().to_representation(objs)
+
+
+class QuestionTopAnswersSerializer(QuestionDetailModelSerializer):
+    """
+    Serializer for details of questions with their top answers and their count of answers.
+
+    The answers of the whole list are ranked with one windowed query (see QAnswer.top_by_question) and the votes of
+    the current user to them are read with one query more.
+
+    Attributes:
+        top_answers (dict): Top answers and count of answers by question.
+        answer_voted_ids (set): Identifiers of the top answers voted by the current user.
+
+    """
+    answers = serializers.SerializerMethodField()
+    answers_count = serializers.SerializerMethodField()
+
+    top_answers = None
+    answer_voted_ids = None
+
+    class Meta(QuestionDetailModelSerializer.Meta):
+        list_serializer_class = QuestionTopAnswersListSerializer
+        fields = QuestionDetailModelSerializer.Meta.fields + ('answers', 'answers_count')
+
+    def resolve_top_answers(self, objs):
+        """
+        Retrieve the top answers of questions and the ones voted by the current user.
+
+        Raises:
+            ValidationError: When `answers_limit` or `answers_ordering` query params are wrong.
+
+        """
+        self.top_answers = get_top_answers(self.context.get('request', None), [obj.pk for obj in objs])
+        answers = [answer for question_answers, answers_count in self.top_answers.values()
+                   for answer in question_answers]
+        self.answer_voted_ids = QAnswerDetailModelSerializer(context=self.context).get_voted_ids(answers)
+
+    def _get_question_answers(self, obj) -> tuple:
+        if self.top_answers is None:
+            self.resolve_top_answers([obj])
+        return self.top_answers.get(obj.pk, ([], 0))
+
+    @swagger_serializer_method(serializer_or_field=QAnswerDetailModelSerializer(many=True))
+    def get_answers(self, obj) -> list:
+        """ Retrieve the top answers of the question """
+        answers, answers_count = self._get_question_answers(obj)
+        answer_serializer = QAnswerDetailModelSerializer(context=self.context)
+        answer_serializer.voted_ids = self.answer_voted_ids
+        return [answer_serializer.to_representation(answer) for answer in answers]
+
+    @swagger_serializer_method(serializer_or_field=serializers.IntegerField())
+    def get_answers_count(self, obj) -> int:
+        """ Retrieve the count of answers of the question """
+        answers, answers_count = self._get_question_answers(obj)
+        return answers_count
+
 class CustomQuestionConfig(serializers.ModelSerializer):
     """
     Serializer for customize question configuration
@@ -107,18 +215,16 @@ class QuestionCreateModelSerializer(serializers.ModelSerializer):
         configuration_data = validated_data.pop('configuration', None)
         configuration = None
         if configuration_data:
-            configuration = self.fields['configuration'].create(validated_data=configuration_data)
+            configuration = models.QuestionConfig.intern(**configuration_data)
         else:
             try:
-                event_config = models.EventConfig.objects.get(watchit_uuid=watchit_uuid)
+                event_config = event_config_cache.get(watchit_uuid)
+                if event_config is None:
+                    raise models.EventConfig.DoesNotExist()
                 default_question_configuration = event_config.default_questions_config
                 if default_question_configuration:
-                    configuration = models.QuestionConfig.objects.create(
-                        allow_audience_create_questions=default_question_configuration.allow_audience_create_questions,
-                        allow_audience_vote_questions=default_question_configuration.allow_audience_vote_questions,
-                        allow_audience_vote_answers=default_question_configuration.allow_audience_vote_answers,
-                        answers_privacy=default_question_configuration.answers_privacy,
-                    )
+                    # configurations are immutable, so the default is shared as is
+                    configuration = default_question_configuration
                 else:
                     raise ValidationError(
                         'define a default question configuration for this event or a custom question configuration for '
@@ -153,13 +259,56 @@ class QuestionUpdateModelSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         configuration_data = validated_data.pop('configuration', None)
         if configuration_data:
-            question_config = instance.configuration
-            self.fields['configuration'].update(instance=question_config, validated_data=configuration_data)
+            # configurations are shared: the question is pointed to the configuration with the new content
+            instance.configuration = instance.configuration.fork(**configuration_data)
         super().update(instance, validated_data)
         return instance
 
 class ResponseVoteSerializer(serializers.Serializer):
     voted = serializers.BooleanField()
+    votes_count = serializers.IntegerField()
+
+
+class LikelyDuplicateSerializer(serializers.Serializer):
+    """ Serializer for questions likely to be duplicates of other one """
+    id = serializers.IntegerField()
+    question = serializers.CharField()
+    votes_count = serializers.IntegerField()
+    published = serializers.BooleanField()
+    similarity = serializers.FloatField(help_text='Similarity of the texts, from 0 to 1')
+
+
+def likely_duplicates_data(duplicates: list) -> list:
+    """ Serialize the (question, similarity) tuples of QuestionBucket.likely_duplicates """
+    return LikelyDuplicateSerializer([{'id': question.id,
+                                       'question': question.question,
+                                       'votes_count': question.votes_count,
+                                       'published': question.published,
+                                       'similarity': round(score, 3),
+                                       }
+                                      for question, score in duplicates], many=True).data
+
+
+class ModerateQuestionsSerializer(serializers.Serializer):
+    """ Serializer for moderation actions on many questions """
+    questions = serializers.ListField(child=serializers.IntegerField(), allow_empty=False,
+                                      max_length=MODERATION_MAX_QUESTIONS)
+    action = serializers.ChoiceField(choices=list(models.MODERATION_ACTIONS),
+                                     help_text='publish, reject (unpublish and hide from the moderation queue), '
+                                               'stream or unstream')
+
+
+class ResponseModerateSerializer(serializers.Serializer):
+    action = serializers.CharField()
+    updated = serializers.ListField(child=serializers.IntegerField(),
+                                    help_text='Questions updated; questions already in the state are not listed')
+    not_found = serializers.ListField(child=serializers.IntegerField(), help_text='Questions not in the event')
+
+
+class MergeQuestionsSerializer(serializers.Serializer):
+    """ Serializer for merging duplicates into a question """
+    duplicates = serializers.ListField(child=serializers.IntegerField(), allow_empty=False,
+                                       help_text='Questions merged into this one and deleted')
 
 class QAnswerModelSerializer(serializers.ModelSerializer):
     class Meta:
@@ -1,3 +1,566 @@
-from django.test import TestCase
+import math
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
 
-# Create your tests here.
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from polls_and_questions import models
+from polls_and_questions.tests import QueryCountMixin
+from users.services import sync_interaction_user
+
+
+def create_user(name: str, user_type: str = 'PARTICIPANT'):
+    return sync_interaction_user(username=name,
+                                 email='%s@watchity.invalid' % name,
+                                 screen_name=name,
+                                 user_type=user_type,
+                                 )
+
+
+def api_client(interaction_user) -> APIClient:
+    client = APIClient()
+    client.force_authenticate(user=interaction_user.user)
+    return client
+
+
+class QuestionDefaultConfigurationTests(TestCase):
+
+    def setUp(self):
+        self.watchit_uuid = uuid.uuid4()
+        self.base = '/api/watchit/%s/playersettings/%s/' % (self.watchit_uuid, uuid.uuid4())
+        self.default = models.QuestionConfig.intern(answers_privacy='EVERYONE', auto_publish=False, enabled=False)
+        models.EventConfig.objects.create(watchit_uuid=self.watchit_uuid, default_questions_config=self.default)
+        self.speaker = api_client(create_user('speaker', 'SYSTEM'))
+        self.participant = api_client(create_user('participant'))
+
+    def test_question_shares_default_configuration(self):
+        response = self.participant.post(self.base + 'question/',
+                                         {'question': 'question', 'configuration': None},
+                                         format='json',
+                                         )
+
+        self.assertEqual(response.status_code, 201)
+        question = models.Question.objects.get(pk=response.data['id'])
+        self.assertEqual(question.configuration_id, self.default.pk)
+        self.assertFalse(question.published)
+
+    def test_question_of_default_without_auto_publish_is_moderated(self):
+        question_id = self.participant.post(self.base + 'question/',
+                                            {'question': 'question', 'configuration': None},
+                                            format='json',
+                                            ).data['id']
+
+        response = self.speaker.get(self.base + 'question/moderation/')
+
+        self.assertEqual([question['id'] for question in response.data['results']], [question_id])
+
+
+class QuestionMergeTests(TestCase):
+
+    def setUp(self):
+        self.watchit_uuid = uuid.uuid4()
+        self.base = '/api/watchit/%s/playersettings/%s/' % (self.watchit_uuid, uuid.uuid4())
+        self.speaker = create_user('speaker', 'SYSTEM')
+        self.configuration = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+        self.question, *self.duplicates = [self.create_question('when does the talk start') for _ in range(3)]
+        self.voters = [create_user('voter%s' % index) for index in range(3)]
+
+    def create_question(self, text: str) -> models.Question:
+        return models.Question.objects.create(watchit_uuid=self.watchit_uuid,
+                                              creator=self.speaker,
+                                              question=text,
+                                              published=True,
+                                              configuration=self.configuration,
+                                              )
+
+    def merge(self, client=None):
+        client = client or api_client(self.speaker)
+        return client.post(self.base + 'question/%s/merge/' % self.question.pk,
+                           {'duplicates': [duplicate.pk for duplicate in self.duplicates]},
+                           format='json',
+                           )
+
+    def test_users_keep_one_vote(self):
+        # voter0 voted the question and a duplicate, voter1 both duplicates, voter2 one duplicate
+        for question, voter in ((self.question, 0), (self.duplicates[0], 0), (self.duplicates[0], 1),
+                                (self.duplicates[1], 1), (self.duplicates[1], 2)):
+            models.QVote.toggle(question, self.voters[voter])
+
+        response = self.merge()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['moved_votes'], 2)
+        self.assertEqual(sorted(models.QVote.objects.values_list('question_id', 'user_id')),
+                         sorted((self.question.pk, voter.pk) for voter in self.voters))
+        self.assertFalse(models.Question.objects.filter(pk__in=[duplicate.pk for duplicate in self.duplicates])
+                         .exists())
+        trending_score = models.Question.objects.get(pk=self.question.pk).trending_score
+        models.Question.refresh_vote_scores([self.question.pk])
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.votes_count, 3)
+        self.assertAlmostEqual(self.question.trending_score, trending_score)
+
+    def test_answers_are_moved(self):
+        answers = [models.QAnswer.objects.create(question=question, creator=self.speaker, answer='at ten')
+                   for question in (self.question, *self.duplicates)]
+        models.QAVote.toggle(answers[1], self.voters[0])
+
+        self.merge()
+
+        self.assertEqual(set(self.question.answers.values_list('id', flat=True)), {answer.pk for answer in answers})
+        answers[1].refresh_from_db()
+        self.assertEqual(answers[1].votes_count, 1)
+
+    def test_changes_are_recorded(self):
+        answer = models.QAnswer.objects.create(question=self.duplicates[0], creator=self.speaker, answer='at ten')
+        last_change_id = models.Change.objects.order_by('id').values_list('id', flat=True).last()
+
+        self.merge()
+
+        changes = set(models.Change.objects.filter(id__gt=last_change_id, watchit_uuid=self.watchit_uuid)
+                      .values_list('entity', 'object_id', 'action'))
+        self.assertIn(('question', self.question.pk, 'updated'), changes)
+        self.assertIn(('answer', answer.pk, 'updated'), changes)
+        for duplicate in self.duplicates:
+            self.assertIn(('question', duplicate.pk, 'deleted'), changes)
+
+    def test_only_speakers_merge(self):
+        response = self.merge(api_client(self.voters[0]))
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(models.Question.objects.filter(watchit_uuid=self.watchit_uuid).count(), 3)
+
+    def test_likely_duplicates(self):
+        self.create_question('who is the keynote speaker')
+
+        response = api_client(self.speaker).get(self.base + 'question/%s/duplicates/' % self.question.pk)
+
+        self.assertEqual([duplicate['id'] for duplicate in response.data],
+                         [duplicate.pk for duplicate in self.duplicates])
+
+    def test_backfill_buckets_existing_questions(self):
+        bucket_questions = import_module('polls_and_questions.migrations.0010_question_buckets').bucket_questions
+        buckets = set(models.QuestionBucket.objects.values_list('question_id', 'band', 'bucket'))
+        models.QuestionBucket.objects.all().delete()
+
+        bucket_questions(apps, None)
+
+        self.assertEqual(set(models.QuestionBucket.objects.values_list('question_id', 'band', 'bucket')), buckets)
+
+
+class QuestionModerationTests(TestCase):
+
+    def setUp(self):
+        self.watchit_uuid = uuid.uuid4()
+        self.base = '/api/watchit/%s/playersettings/%s/' % (self.watchit_uuid, uuid.uuid4())
+        self.speaker = create_user('speaker', 'SYSTEM')
+        self.configuration = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+        self.pending = [self.create_question(self.watchit_uuid) for _ in range(2)]
+        self.published = self.create_question(self.watchit_uuid, published=True, streaming=True)
+        self.other_event = self.create_question(uuid.uuid4())
+
+    def create_question(self, watchit_uuid, **states) -> models.Question:
+        return models.Question.objects.create(watchit_uuid=watchit_uuid,
+                                              creator=self.speaker,
+                                              question='question',
+                                              configuration=self.configuration,
+                                              **states,
+                                              )
+
+    def moderate(self, action: str, questions: list, user=None):
+        last_change_id = models.Change.objects.order_by('id').values_list('id', flat=True).last() or 0
+        response = api_client(user or self.speaker).post(self.base + 'question/moderate/',
+                                                         {'action': action,
+                                                          'questions': [question.pk for question in questions],
+                                                          },
+                                                         format='json',
+                                                         )
+        self.changes = list(models.Change.objects.filter(id__gt=last_change_id)
+                            .order_by('object_id')
+                            .values_list('watchit_uuid', 'entity', 'object_id', 'action'))
+        return response
+
+    def states(self, question) -> tuple:
+        question.refresh_from_db()
+        return question.published, question.streaming, question.rejected
+
+    def test_publish(self):
+        response = self.moderate('publish', self.pending + [self.published, self.other_event])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'action': 'publish',
+                                         'updated': [question.pk for question in self.pending],
+                                         'not_found': [self.other_event.pk],
+                                         })
+        self.assertEqual([self.states(question) for question in self.pending], [(True, False, False)] * 2)
+        self.assertEqual(self.states(self.other_event), (False, False, False))
+        self.assertEqual(self.changes, [(self.watchit_uuid, 'question', question.pk, 'updated')
+                                        for question in self.pending])
+
+    def test_reject(self):
+        response = self.moderate('reject', [self.pending[0], self.published])
+
+        self.assertEqual(response.data['updated'], [self.pending[0].pk, self.published.pk])
+        self.assertEqual(self.states(self.pending[0]), (False, False, True))
+        self.assertEqual(self.states(self.published), (False, False, True))
+        queue = api_client(self.speaker).get(self.base + 'question/moderation/').data['results']
+        self.assertEqual([question['id'] for question in queue], [self.pending[1].pk])
+
+    def test_stream_and_unstream(self):
+        response = self.moderate('stream', [self.pending[0], self.published])
+
+        self.assertEqual(response.data['updated'], [self.pending[0].pk])
+        self.assertEqual(self.states(self.pending[0]), (False, True, False))
+
+        response = self.moderate('unstream', [self.pending[0], self.published, self.pending[1]])
+
+        self.assertEqual(response.data['updated'], [self.pending[0].pk, self.published.pk])
+        self.assertEqual(self.states(self.published), (True, False, False))
+        self.assertEqual([change[2] for change in self.changes], [self.pending[0].pk, self.published.pk])
+
+    def test_only_speakers_moderate(self):
+        participant = create_user('participant')
+
+        response = self.moderate('publish', self.pending, user=participant)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual([self.states(question) for question in self.pending], [(False, False, False)] * 2)
+        self.assertEqual(self.changes, [])
+        self.assertEqual(api_client(participant).get(self.base + 'question/moderation/').status_code, 403)
+
+    def test_unknown_action(self):
+        self.assertEqual(self.moderate('delete', self.pending).status_code, 400)
+
+
+class QuestionRankingTests(TestCase):
+
+    def setUp(self):
+        self.watchit_uuid = uuid.uuid4()
+        self.base = '/api/watchit/%s/playersettings/%s/' % (self.watchit_uuid, uuid.uuid4())
+        self.speaker = create_user('speaker', 'SYSTEM')
+        self.configuration = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+        self.voters = [create_user('voter%s' % index) for index in range(3)]
+
+    def create_question(self) -> models.Question:
+        return models.Question.objects.create(watchit_uuid=self.watchit_uuid,
+                                              creator=self.speaker,
+                                              question='question',
+                                              published=True,
+                                              configuration=self.configuration,
+                                              )
+
+    def list_ids(self, ordering: str) -> list:
+        response = api_client(self.speaker).get(self.base + 'question/', {'ordering': ordering})
+        self.assertEqual(response.status_code, 200)
+        return [question['id'] for question in response.data['results']]
+
+    def test_vote_and_unvote_update_trending_score(self):
+        question = self.create_question()
+        weights = []
+        for voter in self.voters[:2]:
+            models.QVote.toggle(question, voter)
+            weights.append(models.Question.trending_weight(models.QVote.objects.get(question=question,
+                                                                                    user=voter).creation_date))
+        question.refresh_from_db()
+        self.assertAlmostEqual(question.trending_score, math.log(sum(math.exp(weight - weights[0])
+                                                                     for weight in weights)) + weights[0])
+
+        models.QVote.toggle(question, self.voters[0])
+        question.refresh_from_db()
+        self.assertEqual(question.votes_count, 1)
+        self.assertAlmostEqual(question.trending_score, weights[1])
+
+        models.QVote.toggle(question, self.voters[1])
+        question.refresh_from_db()
+        self.assertEqual((question.votes_count, question.trending_score), (0, 0))
+
+    def test_orderings(self):
+        old, recent, unvoted = [self.create_question() for _ in range(3)]
+        for voter in self.voters[:2]:
+            models.QVote.toggle(old, voter)
+        models.QVote.toggle(recent, self.voters[2])
+        # votes of two hours ago weigh 2 ** -8 of a vote now
+        models.QVote.objects.filter(question=old).update(creation_date=timezone.now() - timedelta(hours=2))
+        models.Question.refresh_vote_scores([old.pk])
+
+        self.assertEqual(self.list_ids('top'), [old.pk, recent.pk, unvoted.pk])
+        self.assertEqual(self.list_ids('trending'), [recent.pk, old.pk, unvoted.pk])
+        self.assertEqual(self.list_ids('recent'), [unvoted.pk, recent.pk, old.pk])
+
+    def test_unknown_ordering(self):
+        response = api_client(self.speaker).get(self.base + 'question/', {'ordering': 'votes_count'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class QuestionTopAnswersTests(TestCase):
+
+    def setUp(self):
+        self.watchit_uuid = uuid.uuid4()
+        self.base = '/api/watchit/%s/playersettings/%s/' % (self.watchit_uuid, uuid.uuid4())
+        self.participant = create_user('participant')
+        self.voters = [create_user('voter%s' % index) for index in range(2)]
+        self.question = models.Question.objects.create(watchit_uuid=self.watchit_uuid,
+                                                       creator=self.participant,
+                                                       question='question',
+                                                       published=True,
+                                                       configuration=models.QuestionConfig.intern(
+                                                           answers_privacy='EVERYONE'),
+                                                       )
+        self.answers = [models.QAnswer.objects.create(question=self.question,
+                                                      creator=self.participant,
+                                                      answer=str(index),
+                                                      )
+                        for index in range(3)]
+        models.QAVote.toggle(self.answers[0], self.participant)
+        for voter in self.voters:
+            models.QAVote.toggle(self.answers[1], voter)
+
+    def get(self, url: str, params: dict):
+        response = api_client(self.participant).get(self.base + url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_answers_are_nested_only_on_request(self):
+        self.assertNotIn('answers', self.get('question/', {})['results'][0])
+
+    def test_top_answers(self):
+        question = self.get('question/', {'answers_limit': 2})['results'][0]
+
+        self.assertEqual([(answer['id'], answer['voted']) for answer in question['answers']],
+                         [(self.answers[1].pk, False), (self.answers[0].pk, True)])
+        self.assertEqual(question['answers_count'], 3)
+
+    def test_recent_answers_of_a_question(self):
+        question = self.get('question/%s/' % self.question.pk, {'answers_ordering': 'recent', 'answers_limit': 0})
+
+        self.assertEqual(question['answers'], [])
+        self.assertEqual(question['answers_count'], 3)
+        question = self.get('question/%s/' % self.question.pk, {'answers_ordering': 'recent'})
+        self.assertEqual([answer['id'] for answer in question['answers']],
+                         [answer.pk for answer in reversed(self.answers)])
+
+    def test_wrong_params(self):
+        client = api_client(self.participant)
+        for params in ({'answers_limit': -1}, {'answers_limit': 'all'}, {'answers_ordering': 'votes_count'}):
+            with self.subTest(params=params):
+                self.assertEqual(client.get(self.base + 'question/', params).status_code, 400)
+
+
+class VoteDeletionTests(TestCase):
+
+    def setUp(self):
+        self.speaker = create_user('speaker', 'SYSTEM')
+        self.configuration = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+
+    def create_question(self) -> models.Question:
+        return models.Question.objects.create(watchit_uuid=uuid.uuid4(),
+                                              creator=self.speaker,
+                                              question='question',
+                                              published=True,
+                                              configuration=self.configuration,
+                                              )
+
+    def assert_vote_scores(self, question, votes_count: int):
+        question.refresh_from_db()
+        trending_score = question.trending_score
+        models.Question.refresh_vote_scores([question.pk])
+        question.refresh_from_db()
+        self.assertEqual(question.votes_count, votes_count)
+        self.assertAlmostEqual(trending_score, question.trending_score)
+
+    def test_unvote_updates_scores(self):
+        question = self.create_question()
+        users = [create_user('participant%s' % index) for index in range(3)]
+        for user in users:
+            models.QVote.toggle(question, user)
+
+        voted, votes_count = models.QVote.toggle(question, users[1])
+
+        self.assertEqual((voted, votes_count), (False, 2))
+        self.assert_vote_scores(question, 2)
+        self.assertTrue(models.Change.objects.filter(entity='question', object_id=question.pk).exists())
+
+    def test_delete_user_removes_votes(self):
+        question = self.create_question()
+        answer = models.QAnswer.objects.create(question=question, creator=self.speaker, answer='answer')
+        participant = create_user('participant')
+        for user in (participant, self.speaker):
+            models.QVote.toggle(question, user)
+            models.QAVote.toggle(answer, user)
+
+        participant.delete()
+
+        self.assert_vote_scores(question, 1)
+        answer.refresh_from_db()
+        self.assertEqual(answer.votes_count, 1)
+
+    def test_delete_question_queries_do_not_grow_with_votes(self):
+        counts = []
+        # Django deletes rows in batches of 100
+        for votes in (1, 100):
+            question = self.create_question()
+            answer = models.QAnswer.objects.create(question=question, creator=self.speaker, answer='answer')
+            users = [create_user('voter%s' % index) for index in range(votes)]
+            models.QVote.objects.bulk_create([models.QVote(question=question, user=user) for user in users])
+            models.QAVote.objects.bulk_create([models.QAVote(answer=answer, user=user) for user in users])
+            with CaptureQueriesContext(connection) as queries:
+                question.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class AnswerDeletionTests(TestCase):
+
+    def setUp(self):
+        self.speaker = create_user('speaker', 'SYSTEM')
+        self.question = models.Question.objects.create(watchit_uuid=uuid.uuid4(),
+                                                       creator=self.speaker,
+                                                       question='question',
+                                                       published=True,
+                                                       configuration=models.QuestionConfig.intern(
+                                                           answers_privacy='EVERYONE'),
+                                                       )
+        self.last_change_id = models.Change.objects.order_by('id').values_list('id', flat=True).last()
+
+    def create_answers(self, creator, count: int) -> list:
+        return [models.QAnswer.objects.create(question=self.question, creator=creator, answer='answer')
+                for _ in range(count)]
+
+    def deleted_answer_ids(self) -> set:
+        return set(models.Change.objects.filter(id__gt=self.last_change_id,
+                                                watchit_uuid=self.question.watchit_uuid,
+                                                entity='answer',
+                                                action='deleted',
+                                                ).values_list('object_id', flat=True))
+
+    def test_delete_answer_records_it_deleted(self):
+        answer = self.create_answers(self.speaker, 1)[0]
+        self.last_change_id = models.Change.objects.order_by('id').values_list('id', flat=True).last()
+
+        answer.delete()
+
+        self.assertEqual(self.deleted_answer_ids(), {answer.pk})
+
+    def test_delete_question_records_answers_deleted(self):
+        answers = self.create_answers(self.speaker, 3)
+
+        self.question.delete()
+
+        self.assertEqual(self.deleted_answer_ids(), {answer.pk for answer in answers})
+        self.assertFalse(models.QAnswer.objects.exists())
+
+    def test_delete_user_records_answers_deleted(self):
+        participant = create_user('participant')
+        answers = self.create_answers(participant, 3)
+        self.create_answers(self.speaker, 1)
+
+        participant.delete()
+
+        self.assertEqual(self.deleted_answer_ids(), {answer.pk for answer in answers})
+        self.assertEqual(models.QAnswer.objects.count(), 1)
+
+    def test_delete_question_queries_do_not_grow_with_answers(self):
+        counts = []
+        for answers in (1, 50):
+            self.question = models.Question.objects.create(watchit_uuid=self.question.watchit_uuid,
+                                                           creator=self.speaker,
+                                                           question='question',
+                                                           configuration=self.question.configuration,
+                                                           )
+            self.create_answers(self.speaker, answers)
+            with CaptureQueriesContext(connection) as queries:
+                self.question.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_delete_user_queries_do_not_grow_with_answers(self):
+        counts = []
+        for answers in (1, 50):
+            participant = create_user('participant%s' % answers)
+            self.create_answers(participant, answers)
+            with CaptureQueriesContext(connection) as queries:
+                participant.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class VoteToggleConcurrencyTests(TransactionTestCase):
+    """ Votes are toggled from many threads, each one with its own connection """
+    threads = 16
+    toggles_per_user = 5
+
+    def test_concurrent_toggles_keep_votes_count(self):
+        configuration = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+        question = models.Question.objects.create(watchit_uuid=uuid.uuid4(),
+                                                  creator=create_user('speaker', 'SYSTEM'),
+                                                  question='question',
+                                                  published=True,
+                                                  configuration=configuration,
+                                                  )
+        # two threads per user, so toggles of the same vote race too
+        users = [create_user('voter%s' % index) for index in range(self.threads // 2)]
+        barrier = threading.Barrier(self.threads)
+
+        def toggle(user):
+            barrier.wait()
+            try:
+                for _ in range(self.toggles_per_user):
+                    models.QVote.toggle(question, user)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            list(executor.map(toggle, users * 2))
+
+        # every user toggled an even count of times
+        question.refresh_from_db()
+        self.assertEqual(models.QVote.objects.filter(question=question).count(), 0)
+        self.assertEqual(question.votes_count, 0)
+        self.assertEqual(question.trending_score, 0)
+
+
+class QuestionQueryCountTests(QueryCountMixin, TestCase):
+
+    def setUp(self):
+        self.participant = create_user('participant')
+        self.client = api_client(self.participant)
+        self.watchit_uuid = uuid.uuid4()
+        self.base = '/api/watchit/%s/playersettings/%s/' % (self.watchit_uuid, uuid.uuid4())
+        self.configuration = models.QuestionConfig.intern(answers_privacy='EVERYONE')
+        self.question = self.create_question()
+
+    def create_question(self) -> models.Question:
+        question = models.Question.objects.create(watchit_uuid=self.watchit_uuid,
+                                                  creator=self.participant,
+                                                  question='question',
+                                                  published=True,
+                                                  configuration=self.configuration,
+                                                  )
+        models.QVote.objects.create(question=question, user=self.participant)
+        return question
+
+    def add_answer(self, question):
+        answer = models.QAnswer.objects.create(question=question, creator=self.participant, answer='answer')
+        models.QAVote.objects.create(answer=answer, user=self.participant)
+
+    def test_questions(self):
+        self.assert_queries_do_not_grow(self.base + 'question/', lambda: self.add_answer(self.create_question()))
+
+    def test_questions_with_top_answers(self):
+        self.assert_queries_do_not_grow(self.base + 'question/',
+                                        lambda: self.add_answer(self.create_question()),
+                                        params={'answers_limit': 2},
+                                        )
+
+    def test_question_answers(self):
+        self.assert_queries_do_not_grow(self.base + 'question/%s/answer/' % self.question.pk,
+                                        lambda: self.add_answer(self.question))
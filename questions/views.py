@@ -1,8 +1,11 @@
 from uuid import UUID
 
 from django.shortcuts import get_object_or_404
+from django.utils.translation import gettext_lazy as _
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 from rest_framework import mixins, generics, viewsets, status
 
@@ -11,10 +14,31 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 
 from polls_and_questions import models
-from polls_and_questions.models import QVote, Question, QAnswer, QAVote
+from polls_and_questions.models import QVote, Question, QAnswer, QAVote, QuestionBucket
+from polls_and_questions.filters import InteractionStateFilter
+from polls_and_questions.pagination import KeysetPagination
+from polls_and_questions.serializers import TOP_ANSWERS_LIMIT, TOP_ANSWERS_MAX_LIMIT, TOP_ANSWERS_ORDERINGS
 from questions import serializers
 from users import authentication
-from users.models import InteractionUser
+from users.services import get_request_interaction_user
+
+
+# query params nesting the top answers of questions, see serializers.QuestionTopAnswersSerializer
+TOP_ANSWERS_PARAMETERS = [openapi.Parameter('answers_limit',
+                                            openapi.IN_QUERY,
+                                            description='nest up to this count of answers of each question '
+                                                        '(default: %s, max: %s)' % (TOP_ANSWERS_LIMIT,
+                                                                                    TOP_ANSWERS_MAX_LIMIT),
+                                            type=openapi.TYPE_INTEGER,
+                                            ),
+                          openapi.Parameter('answers_ordering',
+                                            openapi.IN_QUERY,
+                                            description='top: most voted answers first (default), '
+                                                        'recent: newest answers first',
+                                            type=openapi.TYPE_STRING,
+                                            enum=list(TOP_ANSWERS_ORDERINGS),
+                                            ),
+                          ]
 
 
 class QuestionViewSet(mixins.ListModelMixin,
@@ -25,20 +49,66 @@ class QuestionViewSet(mixins.ListModelMixin,
                       viewsets.GenericViewSet):
     """ Manage Questions """
 
-    queryset = models.Question.objects.all()
+    queryset = models.Question.objects.select_related('creator__user', 'configuration')
     serializer_class = serializers.QuestionDetailModelSerializer
     authentication_classes = (authentication.ExternTokenAuthentication,
                               authentication.ExternViewerSessionAuthentication,
                               )
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    filter_backends = (InteractionStateFilter,)
+    # orderings selected with `?ordering=`, each one backed by an index starting with watchit_uuid
+    orderings = {
+        'recent': ('-creation_date', '-id'),
+        'top': ('-votes_count', '-id'),
+        'trending': ('-trending_score', '-id'),
+    }
+    default_ordering = ('creation_date', 'id')
+    # the moderation queue is read first in first out from question_moderation_idx
+    moderation_ordering = ('creation_date', 'id')
+
+    @property
+    def ordering(self) -> tuple:
+        """
+        Ordering of the list, used by the pagination.
+
+        Raises:
+            ValidationError: When `ordering` query param is not a name of `orderings`.
+        """
+        if getattr(self, 'action', None) == 'moderation':
+            return self.moderation_ordering
+        request = getattr(self, 'request', None)
+        name = request.query_params.get('ordering') if request is not None else None
+        if not name:
+            return self.default_ordering
+        if name not in self.orderings:
+            raise ValidationError({'ordering': _('must be one of: %s') % ', '.join(self.orderings)})
+        return self.orderings[name]
 
     def get_queryset(self):
         return super().get_queryset().filter(watchit_uuid=self.kwargs.get('watchit_uuid'))
 
+    def get_serializer_class(self):
+        request = getattr(self, 'request', None)
+        if self.action in ('list', 'retrieve') and request is not None \
+                and any(param.name in request.query_params for param in TOP_ANSWERS_PARAMETERS):
+            return serializers.QuestionTopAnswersSerializer
+        return super().get_serializer_class()
+
+    @swagger_auto_schema(manual_parameters=[openapi.Parameter('ordering',
+                                                              openapi.IN_QUERY,
+                                                              description='recent: newest first, top: most voted '
+                                                                          'first, trending: most voted recently '
+                                                                          'first (default: oldest first)',
+                                                              type=openapi.TYPE_STRING,
+                                                              enum=list(orderings),
+                                                              ),
+                                            ] + TOP_ANSWERS_PARAMETERS)
     def list(self, request, *args, **kwargs):
         """ Retrieve a list of questions"""
         return super().list(request, *args, **kwargs)
 
+    @swagger_auto_schema(manual_parameters=TOP_ANSWERS_PARAMETERS)
     def retrieve(self, request, *args, **kwargs):
         """Retrieve a question """
         return super().retrieve(request, *args, **kwargs)
@@ -53,15 +123,97 @@ class QuestionViewSet(mixins.ListModelMixin,
 
         serializer = serializers.QuestionCreateModelSerializer(data=request.data)
         if serializer.is_valid():
-            creator = InteractionUser.objects.get(user_id=request.user.id)
+            creator = get_request_interaction_user(request)
             question = serializer.create(watchit_uuid=self.kwargs.get('watchit_uuid'),
                                          creator=creator,
                                          validated_data=request.data,
                                          )
             data = serializers.QuestionDetailModelSerializer(question, context={'request': request}).data
+            data['likely_duplicates'] = serializers.likely_duplicates_data(self._likely_duplicates(question))
             return Response(data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def _check_speaker(self, message: str):
+        """
+        Check that the current user is a speaker (SYSTEM user).
+
+        Raises:
+            PermissionDenied: When the current user is not a speaker.
+        """
+        interaction_user = get_request_interaction_user(self.request)
+        if interaction_user is None or interaction_user.type != 'SYSTEM':
+            raise PermissionDenied(message)
+
+    def _likely_duplicates(self, question) -> list:
+        """ Retrieve the likely duplicates of a question that the current user can see """
+        interaction_user = get_request_interaction_user(self.request)
+        # audience users only see published questions, speakers (SYSTEM users) see every question
+        is_speaker = interaction_user is not None and interaction_user.type == 'SYSTEM'
+        return QuestionBucket.likely_duplicates(question.watchit_uuid,
+                                                question.question,
+                                                exclude_id=question.pk,
+                                                published_only=not is_speaker,
+                                                )
+
+    @swagger_auto_schema(responses={200: serializers.LikelyDuplicateSerializer(many=True)})
+    @action(detail=True, methods=['get'])
+    def duplicates(self, request, *args, **kwargs):
+        """ Retrieve the questions likely to be duplicates of a question, most similar first """
+        question = self.get_object()
+        return Response(serializers.likely_duplicates_data(self._likely_duplicates(question)),
+                        status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(request_body=serializers.MergeQuestionsSerializer,
+                         responses={200: serializers.QuestionDetailModelSerializer})
+    @action(detail=True, methods=['post'])
+    def merge(self, request, *args, **kwargs):
+        """
+        Merge duplicates into a question: their votes and answers are moved to it and they are deleted. Only for
+        speakers.
+        """
+        self._check_speaker(_('only speakers can merge questions'))
+        question = self.get_object()
+        serializer = serializers.MergeQuestionsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        duplicate_ids = set(serializer.validated_data['duplicates']) - {question.pk}
+        found_ids = set(Question.objects
+                        .filter(watchit_uuid=question.watchit_uuid, pk__in=duplicate_ids)
+                        .values_list('pk', flat=True))
+        if not duplicate_ids or found_ids != duplicate_ids:
+            raise ValidationError({'duplicates': _('%s are not other questions of this event')
+                                                 % sorted(duplicate_ids - found_ids or {question.pk})})
+        moved_votes = Question.merge(question, sorted(duplicate_ids))
+        data = serializers.QuestionDetailModelSerializer(question, context={'request': request}).data
+        data['moved_votes'] = moved_votes
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def moderation(self, request, *args, **kwargs):
+        """ Retrieve the questions pending moderation (neither published nor rejected), oldest first. For speakers """
+        self._check_speaker(_('only speakers can moderate questions'))
+        # same condition as question_moderation_idx, so the queue is read from it
+        page = self.paginate_queryset(self.get_queryset().filter(published=False, rejected=False))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @swagger_auto_schema(request_body=serializers.ModerateQuestionsSerializer,
+                         responses={200: serializers.ResponseModerateSerializer})
+    @action(detail=False, methods=['post'])
+    def moderate(self, request, *args, **kwargs):
+        """ Publish, reject, stream or unstream many questions in one transaction. Only for speakers. """
+        self._check_speaker(_('only speakers can moderate questions'))
+        serializer = serializers.ModerateQuestionsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        action_name = serializer.validated_data['action']
+        updated_ids, not_found_ids = Question.moderate(self.kwargs.get('watchit_uuid'),
+                                                       serializer.validated_data['questions'],
+                                                       action_name,
+                                                       )
+        data = serializers.ResponseModerateSerializer({'action': action_name,
+                                                       'updated': updated_ids,
+                                                       'not_found': not_found_ids,
+                                                       }).data
+        return Response(data, status=status.HTTP_200_OK)
+
     @swagger_auto_schema(request_body=serializers.QuestionUpdateModelSerializer)
     def update(self, request, *args, **kwargs):
         """ Update a Question """
@@ -76,18 +228,13 @@ class QuestionViewSet(mixins.ListModelMixin,
             return Response(data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @swagger_auto_schema(request_body=serializers.QuestionDetailModelSerializer)
+    @swagger_auto_schema(request_body=None, responses={200: serializers.ResponseVoteSerializer})
     @action(detail=True, methods=['patch'])
     def vote_unvote(self, request, *args, **kwargs):
         """ Vote / remove vote for a question """
         question = self.get_object()
-        interaction_user = InteractionUser.objects.get(user_id=request.user.id)
-        try:
-            qvote = QVote.objects.get(question=question, user=interaction_user)
-            qvote.delete()
-        except QVote.DoesNotExist:
-            QVote.objects.create(question=question, user=interaction_user)
-        data = serializers.QuestionDetailModelSerializer(question, context={'request': request}).data
+        voted, votes_count = QVote.toggle(question, get_request_interaction_user(request))
+        data = serializers.ResponseVoteSerializer({'voted': voted, 'votes_count': votes_count}).data
         return Response(data, status=status.HTTP_200_OK)
 
 
@@ -99,17 +246,19 @@ class QAnswerViewSet(mixins.ListModelMixin,
                       viewsets.GenericViewSet):
     """ Manage Questions Answers """
 
-    queryset = models.QAnswer.objects.all()
+    queryset = models.QAnswer.objects.select_related('creator__user')
     serializer_class = serializers.QAnswerDetailModelSerializer
     authentication_classes = (authentication.ExternTokenAuthentication,
                               authentication.ExternViewerSessionAuthentication,
                               )
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ('-creation_date', '-id')
 
     def get_queryset(self):
         return super().get_queryset()\
             .filter(question__id=self.kwargs.get('question_id'))\
-            .order_by('-creation_date')
+            .order_by(*self.ordering)
 
     def list(self, request, *args, **kwargs):
         """ Retrieve a list of answers for question"""
@@ -128,7 +277,7 @@ class QAnswerViewSet(mixins.ListModelMixin,
         """ Create answer of question """
         serializer = serializers.QAnswerModelSerializer(data=request.data)
         if serializer.is_valid():
-            creator = InteractionUser.objects.get(user_id=request.user.id)
+            creator = get_request_interaction_user(request)
             question = get_object_or_404(Question, id=self.kwargs.get('question_id'))
             answer = QAnswer.objects.create(question=question,
                                             creator=creator,
@@ -152,38 +301,11 @@ class QAnswerViewSet(mixins.ListModelMixin,
             return Response(data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @swagger_auto_schema(request_body=None)
+    @swagger_auto_schema(request_body=None, responses={200: serializers.ResponseVoteSerializer})
     @action(detail=True, methods=['patch'])
     def vote_unvote(self, request, *args, **kwargs):
         """ Vote / remove vote answer of question """
         answer = self.get_object()
-        interaction_user = InteractionUser.objects.get(user_id=request.user.id)
-        try:
-            qavote = QAVote.objects.get(answer=answer, user=interaction_user)
-            qavote.delete()
-        except QAVote.DoesNotExist:
-            QAVote.objects.create(answer=answer, user=interaction_user)
-        data = serializers.QAnswerDetailModelSerializer(answer, context={'request': request}).data
+        voted, votes_count = QAVote.toggle(answer, get_request_interaction_user(request))
+        data = serializers.ResponseVoteSerializer({'voted': voted, 'votes_count': votes_count}).data
         return Response(data, status=status.HTTP_200_OK)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
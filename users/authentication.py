@@ -2,22 +2,30 @@ import base64
 import json
 import urllib
 
-from django.contrib.auth import get_user_model
-
 import requests
 from rest_framework import authentication
 from rest_framework import exceptions
 
-# endpoint to get the users type SYSTEM from external api
-from users.models import InteractionUser
+from users.cache import SingleFlight, token_user_cache
+from users.client import client
+from users.services import sync_interaction_user
 
+# endpoint to get the users type SYSTEM from external api
 SYSTEM_USER_DATA_ENDPOINT = "https://dev-wbe.watchity.net/rest-auth/user/"
 IS_EMAIL_AUTHORIZED_ENDPOINT = 'https://dev-wbe.watchity.net/v1/wbe/watchits/{watchit_uuid}/playersettings/{player_setting_uuid}/is_email_authorized/?email={email}'
 
+# in-flight remote users lookups by token
+user_lookups = SingleFlight()
+
+
 class ExternTokenAuthentication(authentication.BaseAuthentication):
     """"
     Custom Authentication method that use an url (SYSTEM_USER_DATA_ENDPOINT) to obtain users data sending a token
     provided in header of request.
+
+    Authenticated users are kept in a token cache (see EXTERN_AUTH_CACHE setting) so requests with a known token
+    skip the remote call and the users synchronization. The interaction user is attached to the request as
+    `interaction_user`.
     """
 
     @staticmethod
@@ -35,6 +43,39 @@ class ExternTokenAuthentication(authentication.BaseAuthentication):
                 return False
         return True
 
+    def _fetch_user(self, auth: str):
+        """
+        Retrieve users data from SYSTEM_USER_DATA_ENDPOINT and synchronize the local users.
+
+        Args:
+            auth: value of Authorization header.
+
+        Raises:
+            AuthenticationFailed: when remote server rejects the token or its response is wrong.
+            requests.exceptions.ConnectionError: when is not possible connect with remote server.
+
+        Returns: The interaction user authenticated, with its user loaded.
+
+        """
+        headers = {
+            'Authorization': auth,
+            'Accept': 'application/json',
+        }
+        response = client.get(SYSTEM_USER_DATA_ENDPOINT, headers=headers)
+        if response.status_code == 200:
+            user_data = response.json()
+            if not self.user_data_is_valid(user_data):
+                raise exceptions.AuthenticationFailed("Wrong response from remote server ", user_data)
+        else:
+            raise exceptions.AuthenticationFailed()
+        interaction_user = sync_interaction_user(username=user_data.get('username'),
+                                                 email=user_data.get('email'),
+                                                 screen_name=user_data.get('screen_name'),
+                                                 user_type='SYSTEM',
+                                                 )
+        token_user_cache.set(auth, interaction_user)
+        return interaction_user
+
     def authenticate(self, request):
         auth = request.META.get('HTTP_AUTHORIZATION', None)
         if not auth:
@@ -42,33 +83,18 @@ class ExternTokenAuthentication(authentication.BaseAuthentication):
         try:
             auth_method, value = auth.split()
             if auth_method == 'Token':
-                try:
-                    headers = {
-                        'Authorization': auth,
-                        'Accept': 'application/json',
-                    }
-                    response = requests.get(SYSTEM_USER_DATA_ENDPOINT, headers=headers)
-                    if response.status_code == 200:
-                        user_data = response.json()
-                        if not self.user_data_is_valid(user_data):
-                            exceptions.AuthenticationFailed("Wrong response from remote server ", user_data)
-                    else:
-                        raise exceptions.AuthenticationFailed()
-                    user, create = get_user_model().objects.get_or_create(username=user_data.get('username'))
-                    user.email = user_data.get('email')
-                    user.save()
+                interaction_user = token_user_cache.get(auth)
+                if interaction_user is None:
                     try:
-                        interaction_user = InteractionUser.objects.get(user=user)
-                        interaction_user.screen_name = user_data.get('screen_name')
-                        interaction_user.save()
-                    except InteractionUser.DoesNotExist:
-                        InteractionUser.objects.create(user=user,
-                                                       screen_name=user_data.get('screen_name'),
-                                                       type='SYSTEM',
-                                                       )
-                except requests.exceptions.ConnectionError:
-                    raise exceptions.AuthenticationFailed('Connection error')
-                return user, None
+                        # concurrent requests with the same token share a single remote call
+                        interaction_user = user_lookups.do(token_user_cache.key(auth), self._fetch_user, auth)
+                    except requests.exceptions.ConnectionError:
+                        # while the remote server is unavailable, known users keep using their last identity
+                        interaction_user = token_user_cache.get(auth, allow_stale=True)
+                        if interaction_user is None:
+                            raise exceptions.AuthenticationFailed('Connection error')
+                request.interaction_user = interaction_user
+                return interaction_user.user, None
             return None
         except ValueError:
             return None
@@ -104,16 +130,14 @@ class ExternViewerSessionAuthentication(authentication.BaseAuthentication):
                 decoded = view_session_bytes.decode('utf-8')
                 user_data = json.loads(decoded)
 
-                user, create = get_user_model().objects.get_or_create(
-                    username=user_data.get('form_data').get('Email'),
-                    email=user_data.get('form_data').get('Email'),
-                )
-                InteractionUser.objects.get_or_create(
-                    user=user,
-                    screen_name=user_data.get('form_data').get('Name'),
-                    type='PARTICIPANT',
-                )
-                return user, None
+                form_data = user_data.get('form_data')
+                interaction_user = sync_interaction_user(username=form_data.get('Email'),
+                                                         email=form_data.get('Email'),
+                                                         screen_name=form_data.get('Name'),
+                                                         user_type='PARTICIPANT',
+                                                         )
+                request.interaction_user = interaction_user
+                return interaction_user.user, None
             return None
         except ValueError:
             return None
@@ -0,0 +1,193 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+DEFAULT_CACHE_TTL = 60  # seconds
+DEFAULT_CACHE_STALE_TTL = 0  # seconds
+DEFAULT_CACHE_MAX_SIZE = 10000
+
+
+class TTLCache:
+    """
+    Thread safe in-memory cache with time-to-live expiration and LRU eviction.
+
+    Attributes:
+        ttl (float): Seconds an entry is considered fresh.
+        stale_ttl (float): Seconds an expired entry is still kept to be served on demand (e.g. when the source of
+            the data is unavailable).
+        max_size (int): Maximum number of entries kept; the least recently used entry is evicted first.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups not found or expired.
+
+    """
+
+    def __init__(self,
+                 ttl: float = DEFAULT_CACHE_TTL,
+                 max_size: int = DEFAULT_CACHE_MAX_SIZE,
+                 stale_ttl: float = DEFAULT_CACHE_STALE_TTL,
+                 ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, allow_stale: bool = False):
+        """
+        Retrieve a value from the cache.
+
+        Args:
+            key: cache key.
+            allow_stale: when True, expired entries still inside the stale window are returned.
+
+        Returns: The cached value or None if not found or expired.
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and entry[0] + self.stale_ttl < now:
+                del self._entries[key]
+                entry = None
+            if entry is None or (entry[0] < now and not allow_stale):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """ Store a value in the cache, evicting the least recently used entries when full. """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key) -> bool:
+        """
+        Remove an entry from the cache.
+
+        Returns: True if the entry was cached, False in other case.
+
+        """
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        """ Remove all entries and reset counters. """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """ Retrieve cache counters for sizing. """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'stale_ttl': self.stale_ttl,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into a single execution.
+
+    The first caller of a key runs the function; callers arriving while it is in flight wait for it and share its
+    result (or its exception). Waiting is thread based, so it works for WSGI threaded workers and for synchronous
+    code run by Django ASGI handler in its worker threads.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Execute function once for all concurrent callers with the same key.
+
+        Args:
+            key: identifier of the call.
+            function: callable to execute.
+
+        Returns: The result of the function.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = self._Call()
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        """ Retrieve the number of calls currently executing. """
+        with self._lock:
+            return len(self._calls)
+
+
+class TokenUserCache(TTLCache):
+    """
+    Cache of authenticated users by the token provided in Authorization header.
+
+    Tokens are hashed before being used as keys, so raw credentials are never kept in memory.
+    """
+
+    @staticmethod
+    def key(token: str) -> str:
+        """ Retrieve the cache key for a token. """
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token: str, allow_stale: bool = False):
+        return super().get(self.key(token), allow_stale=allow_stale)
+
+    def set(self, token: str, value):
+        super().set(self.key(token), value)
+
+    def invalidate(self, token: str) -> bool:
+        return super().invalidate(self.key(token))
+
+
+def _build_token_user_cache() -> TokenUserCache:
+    """ Build the token cache from EXTERN_AUTH_CACHE setting. """
+    config = getattr(settings, 'EXTERN_AUTH_CACHE', {})
+    return TokenUserCache(ttl=config.get('TTL', DEFAULT_CACHE_TTL),
+                          max_size=config.get('MAX_SIZE', DEFAULT_CACHE_MAX_SIZE),
+                          stale_ttl=config.get('STALE_TTL', DEFAULT_CACHE_STALE_TTL),
+                          )
+
+
+token_user_cache = _build_token_user_cache()
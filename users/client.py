@@ -0,0 +1,191 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BACKEND_CONFIG = {
+    'POOL_CONNECTIONS': 4,  # number of hosts with a keep-alive pool
+    'POOL_MAXSIZE': 32,  # connections kept alive per host
+    'CONNECT_TIMEOUT': 3.05,  # seconds
+    'READ_TIMEOUT': 10,  # seconds
+    'MAX_RETRIES': 2,
+    'BACKOFF_FACTOR': 0.2,  # seconds
+    'BACKOFF_MAX': 2,  # seconds
+    'CIRCUIT_FAILURE_THRESHOLD': 5,
+    'CIRCUIT_RESET_TIMEOUT': 30,  # seconds
+}
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class BackendUnavailable(requests.exceptions.ConnectionError):
+    """ Raised when the Watchity backend can not be reached or answers with server errors after retrying. """
+
+
+class CircuitOpen(BackendUnavailable):
+    """ Raised without calling the Watchity backend while it is considered unhealthy. """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to a remote service.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls are rejected during `reset_timeout`
+    seconds. Then one trial call is allowed (half open); its result closes or opens the circuit again.
+
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self) -> bool:
+        """ Check if a call can be done now. Only one trial call is allowed while half open. """
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+
+class WatchityClient:
+    """
+    HTTP client for the Watchity backend.
+
+    Keeps a keep-alive connection pool per worker process, bounds every call with connect and read timeouts,
+    retries idempotent calls with jittered exponential backoff and stops calling the backend while it is unhealthy.
+
+    Attributes:
+        timeout (tuple): Connect and read timeouts in seconds.
+        max_retries (int): Retries after the first attempt.
+        breaker (CircuitBreaker): Circuit breaker shared by every call of the client.
+
+    """
+
+    def __init__(self, config: dict = None):
+        config = {**DEFAULT_BACKEND_CONFIG, **(config or {})}
+        self.pool_connections = config['POOL_CONNECTIONS']
+        self.pool_maxsize = config['POOL_MAXSIZE']
+        self.timeout = (config['CONNECT_TIMEOUT'], config['READ_TIMEOUT'])
+        self.max_retries = config['MAX_RETRIES']
+        self.backoff_factor = config['BACKOFF_FACTOR']
+        self.backoff_max = config['BACKOFF_MAX']
+        self.breaker = CircuitBreaker(failure_threshold=config['CIRCUIT_FAILURE_THRESHOLD'],
+                                      reset_timeout=config['CIRCUIT_RESET_TIMEOUT'],
+                                      )
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+
+    def _get_session(self) -> requests.Session:
+        """ Retrieve the session of current process; pools are never shared with forked workers. """
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._lock:
+                if self._session is None or self._session_pid != pid:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                          pool_maxsize=self.pool_maxsize,
+                                          max_retries=0,
+                                          )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+                    self._session_pid = pid
+        return self._session
+
+    def _backoff(self, attempt: int) -> float:
+        """ Full jitter backoff: random delay between 0 and the exponential cap. """
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+
+    def get(self, url: str, headers: dict = None, params: dict = None) -> requests.Response:
+        """
+        Send a GET request to the backend.
+
+        Args:
+            url: endpoint url.
+            headers: request headers.
+            params: query string parameters.
+
+        Raises:
+            CircuitOpen: when the backend is considered unhealthy and it is not called.
+            BackendUnavailable: when the backend fails after all retries.
+
+        Returns: The backend response (status codes lower than 500).
+
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpen('Watchity backend is unavailable')
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt - 1))
+            try:
+                response = self._get_session().get(url, headers=headers, params=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as exc:
+                error = exc
+                continue
+            if response.status_code in RETRY_STATUS_CODES:
+                error = requests.exceptions.HTTPError('Watchity backend error %s' % response.status_code,
+                                                      response=response,
+                                                      )
+                continue
+            self.breaker.record_success()
+            return response
+        self.breaker.record_failure()
+        raise BackendUnavailable(str(error)) from error
+
+    def close(self):
+        """ Close the keep-alive connections of the current process. """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._session_pid = None
+
+
+def _build_client() -> WatchityClient:
+    """ Build the client from WATCHITY_BACKEND setting. """
+    return WatchityClient(getattr(settings, 'WATCHITY_BACKEND', None))
+
+
+client = _build_client()
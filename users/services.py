@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from users.models import InteractionUser
+
+
+def sync_interaction_user(username: str, email: str, screen_name: str, user_type: str) -> InteractionUser:
+    """
+    Synchronize local users with the profile provided by the external API.
+
+    Only changed columns are written. When the stored profile is up to date the synchronization costs one indexed
+    read and no writes.
+
+    Args:
+        username: username of the user.
+        email: email of the user.
+        screen_name: screen name of the user.
+        user_type: type of interaction user; only used when the interaction user is created.
+
+    Returns: The interaction user, with its user loaded.
+
+    """
+    interaction_user = InteractionUser.objects.select_related('user').filter(user__username=username).first()
+    if interaction_user is not None \
+            and interaction_user.user.email == email \
+            and interaction_user.screen_name == screen_name:
+        return interaction_user
+
+    with transaction.atomic():
+        if interaction_user is None:
+            user, created = get_user_model().objects.get_or_create(username=username, defaults={'email': email})
+            interaction_user, created = InteractionUser.objects.get_or_create(
+                user=user,
+                defaults={'screen_name': screen_name, 'type': user_type},
+            )
+            interaction_user.user = user
+        user = interaction_user.user
+        if user.email != email:
+            get_user_model().objects.filter(pk=user.pk).update(email=email)
+            user.email = email
+        if interaction_user.screen_name != screen_name:
+            InteractionUser.objects.filter(pk=interaction_user.pk).update(screen_name=screen_name)
+            interaction_user.screen_name = screen_name
+    return interaction_user
+
+
+def get_request_interaction_user(request):
+    """
+    Retrieve the interaction user of the user authenticated in a request.
+
+    Authentication classes attach the interaction user to the request; when it is not attached it is resolved once
+    and kept in the request.
+
+    Args:
+        request: request with an authenticated user.
+
+    Returns: The interaction user or None if the request is not authenticated or the user is not an interaction user.
+
+    """
+    if request is None:
+        return None
+    if not hasattr(request, 'interaction_user'):
+        interaction_user = None
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            interaction_user = InteractionUser.objects.select_related('user').filter(user_id=user.id).first()
+        request.interaction_user = interaction_user
+    return request.interaction_user
@@ -1,3 +1,332 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework.exceptions import AuthenticationFailed
+
+from users.authentication import ExternTokenAuthentication
+from users.cache import SingleFlight, TokenUserCache, TTLCache, token_user_cache
+from users.client import BackendUnavailable, CircuitBreaker, CircuitOpen, WatchityClient
+
+CONCURRENT_REQUESTS = 16
+
+
+class StandInBackendHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in of the Watchity backend:
+
+    - /ok answers 200.
+    - /flaky/<n> answers 503 to the first n requests, then 200.
+    - /error answers 500.
+    - /slow answers 200 after half a second.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        status = 200
+        if self.path.startswith('/flaky/'):
+            if self.server.requests.count(self.path) <= int(self.path.rsplit('/', 1)[1]):
+                status = 503
+        elif self.path == '/error':
+            status = 500
+        elif self.path == '/slow':
+            time.sleep(0.5)
+        body = b'{}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInBackend(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients that timed out close their connection before the answer
+        pass
+
+
+class WatchityClientTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StandInBackend(('127.0.0.1', 0), StandInBackendHandler)
+        cls.url = 'http://127.0.0.1:%s' % cls.server.server_address[1]
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.connections = 0
+        self.server.requests = []
+
+    def build_client(self, **config) -> WatchityClient:
+        client = WatchityClient({'BACKOFF_FACTOR': 0, 'READ_TIMEOUT': 2, **config})
+        self.addCleanup(client.close)
+        return client
+
+    def test_connections_are_reused(self):
+        client = self.build_client()
+
+        for _ in range(3):
+            self.assertEqual(client.get(self.url + '/ok').status_code, 200)
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_server_errors_are_retried(self):
+        client = self.build_client(MAX_RETRIES=2)
+
+        self.assertEqual(client.get(self.url + '/flaky/2').status_code, 200)
+        self.assertEqual(self.server.requests, ['/flaky/2'] * 3)
+
+    def test_server_errors_after_retries_raise(self):
+        client = self.build_client(MAX_RETRIES=1)
+
+        with self.assertRaises(BackendUnavailable):
+            client.get(self.url + '/flaky/5')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_read_timeout(self):
+        client = self.build_client(READ_TIMEOUT=0.1, MAX_RETRIES=0)
+
+        started = time.monotonic()
+        with self.assertRaises(BackendUnavailable):
+            client.get(self.url + '/slow')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_circuit_opens_half_opens_and_closes(self):
+        client = self.build_client(MAX_RETRIES=0, CIRCUIT_FAILURE_THRESHOLD=2, CIRCUIT_RESET_TIMEOUT=0.2)
+
+        for _ in range(2):
+            with self.assertRaises(BackendUnavailable):
+                client.get(self.url + '/error')
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpen):
+            client.get(self.url + '/ok')
+        self.assertEqual(len(self.server.requests), 2)
+
+        time.sleep(0.25)
+        self.assertEqual(client.breaker.state, CircuitBreaker.HALF_OPEN)
+        # a failed trial call opens the circuit again
+        with self.assertRaises(BackendUnavailable):
+            client.get(self.url + '/error')
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.25)
+        self.assertEqual(client.get(self.url + '/ok').status_code, 200)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_circuit_allows_one_trial_call(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+
+class TTLCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('users.cache.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_entries_expire_after_ttl(self):
+        cache = TTLCache(ttl=10)
+        cache.set('key', 'value')
+
+        self.now += 9
+        self.assertEqual(cache.get('key'), 'value')
+        self.now += 2
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(max_size=2)
+        cache.set('first', 1)
+        cache.set('second', 2)
+        cache.get('first')
+
+        cache.set('third', 3)
+
+        self.assertEqual((cache.get('first'), cache.get('second'), cache.get('third')), (1, None, 3))
+
+    def test_stale_entries_are_only_served_on_demand(self):
+        cache = TTLCache(ttl=10, stale_ttl=30)
+        cache.set('key', 'value')
+
+        self.now += 20
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.get('key', allow_stale=True), 'value')
+        self.now += 30
+        self.assertIsNone(cache.get('key', allow_stale=True))
+        self.assertEqual(len(cache), 0)
+
+    def test_counters(self):
+        cache = TTLCache(ttl=10, max_size=5)
+        cache.set('key', 'value')
+        cache.get('key')
+        cache.get('key')
+        cache.get('other')
+
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'size': 1, 'max_size': 5, 'ttl': 10, 'stale_ttl': 0})
+        self.assertTrue(cache.invalidate('key'))
+        self.assertFalse(cache.invalidate('key'))
+        cache.clear()
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (0, 0))
+
+    def test_tokens_are_hashed(self):
+        cache = TokenUserCache()
+        cache.set('Token secret', 'user')
+
+        self.assertEqual(cache.get('Token secret'), 'user')
+        self.assertNotIn('Token secret', cache._entries)
+        self.assertTrue(cache.invalidate('Token secret'))
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def call_concurrently(self, function) -> list:
+        single_flight = SingleFlight()
+        barrier = threading.Barrier(CONCURRENT_REQUESTS)
+
+        def call():
+            barrier.wait()
+            try:
+                return single_flight.do('key', function)
+            except Exception as error:
+                return error
+
+        with ThreadPoolExecutor(CONCURRENT_REQUESTS) as executor:
+            results = list(executor.map(lambda _: call(), range(CONCURRENT_REQUESTS)))
+        self.assertEqual(single_flight.in_flight(), 0)
+        return results
+
+    def test_concurrent_calls_run_once(self):
+        calls = []
+
+        def lookup():
+            calls.append(1)
+            time.sleep(0.2)
+            return object()
+
+        results = self.call_concurrently(lookup)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(map(id, results))), 1)
+
+    def test_concurrent_calls_share_the_error(self):
+        calls = []
+
+        def lookup():
+            calls.append(1)
+            time.sleep(0.2)
+            raise ValueError('lookup failed')
+
+        results = self.call_concurrently(lookup)
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+
+def user_data_response() -> requests.Response:
+    """ Build a response of the Watchity backend to a valid token """
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps({'username': 'speaker',
+                                    'email': 'speaker@watchity.invalid',
+                                    'screen_name': 'speaker',
+                                    }).encode()
+    return response
+
+
+class TokenUserCacheAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.auth = 'Token cached'
+        token_user_cache.invalidate(self.auth)
+        self.addCleanup(token_user_cache.invalidate, self.auth)
+        self.request = SimpleNamespace(META={'HTTP_AUTHORIZATION': self.auth})
+
+    def authenticate(self):
+        return ExternTokenAuthentication().authenticate(self.request)[0]
+
+    def test_cache_hit_skips_the_backend_and_the_database(self):
+        with mock.patch('users.authentication.client.get', return_value=user_data_response()) as get:
+            user = self.authenticate()
+            hits = token_user_cache.stats()['hits']
+            with self.assertNumQueries(0):
+                self.assertEqual(self.authenticate(), user)
+
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(token_user_cache.stats()['hits'], hits + 1)
+
+    def test_stale_user_while_the_backend_is_unavailable(self):
+        with mock.patch.object(token_user_cache, 'ttl', -1), mock.patch.object(token_user_cache, 'stale_ttl', 60):
+            with mock.patch('users.authentication.client.get', return_value=user_data_response()):
+                user = self.authenticate()
+            with mock.patch('users.authentication.client.get', side_effect=BackendUnavailable()) as get:
+                self.assertEqual(self.authenticate(), user)
+        self.assertEqual(get.call_count, 1)
+
+    def test_unknown_token_while_the_backend_is_unavailable(self):
+        with mock.patch('users.authentication.client.get', side_effect=BackendUnavailable()):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+
+class ExternTokenAuthenticationTests(TransactionTestCase):
+
+    def setUp(self):
+        self.auth = 'Token single-flight'
+        token_user_cache.invalidate(self.auth)
+        self.addCleanup(token_user_cache.invalidate, self.auth)
+
+    def test_concurrent_requests_with_a_token_call_the_backend_once(self):
+        backend_calls = []
+
+        def get(url, headers=None, params=None):
+            backend_calls.append(headers['Authorization'])
+            time.sleep(0.2)
+            return user_data_response()
+
+        barrier = threading.Barrier(CONCURRENT_REQUESTS)
+
+        def authenticate():
+            barrier.wait()
+            try:
+                request = SimpleNamespace(META={'HTTP_AUTHORIZATION': self.auth})
+                return ExternTokenAuthentication().authenticate(request)[0].pk
+            finally:
+                connection.close()
+
+        with mock.patch('users.authentication.client.get', side_effect=get):
+            with ThreadPoolExecutor(CONCURRENT_REQUESTS) as executor:
+                user_ids = list(executor.map(lambda _: authenticate(), range(CONCURRENT_REQUESTS)))
+
+        self.assertEqual(backend_calls, [self.auth])
+        self.assertEqual(len(set(user_ids)), 1)
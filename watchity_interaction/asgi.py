@@ -3,6 +3,10 @@ ASGI config for watchity_interaction project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Live events of a watchit are streamed as Server-Sent Events at
+``/api/watchit/<watchit_uuid>/playersettings/<playersettings_uuid>/events/``
+(see polls_and_questions.live); they are only available when served through ASGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 """
@@ -13,4 +17,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'watchity_interaction.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from polls_and_questions.live import LiveEventsRouter  # noqa: E402  (needs the apps loaded)
+
+application = LiveEventsRouter(django_application)
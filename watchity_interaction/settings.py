@@ -93,6 +93,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # tests run on a file: threads of the concurrency tests wait for locks of an in-memory database with
+        # shared cache instead of failing with "database table is locked"
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -160,4 +163,51 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10
 }
 
+# Cache of users authenticated by ExternTokenAuthentication
+EXTERN_AUTH_CACHE = {
+    'TTL': 60,  # seconds
+    'STALE_TTL': 600,  # seconds an expired user is still served while Watchity backend is unavailable
+    'MAX_SIZE': 10000,
+}
+
+# HTTP client for Watchity backend calls (see users.client)
+WATCHITY_BACKEND = {
+    'POOL_CONNECTIONS': 4,
+    'POOL_MAXSIZE': 32,
+    'CONNECT_TIMEOUT': 3.05,  # seconds
+    'READ_TIMEOUT': 10,  # seconds
+    'MAX_RETRIES': 2,
+    'BACKOFF_FACTOR': 0.2,  # seconds
+    'BACKOFF_MAX': 2,  # seconds
+    'CIRCUIT_FAILURE_THRESHOLD': 5,
+    'CIRCUIT_RESET_TIMEOUT': 30,  # seconds
+}
+
+# Write-behind ingestion of answers to streaming polls (see polls.ingestion)
+POLL_ANSWER_INGESTION = {
+    'ENABLED': False,
+    'MAX_QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 0.5,  # seconds
+    'PUT_TIMEOUT': 0.05,  # seconds
+}
 
+# Server-Sent Events streams of live changes of watchits (see polls_and_questions.live)
+LIVE_EVENTS = {
+    'POLL_INTERVAL': 1,  # seconds
+    'HEARTBEAT_INTERVAL': 15,  # seconds
+    'SUBSCRIBER_QUEUE_SIZE': 100,
+}
+
+# Cache of event configurations by watchit (see polls_and_questions.cache)
+EVENT_CONFIG_CACHE = {
+    'TTL': 60,  # seconds
+    'MAX_SIZE': 1000,
+    'SHARED_CACHE': None,  # alias of a cache in CACHES shared by all processes
+    'SHARED_TTL': 300,  # seconds
+}
+
+# Full-text search of questions and answers (see polls_and_questions.search)
+SEARCH = {
+    'BACKEND': None,  # None: SQLite FTS5 on SQLite, LIKE queries on other databases
+}